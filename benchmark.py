@@ -0,0 +1,296 @@
+# --- Benchmarks dos caminhos críticos de armazenamento e agendamento ---
+#
+# Roda sem rede: usa um PostgreSQL local (BENCH_DATABASE_URL) e um bot falso no lugar
+# do Telegram. Para cada combinação de N posts e M inscritos, popula um schema
+# separado e mede o tick do job_send_post, /verificar, /gerar_lista_links, /ver_lista,
+# a leitura de inscritos de um broadcast, o /importar de N posts, a gravação em lote
+# dos envios por variante, o salvamento de um post com a checagem de quase duplicados,
+# o /duplicados e o /buscar. Os resultados saem em JSON, para comparar
+# cada mudança no bot.py com uma execução de referência (--comparar).
+#
+# Exemplo:
+#   BENCH_DATABASE_URL=postgresql://localhost/bot_bench \
+#   python benchmark.py --posts 1000,10000,100000 --inscritos 1000,50000 --saida atual.json --comparar base.json
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from types import SimpleNamespace
+
+import psycopg2
+from psycopg2.extensions import make_dsn
+
+BENCH_SCHEMA = 'bot_bench'
+ADMIN_ID = 1
+GRUPO_ID = -1000000000000
+
+
+def preparar_ambiente(database_url: str, schema: str = BENCH_SCHEMA, **extras):
+    """ Configura as variáveis lidas pelo bot.py na importação e aponta o pool para um schema separado. """
+    with psycopg2.connect(database_url) as conn, conn.cursor() as cursor:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': os.environ.get('TELEGRAM_BOT_TOKEN', '0:benchmark'),
+        'ADMIN_IDS': str(ADMIN_ID),
+        'DATABASE_URL': make_dsn(database_url, options=f'-csearch_path={schema}'),
+        **extras,
+    })
+
+
+# --- Telegram falso (sem rede) ---
+class BotFalso:
+    """ Responde na hora a todos os métodos usados pelos handlers medidos. """
+    def __init__(self):
+        self.chamadas = 0
+        self.username = 'bot_benchmark'
+
+    async def _responder(self, *args, **kwargs):
+        self.chamadas += 1
+        return SimpleNamespace(message_id=self.chamadas)
+
+    send_message = send_photo = send_media_group = send_document = forward_message = _responder
+    edit_message_text = copy_message = _responder
+
+
+class MensagemFalsa:
+    def __init__(self, bot, texto=''):
+        self.bot, self.text, self.caption = bot, texto, None
+        self.chat_id, self.message_id = ADMIN_ID, 1
+
+    async def reply_text(self, *args, **kwargs):
+        return await self.bot.send_message(ADMIN_ID, *args, **kwargs)
+
+    async def reply_document(self, *args, **kwargs):
+        return await self.bot.send_document(ADMIN_ID, *args, **kwargs)
+
+
+def update_falso(bot, texto=''):
+    chat = SimpleNamespace(id=ADMIN_ID, send_message=bot.send_message)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=ADMIN_ID), effective_chat=chat,
+                           message=MensagemFalsa(bot, texto), callback_query=None)
+
+
+def contexto_falso(bot, args=()):
+    return SimpleNamespace(bot=bot, args=list(args), bot_data={}, user_data={}, job=None,
+                           application=SimpleNamespace(create_task=asyncio.ensure_future))
+
+
+# --- População dos dados ---
+def popular(bot_mod, posts: int, inscritos: int):
+    """ Recria as tabelas do bot no schema do benchmark com N posts (1/3 com variante B), M inscritos e um grupo. """
+    def _popular(cursor):
+        cursor.execute('TRUNCATE postagens, inscritos, broadcasts, grupos RESTART IDENTITY CASCADE')
+        # Metade dos links se repete entre posts, como num catálogo real
+        parametros = {'posts': posts, 'links': max(posts // 2, 1)}
+        cursor.execute('INSERT INTO postagens (midia_ids) SELECT NULL FROM generate_series(1, %(posts)s)', parametros)
+        cursor.execute('''
+            INSERT INTO variantes (post_id, ordem, texto)
+            SELECT id, 0, 'Post ' || id || E' com bônus\\n🏠https://site' || (id %% %(links)s) || '.com/promo' FROM postagens
+            UNION ALL
+            SELECT id, 1, 'Versão B do post ' || id FROM postagens WHERE id %% 3 = 0
+        ''', parametros)
+        cursor.execute('SELECT post_id, ordem, texto FROM variantes')
+        bot_mod._gravar_impressoes(cursor, [(post_id, ordem, *impressao) for post_id, ordem, texto in cursor.fetchall()
+                                            if (impressao := bot_mod.impressao_digital(texto))])
+        cursor.execute('''
+            INSERT INTO post_links (post_id, link)
+            SELECT id, 'https://site' || (id %% %(links)s) || '.com/promo' FROM postagens
+        ''', parametros)
+        cursor.execute('INSERT INTO inscritos (user_id) SELECT g FROM generate_series(1, %s) g', (inscritos,))
+        bot_mod._adicionar_grupo(cursor, GRUPO_ID, 'Grupo do benchmark')
+        cursor.execute('ANALYZE postagens')
+        cursor.execute('ANALYZE variantes')
+        cursor.execute('ANALYZE impressoes')
+        cursor.execute('ANALYZE post_links')
+        cursor.execute('ANALYZE inscritos')
+        cursor.execute('ANALYZE grupo_rotacao')
+    bot_mod.db_run_sync(_popular)
+
+
+# --- Casos medidos ---
+def casos(bot_mod, posts: int):
+    bot = BotFalso()
+    link_existente = f"https://site{max(posts // 2, 1) - 1}.com/promo" if posts > 1 else "https://site0.com/promo"
+    arquivo_importacao = "\n".join(json.dumps({'variantes': [f"Post importado {i}\n🏠https://importado{i}.com/promo"]},
+                                               ensure_ascii=False)
+                                    for i in range(posts)).encode()
+
+    async def tick_job_send_post():
+        await bot_mod.enviar_proxima_postagem(contexto_falso(bot), GRUPO_ID)
+
+    async def verificar_links():
+        await bot_mod.verificar_links(update_falso(bot, f"/verificar {link_existente} https://nao-existe.com"), contexto_falso(bot))
+
+    async def gerar_lista_links():
+        await bot_mod.gerar_lista_links(update_falso(bot), contexto_falso(bot))
+
+    async def gerar_lista_links_arquivo():
+        await bot_mod.gerar_lista_links(update_falso(bot), contexto_falso(bot, ['arquivo']))
+
+    async def ver_lista_primeira_pagina():
+        await bot_mod.ver_lista(update_falso(bot), contexto_falso(bot))
+
+    async def ver_lista_pagina_do_meio():
+        await bot_mod.db_run(bot_mod._pagina_postagens, posts // 2)
+
+    async def inscritos_de_um_broadcast():
+        broadcast_id, _ = await bot_mod.db_run(bot_mod._criar_broadcast, ADMIN_ID, ADMIN_ID, 1)
+        if broadcast_id is None: return
+        while (await bot_mod.db_run(bot_mod._reservar_lote, broadcast_id, bot_mod.BROADCAST_LOTE))[0]:
+            pass
+        await bot_mod.db_execute('DELETE FROM broadcasts WHERE id = %s', (broadcast_id,))
+
+    async def importar_postagens():
+        """ Leitura e validação do JSONL com N posts e gravação numa transação; depois apaga os importados. """
+        ultimo_id = (await bot_mod.db_fetchone('SELECT COALESCE(MAX(id), 0) FROM postagens'))[0]
+        lidos, _ = await asyncio.to_thread(bot_mod._ler_importacao, arquivo_importacao, 'jsonl')
+        await bot_mod.db_run(bot_mod._importar_postagens, lidos)
+        await bot_mod.db_execute('DELETE FROM postagens WHERE id > %s', (ultimo_id,))
+
+    async def salvar_postagem():
+        """ Um post novo com a checagem de quase duplicados; depois é apagado. """
+        post_id, _ = await bot_mod.db_run(bot_mod._salvar_postagem, ["Post 7 com bônus\n🏠https://site7.com/promo hoje"])
+        await bot_mod.db_execute('DELETE FROM postagens WHERE id = %s', (post_id,))
+
+    async def duplicados():
+        await bot_mod.db_run(bot_mod._relatorio_duplicados)
+
+    async def buscar_termo_comum():
+        """ Primeira página do /buscar com um termo presente em todos os N posts (ordena todos por relevância). """
+        await bot_mod.buscar(update_falso(bot), contexto_falso(bot, ['bônus']))
+
+    async def buscar_termo_raro():
+        await bot_mod.buscar(update_falso(bot), contexto_falso(bot, [link_existente.split('/')[2]]))
+
+    async def gravar_envios_variantes():
+        """ Gravação em lote de um envio contado para cada variante A dos N posts. """
+        bot_mod._envios_variantes.update({(post_id, 0): 1 for post_id in range(1, posts + 1)})
+        await bot_mod.gravar_envios_variantes()
+
+    return {
+        'job_send_post_tick': tick_job_send_post,
+        'verificar_links': verificar_links,
+        'gerar_lista_links': gerar_lista_links,
+        'gerar_lista_links_arquivo': gerar_lista_links_arquivo,
+        'ver_lista_primeira_pagina': ver_lista_primeira_pagina,
+        'ver_lista_pagina_do_meio': ver_lista_pagina_do_meio,
+        'inscritos_de_um_broadcast': inscritos_de_um_broadcast,
+        'importar_postagens': importar_postagens,
+        'gravar_envios_variantes': gravar_envios_variantes,
+        'salvar_postagem': salvar_postagem,
+        'duplicados': duplicados,
+        'buscar_termo_comum': buscar_termo_comum,
+        'buscar_termo_raro': buscar_termo_raro,
+    }
+
+
+async def medir(funcao, repeticoes: int, aquecimento: int = 2) -> dict:
+    for _ in range(aquecimento):
+        await funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        await funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        'repeticoes': repeticoes,
+        'media_ms': round(statistics.fmean(tempos), 3),
+        'p50_ms': round(tempos[len(tempos) // 2], 3),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+        'min_ms': round(tempos[0], 3),
+        'max_ms': round(tempos[-1], 3),
+    }
+
+
+def metadados(bot_mod, args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    def _versao(cursor):
+        cursor.execute('SHOW server_version')
+        return cursor.fetchone()[0]
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'postgres': bot_mod.db_run_sync(_versao),
+        'repeticoes': args.repeticoes,
+        'db_pool_max': bot_mod.DB_POOL_MAX,
+    }
+
+
+def comparar(atual: dict, referencia_path: str):
+    """ Imprime a variação do p50 de cada caso em relação a uma execução anterior. """
+    with open(referencia_path, encoding='utf-8') as f:
+        referencia = json.load(f)
+    base = {(r['posts'], r['inscritos'], r['caso']): r for r in referencia['resultados']}
+    print(f"\nComparação com {referencia_path} (commit {referencia['meta'].get('commit')}):")
+    for r in atual['resultados']:
+        anterior = base.get((r['posts'], r['inscritos'], r['caso']))
+        if not anterior: continue
+        variacao = (r['p50_ms'] - anterior['p50_ms']) / anterior['p50_ms'] * 100 if anterior['p50_ms'] else 0.0
+        print(f"  N={r['posts']:>7} M={r['inscritos']:>7} {r['caso']:<28} "
+              f"{anterior['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms ({variacao:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks offline do bot.py')
+    parser.add_argument('--posts', default='1000,10000', help='Quantidades de posts (N), separadas por vírgula')
+    parser.add_argument('--inscritos', default='1000,10000', help='Quantidades de inscritos (M), separadas por vírgula')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--casos', default='', help='Roda só estes casos (separados por vírgula)')
+    parser.add_argument('--saida', default='bench_resultados.json')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--manter-schema', action='store_true', help=f'Não apaga o schema {BENCH_SCHEMA} ao final')
+    args = parser.parse_args()
+
+    database_url = os.environ.get('BENCH_DATABASE_URL')
+    if not database_url:
+        sys.exit("Defina BENCH_DATABASE_URL com um PostgreSQL local (o schema bot_bench será criado e apagado).")
+    # O tick do job_send_post mede o caminho no banco, não o limite de mensagens por grupo
+    preparar_ambiente(database_url, GRUPO_MSGS_POR_MINUTO='1000000')
+
+    import bot as bot_mod
+    import logging
+    logging.getLogger('bot').setLevel(logging.WARNING)
+    bot_mod.montar_convites('bot_benchmark')
+    bot_mod.init_db_pool()
+    bot_mod.init_db()
+
+    filtro = {c for c in args.casos.split(',') if c}
+    resultado = {'meta': metadados(bot_mod, args), 'resultados': []}
+    try:
+        for posts in [int(n) for n in args.posts.split(',')]:
+            for inscritos in [int(m) for m in args.inscritos.split(',')]:
+                inicio = time.perf_counter()
+                popular(bot_mod, posts, inscritos)
+                print(f"N={posts} M={inscritos}: dados populados em {time.perf_counter() - inicio:.1f}s")
+                for nome, funcao in casos(bot_mod, posts).items():
+                    if filtro and nome not in filtro: continue
+                    medida = asyncio.run(medir(funcao, args.repeticoes))
+                    resultado['resultados'].append({'posts': posts, 'inscritos': inscritos, 'caso': nome, **medida})
+                    print(f"  {nome:<28} p50 {medida['p50_ms']:>9.2f} ms   p95 {medida['p95_ms']:>9.2f} ms")
+    finally:
+        if not args.manter_schema:
+            bot_mod.db_run_sync(lambda cursor: cursor.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE'))
+        bot_mod.close_db_pool()
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {args.saida}")
+    if args.comparar:
+        comparar(resultado, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,123 @@
 # --- CÓDIGO COMPLETO E REVISADO ---
 
 import os
+import json
 import logging
 from datetime import datetime
 import asyncio
-import random
 import re
-from telegram import Update, BotCommand, BotCommandScopeChat, InlineKeyboardButton, InlineKeyboardMarkup
+import functools
+import threading
+import tempfile
+import csv
+import io
+import time
+import random
+import heapq
+import itertools
+import hashlib
+import struct
+import unicodedata
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlsplit, urlunsplit
+import httpx
+from telegram import Update, BotCommand, BotCommandScopeChat, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.helpers import escape_markdown
-from telegram.error import Forbidden, BadRequest
+from telegram.request import HTTPXRequest
+from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    BasePersistence,
+    BaseRateLimiter,
+    PersistenceInput,
     filters,
     ContextTypes
 )
 # Importação para o banco de dados PostgreSQL
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values, Json
+from psycopg2.extensions import cursor as PgCursor
 
 # --- Configurações do Bot e Chaves (lidas das Variáveis de Ambiente) ---
 try:
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
     ADMIN_IDS_STR = os.environ.get('ADMIN_IDS', '')
     ADMIN_IDS = [int(admin_id) for admin_id in ADMIN_IDS_STR.split(',') if admin_id]
-    GRUPO_ID = int(os.environ.get('GRUPO_ID'))
+    # Grupo único das versões antigas: só é usado para cadastrar o primeiro grupo na migração 9
+    GRUPO_ID = int(os.environ['GRUPO_ID']) if os.environ.get('GRUPO_ID') else None
     DATABASE_URL = os.environ.get('DATABASE_URL')
+    # Servidor do Bot API (padrão: api.telegram.org); útil para um Bot API local ou de testes
+    TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', '').rstrip('/')
+    # Tamanho do pool de conexões com o PostgreSQL
+    DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+    DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+    # Fila de envios: mensagens/s do bot inteiro (dividido entre as réplicas) e tentativas
+    # de cada envio antes de ir para envios_falhos (BROADCAST_MAX_TENTATIVAS é o nome antigo)
+    ENVIOS_POR_SEGUNDO = float(os.environ.get('ENVIOS_POR_SEGUNDO', '30'))
+    ENVIO_MAX_TENTATIVAS = int(os.environ.get('ENVIO_MAX_TENTATIVAS', os.environ.get('BROADCAST_MAX_TENTATIVAS', '3')))
+    # Limites do broadcast: a parte da taxa global que ele pode usar (o resto fica para os demais envios)
+    BROADCAST_TAXA = float(os.environ.get('BROADCAST_TAXA', '25'))
+    BROADCAST_CONCORRENCIA = int(os.environ.get('BROADCAST_CONCORRENCIA', '20'))
+    # Destinatários reservados por checkpoint, tentativas de gravar cada checkpoint e frequência de atualização do progresso
+    BROADCAST_LOTE = int(os.environ.get('BROADCAST_LOTE', '500'))
+    BROADCAST_CHECKPOINT_TENTATIVAS = int(os.environ.get('BROADCAST_CHECKPOINT_TENTATIVAS', '3'))
+    BROADCAST_PROGRESSO_INTERVALO = float(os.environ.get('BROADCAST_PROGRESSO_INTERVALO', '5'))
+    # Inscritos que bloquearam o bot são removidos em lote a partir deste tamanho
+    BROADCAST_PODA_LOTE = int(os.environ.get('BROADCAST_PODA_LOTE', '200'))
+    # Boas-vindas agrupadas: janela (s) por grupo e máximo de menções por mensagem
+    BOAS_VINDAS_JANELA = float(os.environ.get('BOAS_VINDAS_JANELA', '10'))
+    BOAS_VINDAS_MAX_MENCOES = int(os.environ.get('BOAS_VINDAS_MAX_MENCOES', '30'))
+    # Tamanho máximo do arquivo do /importar (o Bot API só baixa arquivos de até 20 MB)
+    IMPORTAR_MAX_BYTES = int(os.environ.get('IMPORTAR_MAX_BYTES', str(20 * 1024 * 1024)))
+    # Variantes: máximo por post (até 26, de A a Z) e intervalo (s) entre as gravações dos contadores de envio
+    VARIANTES_MAX = min(int(os.environ.get('VARIANTES_MAX', '10')), 26)
+    VARIANTES_GRAVAR_INTERVALO = float(os.environ.get('VARIANTES_GRAVAR_INTERVALO', '60'))
+    # Quase duplicados: similaridade estimada (0 a 1) a partir da qual um post é sinalizado
+    DUPLICADOS_LIMIAR = float(os.environ.get('DUPLICADOS_LIMIAR', '0.8'))
+    # Posts por página no /ver_lista
+    LISTA_PAGINA = int(os.environ.get('LISTA_PAGINA', '20'))
+    # Resultados por página no /buscar
+    BUSCA_PAGINA = int(os.environ.get('BUSCA_PAGINA', '10'))
+    # Espera (s) pelas demais partes de um álbum antes de salvá-lo
+    ALBUM_ESPERA = float(os.environ.get('ALBUM_ESPERA', '2'))
+    # Porta do endpoint de métricas no formato Prometheus (0 desativa)
+    METRICAS_HOST = os.environ.get('METRICAS_HOST', '127.0.0.1')
+    METRICAS_PORTA = int(os.environ.get('METRICAS_PORTA', '0'))
+    # Agendador dos grupos: a cada quantos segundos procura envios vencidos e quantos grupos posta ao mesmo tempo
+    AGENDADOR_TICK = float(os.environ.get('AGENDADOR_TICK', '5'))
+    GRUPOS_CONCORRENCIA = int(os.environ.get('GRUPOS_CONCORRENCIA', '5'))
+    # Mensagens por minuto em cada grupo (o Telegram aceita ~20)
+    GRUPO_MSGS_POR_MINUTO = float(os.environ.get('GRUPO_MSGS_POR_MINUTO', '20'))
+    # Mensagens por segundo em cada chat privado (o Telegram pede no máximo ~1)
+    CHAT_MSGS_POR_SEGUNDO = float(os.environ.get('CHAT_MSGS_POR_SEGUNDO', '1'))
+    # Réplicas: a cada quantos segundos cada uma tenta assumir a liderança (ou confirma que segue líder)
+    # e procura broadcasts abertos para ajudar a enviar
+    LIDER_INTERVALO = float(os.environ.get('LIDER_INTERVALO', '5'))
+    BROADCAST_VERIFICAR = float(os.environ.get('BROADCAST_VERIFICAR', '5'))
+    # Intervalo (s) entre as gravações de bot_data, user_data e conversas no banco
+    PERSISTENCIA_INTERVALO = float(os.environ.get('PERSISTENCIA_INTERVALO', '60'))
+    # Modo de recebimento dos updates: 'polling' (padrão) ou 'webhook'
+    BOT_MODO = os.environ.get('BOT_MODO', 'polling').strip().lower()
+    # Webhook: URL pública registrada no Telegram e servidor HTTP local que a atende
+    WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '').rstrip('/')
+    WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORTA = int(os.environ.get('WEBHOOK_PORTA', '8443'))
+    WEBHOOK_CAMINHO = os.environ.get('WEBHOOK_CAMINHO', 'webhook').strip('/')
+    WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+    # Tipos de update pedidos ao Telegram: só os que os handlers tratam
+    ALLOWED_UPDATES = [t.strip() for t in os.environ.get('ALLOWED_UPDATES', 'message,callback_query').split(',') if t.strip()]
+    if BOT_MODO not in ('polling', 'webhook'):
+        raise ValueError(f"BOT_MODO inválido: {BOT_MODO} (use 'polling' ou 'webhook')")
+    if BOT_MODO == 'webhook' and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        raise ValueError("no modo webhook, WEBHOOK_URL e WEBHOOK_SECRET são obrigatórios")
 except (ValueError, TypeError) as e:
     print(f"ERRO: Verifique se as variáveis de ambiente estão configuradas corretamente. Erro: {e}")
     exit()
@@ -36,6 +126,168 @@ except (ValueError, TypeError) as e:
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- Métricas (formato de exposição do Prometheus) ---
+# Contadores e histogramas simples, sem dependências externas. São atualizados também
+# pelas threads do banco, por isso tudo passa pelo mesmo lock.
+_metricas = []
+_metricas_lock = threading.Lock()
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.valores = {}
+        _metricas.append(self)
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos.get(r, '')) for r in self.rotulos)
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with _metricas_lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def amostras(self):
+        for chave, valor in self.valores.items():
+            yield self.nome, dict(zip(self.rotulos, chave)), valor
+
+class Gauge(Contador):
+    tipo = 'gauge'
+
+    def set(self, valor, **rotulos):
+        with _metricas_lock:
+            self.valores[self._chave(rotulos)] = valor
+
+class Histograma(Contador):
+    tipo = 'histogram'
+    LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def observe(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with _metricas_lock:
+            contagens, soma, total = self.valores.get(chave, ([0] * len(self.LIMITES), 0.0, 0))
+            contagens = [c + (valor <= limite) for c, limite in zip(contagens, self.LIMITES)]
+            self.valores[chave] = (contagens, soma + valor, total + 1)
+
+    @contextmanager
+    def medir(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **rotulos)
+
+    def amostras(self):
+        for chave, (contagens, soma, total) in self.valores.items():
+            rotulos = dict(zip(self.rotulos, chave))
+            for limite, contagem in zip(self.LIMITES, contagens):
+                yield f"{self.nome}_bucket", {**rotulos, 'le': str(limite)}, contagem
+            yield f"{self.nome}_bucket", {**rotulos, 'le': '+Inf'}, total
+            yield f"{self.nome}_sum", rotulos, soma
+            yield f"{self.nome}_count", rotulos, total
+
+def exportar_metricas() -> str:
+    linhas = []
+    with _metricas_lock:
+        for metrica in _metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for nome, rotulos, valor in metrica.amostras():
+                texto_rotulos = ",".join(f'{k}="{v}"' for k, v in rotulos.items())
+                linhas.append(f"{nome}{{{texto_rotulos}}} {valor}" if texto_rotulos else f"{nome} {valor}")
+    return "\n".join(linhas) + "\n"
+
+METRICA_DB_QUERY = Histograma('bot_db_query_seconds', 'Duração das consultas ao PostgreSQL.', ['operacao'])
+METRICA_DB_ERROS = Contador('bot_db_query_erros_total', 'Consultas ao PostgreSQL que falharam.', ['operacao'])
+METRICA_DB_POOL_ESPERA = Histograma('bot_db_pool_espera_seconds', 'Espera por uma conexão livre no pool.')
+METRICA_DB_POOL_EM_USO = Gauge('bot_db_pool_conexoes_em_uso', 'Conexões emprestadas do pool.')
+METRICA_DB_POOL_MAX = Gauge('bot_db_pool_conexoes_max', 'Tamanho máximo do pool de conexões.')
+METRICA_API = Histograma('bot_api_request_seconds', 'Duração das chamadas ao Bot API.', ['metodo'])
+METRICA_API_TOTAL = Contador('bot_api_requests_total', 'Chamadas ao Bot API por resultado (código HTTP ou erro).', ['metodo', 'resultado'])
+METRICA_HANDLER = Histograma('bot_handler_seconds', 'Duração de cada handler.', ['handler'])
+METRICA_HANDLER_ERROS = Contador('bot_handler_erros_total', 'Handlers que terminaram com exceção.', ['handler'])
+METRICA_BROADCAST = Contador('bot_broadcast_envios_total', 'Envios de broadcast por resultado.', ['resultado'])
+METRICA_JOB_ATRASO = Histograma('bot_job_send_post_atraso_seconds', 'Atraso de cada post agendado em relação ao horário previsto do grupo.')
+METRICA_LIDER = Gauge('bot_replica_lider', 'Se esta réplica é a líder (roda o agendador dos grupos).')
+METRICA_ENVIOS_FILA = Gauge('bot_envios_na_fila', 'Envios esperando a vez na fila, por prioridade.', ['prioridade'])
+METRICA_ENVIOS_FALHOS = Contador('bot_envios_falhos_total', 'Envios que esgotaram as tentativas (gravados em envios_falhos).', ['prioridade'])
+METRICA_JOB_ENVIOS = Contador('bot_job_send_post_total', 'Posts agendados por resultado.', ['resultado'])
+
+class CursorMedido(PgCursor):
+    """ Cursor do psycopg2 que registra a duração de cada execute() por tipo de operação. """
+    def execute(self, query, vars=None):
+        texto = query.decode() if isinstance(query, bytes) else str(query)
+        palavras = texto.split(None, 1)
+        operacao = palavras[0].upper() if palavras else '?'
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            METRICA_DB_ERROS.inc(operacao=operacao)
+            raise
+        finally:
+            METRICA_DB_QUERY.observe(time.perf_counter() - inicio, operacao=operacao)
+
+class RequestMedido(HTTPXRequest):
+    """ HTTPXRequest que mede cada chamada ao Bot API pelo nome do método. """
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        # Downloads (/file/bot<token>/<caminho>) teriam um rótulo por arquivo: ficam todos em 'download'
+        metodo = 'download' if '/file/bot' in url else url.rsplit('/', 1)[-1]
+        inicio = time.perf_counter()
+        resultado = 'erro'
+        try:
+            codigo, corpo = await super().do_request(url, method, request_data, *args, **kwargs)
+            resultado = str(codigo)
+            return codigo, corpo
+        finally:
+            METRICA_API.observe(time.perf_counter() - inicio, metodo=metodo)
+            METRICA_API_TOTAL.inc(metodo=metodo, resultado=resultado)
+
+def medir_handler(callback):
+    """ Envolve um callback de handler registrando duração e exceções. """
+    nome = getattr(callback, '__name__', repr(callback))
+
+    @functools.wraps(callback)
+    async def envolvido(update, context):
+        inicio = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            METRICA_HANDLER_ERROS.inc(handler=nome)
+            raise
+        finally:
+            METRICA_HANDLER.observe(time.perf_counter() - inicio, handler=nome)
+    return envolvido
+
+def instrumentar_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            aninhados = handler.entry_points + handler.fallbacks + [h for hs in handler.states.values() for h in hs]
+            instrumentar_handlers(aninhados)
+        else:
+            handler.callback = medir_handler(handler.callback)
+
+async def _responder_metricas(reader, writer):
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        corpo = exportar_metricas().encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     + f"Content-Length: {len(corpo)}\r\nConnection: close\r\n\r\n".encode() + corpo)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+servidor_metricas = None
+
+async def iniciar_servidor_metricas():
+    """ Sobe o endpoint HTTP de métricas (qualquer caminho responde com a exposição). """
+    servidor = await asyncio.start_server(_responder_metricas, METRICAS_HOST, METRICAS_PORTA)
+    logger.info(f"Métricas disponíveis em http://{METRICAS_HOST}:{METRICAS_PORTA}/metrics")
+    return servidor
+
 # --- Definição dos estados das conversas ---
 # Para /criar
 (LINK, BONUS, ROLLOVER, MIN_SAQUE, GET_TEXT_A,
@@ -47,49 +299,896 @@ SELECTING_POST, ACTION_POST = range(9, 11)
 
 
 # --- Funções do Banco de Dados ---
-def db_connect():
-    """ Conecta ao banco de dados PostgreSQL usando a DATABASE_URL. """
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
+# As consultas rodam num executor com o mesmo número de threads que o pool de
+# conexões, então o event loop nunca bloqueia esperando o banco. Quem não acha
+# conexão livre (ex.: uma está presa numa db_transacao) espera na própria thread.
+db_pool = None
+db_executor = None
+
+class PoolBloqueante(pg_pool.ThreadedConnectionPool):
+    """ ThreadedConnectionPool que espera por uma conexão livre em vez de lançar PoolError. """
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._livres = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        with METRICA_DB_POOL_ESPERA.medir():
+            self._livres.acquire()
+        try:
+            conn = super().getconn(key)
+        except Exception:
+            self._livres.release()
+            raise
+        METRICA_DB_POOL_EM_USO.set(len(self._used))
         return conn
-    except Exception as e:
-        logger.error(f"Erro ao conectar ao PostgreSQL: {e}")
-        return None
 
-def init_db():
-    """ Inicializa as tabelas no banco de dados PostgreSQL se não existirem. """
-    conn = db_connect()
-    if not conn: 
-        logger.critical("Não foi possível conectar ao banco de dados para inicialização.")
-        return
-    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._livres.release()
+            METRICA_DB_POOL_EM_USO.set(len(self._used))
+
+def init_db_pool():
+    """ Cria (uma única vez) o pool de conexões e o executor das consultas. """
+    global db_pool, db_executor
+    if db_pool is None:
+        db_pool = PoolBloqueante(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL, cursor_factory=CursorMedido)
+        METRICA_DB_POOL_MAX.set(DB_POOL_MAX)
+        db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix='db')
+        logger.info(f"Pool de conexões criado ({DB_POOL_MIN}-{DB_POOL_MAX} conexões).")
+    return db_pool
+
+def close_db_pool():
+    """ Fecha o executor e todas as conexões do pool. """
+    global db_pool, db_executor
+    if db_executor:
+        db_executor.shutdown(wait=True)
+        db_executor = None
+    if db_pool:
+        db_pool.closeall()
+        db_pool = None
+
+@contextmanager
+def db_connection():
+    """ Empresta uma conexão do pool, com commit no final ou rollback em caso de erro. """
+    pool = init_db_pool()
+    conn = pool.getconn()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS postagens (
-                    id SERIAL PRIMARY KEY,
-                    texto_a TEXT NOT NULL,
-                    texto_b TEXT,
-                    last_sent TEXT DEFAULT 'B',
-                    photo_file_ids TEXT,
-                    data_adicao TEXT NOT NULL
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS inscritos (
-                    user_id BIGINT PRIMARY KEY,
-                    data_inscricao TEXT NOT NULL
-                )
-            ''')
+        yield conn
         conn.commit()
-        logger.info("Banco de dados PostgreSQL verificado/inicializado.")
-    except Exception as e:
-        logger.error(f"Erro ao inicializar tabelas: {e}")
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
     finally:
-        if conn: conn.close()
+        # Conexões quebradas (queda do servidor, timeout) são descartadas do pool
+        pool.putconn(conn, close=bool(conn.closed))
+
+def db_run_sync(func, *args):
+    """ Executa func(cursor, *args) numa transação. Bloqueante: use db_run nos handlers. """
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            return func(cursor, *args)
+
+async def db_run(func, *args):
+    """ Executa func(cursor, *args) numa transação, fora do event loop. """
+    init_db_pool()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(db_run_sync, func, *args))
+
+class TransacaoAsync:
+    """ Conexão reservada por db_transacao; cada run() executa func(cursor, *args) nela. """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _run_sync(self, func, *args):
+        with self.conn.cursor() as cursor:
+            return func(cursor, *args)
+
+    async def run(self, func, *args):
+        # Executor padrão, não o db_executor: as threads dele podem estar todas
+        # esperando justamente pela conexão que esta transação segura.
+        return await asyncio.to_thread(self._run_sync, func, *args)
+
+@asynccontextmanager
+async def db_transacao():
+    """
+    Transação que atravessa awaits (ex.: um envio ao Telegram): o commit só acontece
+    se o bloco terminar sem erro; qualquer exceção desfaz tudo.
+    """
+    pool = init_db_pool()
+    conn = await asyncio.to_thread(pool.getconn)
+    try:
+        yield TransacaoAsync(conn)
+        await asyncio.to_thread(conn.commit)
+    except BaseException:
+        if not conn.closed:
+            try:
+                await asyncio.to_thread(conn.rollback)
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def _execute(cursor, sql, params):
+    cursor.execute(sql, params)
+    return cursor.rowcount
+
+def _fetchone(cursor, sql, params):
+    cursor.execute(sql, params)
+    return cursor.fetchone()
+
+def _fetchall(cursor, sql, params):
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+async def db_execute(sql, params=None) -> int:
+    """ Executa um comando e retorna o número de linhas afetadas. """
+    return await db_run(_execute, sql, params)
+
+async def db_fetchone(sql, params=None):
+    return await db_run(_fetchone, sql, params)
+
+async def db_fetchall(sql, params=None):
+    return await db_run(_fetchall, sql, params)
+
+# --- Catálogo de Links ---
+# Os links de cada post são extraídos ao salvar e ficam na tabela post_links,
+# indexada por link; /verificar e /gerar_lista_links não varrem mais os textos.
+# O /verificar acha um link também como trecho de outro, como na busca nos textos.
+URL_PATTERN = re.compile(r'https?://[^\s]+')
+
+def normalizar_link(link: str) -> str:
+    """ Remove pontuação final e barra do caminho e padroniza esquema/domínio em minúsculas. """
+    partes = urlsplit(link.rstrip('.,;:!?)]}>"\''))
+    return urlunsplit((partes.scheme.lower(), partes.netloc.lower(), partes.path.rstrip('/'), partes.query, partes.fragment))
+
+def extrair_links(*textos) -> list:
+    """ Links normalizados e sem repetição, na ordem em que aparecem nos textos. """
+    links = [normalizar_link(link) for texto in textos if texto for link in URL_PATTERN.findall(texto)]
+    return list(dict.fromkeys(links))
+
+def link_valido(link: str) -> bool:
+    """ Link normalizado com esquema http(s) e um domínio com ponto (ou um IP). """
+    try:
+        partes = urlsplit(link)
+        host = partes.hostname
+    except ValueError:
+        return False
+    return partes.scheme in ('http', 'https') and bool(host) and ('.' in host or ':' in host)
+
+def _indexar_links(cursor, post_id, *textos):
+    links = extrair_links(*textos)
+    if links:
+        execute_values(cursor, 'INSERT INTO post_links (post_id, link) VALUES %s ON CONFLICT DO NOTHING',
+                       [(post_id, link) for link in links])
+
+def _salvar_postagem(cursor, textos, midia_ids=None):
+    """ Insere um post com uma variante por texto (midia_ids: file_ids das fotos, em ordem) e indexa seus links. Retorna o ID. """
+    textos = [texto for texto in textos if texto]
+    cursor.execute('INSERT INTO postagens (midia_ids) VALUES (%s) RETURNING id', (midia_ids or None,))
+    post_id = cursor.fetchone()[0]
+    execute_values(cursor, 'INSERT INTO variantes (post_id, ordem, texto) VALUES %s',
+                   [(post_id, ordem, texto) for ordem, texto in enumerate(textos)])
+    # Em cada grupo, o post novo entra na rodada atual da rotação
+    cursor.execute('''
+        INSERT INTO grupo_rotacao (chat_id, post_id, rodada)
+        SELECT g.chat_id, %s, COALESCE((SELECT MIN(r.rodada) FROM grupo_rotacao r WHERE r.chat_id = g.chat_id), 0)
+        FROM grupos g
+    ''', (post_id,))
+    _indexar_links(cursor, post_id, *textos)
+    impressoes = _indexar_impressoes(cursor, post_id, list(enumerate(textos)))
+    return post_id, _posts_parecidos(cursor, post_id, impressoes, extrair_links(*textos))
+
+# --- Impressões Digitais (quase duplicados) ---
+# Cada variante guarda o hash do texto normalizado (cópias exatas) e uma assinatura
+# MinHash dos seus shingles de caracteres. A assinatura é cortada em bandas (LSH): dois
+# textos parecidos quase sempre repetem ao menos uma banda, então os candidatos saem do
+# índice GIN em impressoes.bandas, e só eles têm a similaridade estimada. Posts que têm
+# links mas nenhum em comum não contam como duplicados: é o mesmo modelo de texto
+# divulgando casas diferentes.
+SHINGLE_TAMANHO = 5
+MINHASH_BITS = 6
+MINHASH_TAMANHO = 1 << MINHASH_BITS
+# 12 bandas de 5 posições (usa 60 das 64): pares com 80% de similaridade dividem ao menos
+# uma banda em ~99% dos casos; com 50%, em ~30%
+MINHASH_BANDAS = 12
+DUPLICADOS_MAX_GRUPOS = 30
+# Num balde do /duplicados, cada post é comparado com todos os anteriores até este limite
+# (baldes normais são bem menores; ele só segura baldes de um texto padrão muito repetido)
+DUPLICADOS_BALDE_MAX = 50
+
+def normalizar_texto(texto: str) -> str:
+    """ Minúsculas, sem acentos, emojis e pontuação, com os espaços colapsados. """
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', texto).split())
+
+def impressao_digital(texto: str):
+    """ (hash do texto normalizado, assinatura MinHash, bandas LSH), ou None se não sobra texto. """
+    normalizado = normalizar_texto(texto)
+    if not normalizado: return None
+    dados = normalizado.encode()
+    hash_texto = int.from_bytes(hashlib.blake2b(dados, digest_size=8).digest(), 'big', signed=True)
+    shingles = {dados[i:i + SHINGLE_TAMANHO] for i in range(max(len(dados) - SHINGLE_TAMANHO + 1, 1))}
+    # One permutation hashing: um único hash por shingle; os bits altos escolhem a posição
+    # da assinatura e cada posição guarda o menor valor que caiu nela
+    minimos = [None] * MINHASH_TAMANHO
+    for shingle in shingles:
+        h = (zlib.crc32(shingle) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        posicao, valor = h >> (64 - MINHASH_BITS), (h >> 24) & 0xFFFFFF
+        if minimos[posicao] is None or valor < minimos[posicao]:
+            minimos[posicao] = valor
+    # Posições vazias (textos curtos) copiam a próxima preenchida (dando a volta), marcada com a distância
+    assinatura = [0] * MINHASH_TAMANHO
+    proxima = next(posicao for posicao, valor in enumerate(minimos) if valor is not None) + MINHASH_TAMANHO
+    for posicao in range(MINHASH_TAMANHO - 1, -1, -1):
+        if minimos[posicao] is not None:
+            proxima = posicao
+            assinatura[posicao] = minimos[posicao]
+        else:
+            assinatura[posicao] = minimos[proxima % MINHASH_TAMANHO] | ((proxima - posicao) << 24)
+    linhas = MINHASH_TAMANHO // MINHASH_BANDAS
+    bandas = [(banda << 32) | zlib.crc32(struct.pack(f'{linhas}I', *assinatura[banda * linhas:(banda + 1) * linhas]))
+              for banda in range(MINHASH_BANDAS)]
+    return hash_texto, assinatura, bandas
+
+def similaridade(assinatura_a, assinatura_b) -> float:
+    """ Similaridade de Jaccard estimada: fração das posições iguais nas duas assinaturas. """
+    return sum(a == b for a, b in zip(assinatura_a, assinatura_b)) / MINHASH_TAMANHO
+
+def _gravar_impressoes(cursor, linhas):
+    """ linhas: (post_id, ordem, hash_texto, minhash, bandas). """
+    execute_values(cursor, 'INSERT INTO impressoes (post_id, ordem, hash_texto, minhash, bandas) VALUES %s',
+                   linhas, page_size=1000)
+
+def _indexar_impressoes(cursor, post_id, variantes) -> list:
+    """ Grava a impressão digital de cada variante (ordem, texto). Retorna as impressões gravadas. """
+    impressoes = [(ordem, *impressao) for ordem, texto in variantes if (impressao := impressao_digital(texto))]
+    if impressoes:
+        _gravar_impressoes(cursor, [(post_id, *impressao) for impressao in impressoes])
+    return impressoes
+
+def links_compativeis(links_a, links_b) -> bool:
+    """ Dois posts só podem ser o mesmo se dividem um link (ou se algum deles não tem links). """
+    return not links_a or not links_b or not set(links_a).isdisjoint(links_b)
+
+def _posts_parecidos(cursor, post_id, impressoes, links) -> list:
+    """ Outros posts com texto igual ou parecido com alguma das impressões: [(post_id, similaridade)]. """
+    if not impressoes: return []
+    hashes = [hash_texto for _, hash_texto, _, _ in impressoes]
+    cursor.execute('''
+        SELECT post_id, hash_texto, minhash FROM impressoes
+        WHERE post_id <> %s AND (hash_texto = ANY(%s::bigint[]) OR bandas && %s::bigint[])
+    ''', (post_id, hashes, [banda for *_, bandas in impressoes for banda in bandas]))
+    parecidos = {}
+    for outro_id, hash_texto, minhash in cursor.fetchall():
+        valor = 1.0 if hash_texto in hashes else max(similaridade(minhash, assinatura) for _, _, assinatura, _ in impressoes)
+        if valor >= DUPLICADOS_LIMIAR:
+            parecidos[outro_id] = max(valor, parecidos.get(outro_id, 0.0))
+    if parecidos and links:
+        # Os links só são lidos para quem passou do limiar
+        cursor.execute('SELECT post_id, array_agg(link) FROM post_links WHERE post_id = ANY(%s) GROUP BY post_id',
+                       (list(parecidos),))
+        for outro_id, outros_links in cursor.fetchall():
+            if not links_compativeis(links, outros_links): del parecidos[outro_id]
+    return sorted(parecidos.items(), key=lambda item: (-item[1], item[0]))
+
+def aviso_parecidos(parecidos) -> str:
+    """ Aviso anexado à confirmação do salvamento quando o post repete outros. """
+    if not parecidos: return ""
+    lista = ', '.join(f"{post_id} ({valor:.0%})" for post_id, valor in parecidos[:5])
+    extras = f" e mais {len(parecidos) - 5}" if len(parecidos) > 5 else ""
+    return f"\n\n⚠️ Parecido com o(s) post(s) {lista}{extras}. Confira com /duplicados."
+
+def _grupos_duplicados(cursor) -> list:
+    """
+    Agrupa os posts quase duplicados do catálogo. Os candidatos são os posts que dividem
+    um hash de texto ou uma banda (GROUP BY no banco, sem comparar todos os pares do
+    catálogo); dentro de cada balde os pares são comparados, e os grupos se unem por union-find.
+    """
+    cursor.execute('''
+        SELECT array_agg(DISTINCT post_id ORDER BY post_id) FROM (
+            SELECT post_id, 0 AS tipo, hash_texto AS chave FROM impressoes
+            UNION ALL
+            SELECT post_id, 1, unnest(bandas) FROM impressoes
+        ) candidatos
+        GROUP BY tipo, chave HAVING COUNT(DISTINCT post_id) > 1
+    ''')
+    baldes = [linha[0] for linha in cursor.fetchall()]
+    if not baldes: return []
+    cursor.execute('SELECT post_id, hash_texto, minhash FROM impressoes WHERE post_id = ANY(%s)',
+                   (list({post_id for balde in baldes for post_id in balde}),))
+    impressoes = {}
+    for post_id, hash_texto, minhash in cursor.fetchall():
+        impressoes.setdefault(post_id, []).append((hash_texto, minhash))
+    cursor.execute('SELECT post_id, array_agg(link) FROM post_links WHERE post_id = ANY(%s) GROUP BY post_id',
+                   (list(impressoes),))
+    links = dict(cursor.fetchall())
+
+    def parecido(a, b):
+        return links_compativeis(links.get(a), links.get(b)) and any(hash_a == hash_b or similaridade(minhash_a, minhash_b) >= DUPLICADOS_LIMIAR
+                   for hash_a, minhash_a in impressoes[a] for hash_b, minhash_b in impressoes[b])
+
+    pais = {}
+    def raiz(post_id):
+        while post_id in pais:
+            post_id = pais[post_id]
+        return post_id
+
+    comparados = set()
+    for balde in baldes:
+        # Só entram os pares com links compatíveis: um link em comum, ou um dos posts sem links.
+        # Um texto padrão divulgando casas diferentes enche um balde sem formar nenhum par
+        por_link, sem_links = {}, []
+        for post_id in balde:
+            for link in links.get(post_id) or ():
+                por_link.setdefault(link, []).append(post_id)
+            if not links.get(post_id): sem_links.append(post_id)
+        for i, post_id in enumerate(balde):
+            if links.get(post_id):
+                anteriores = sorted({anterior for link in links[post_id] for anterior in por_link[link] if anterior < post_id}
+                                    | {anterior for anterior in sem_links if anterior < post_id})
+            else:
+                anteriores = balde[:i]
+            for anterior in anteriores[:DUPLICADOS_BALDE_MAX]:
+                if (anterior, post_id) in comparados or raiz(anterior) == raiz(post_id): continue
+                comparados.add((anterior, post_id))
+                if parecido(anterior, post_id):
+                    pais[raiz(post_id)] = raiz(anterior)
+
+    grupos = {}
+    for post_id in pais:
+        grupos.setdefault(raiz(post_id), set()).add(post_id)
+    for chave in grupos: grupos[chave].add(chave)
+    return sorted((sorted(grupo) for grupo in grupos.values()), key=lambda grupo: (-len(grupo), grupo[0]))
+
+# --- Migrações do Schema ---
+# Cada migração roda uma única vez, em ordem, e fica registrada em schema_versao. As
+# primeiras reproduzem o que o init_db criava a cada boot com IF NOT EXISTS, então
+# bancos antigos (sem schema_versao) passam por elas sem efeito e seguem adiante.
+# O SQL de cada migração fica no próprio corpo, escrito para o schema da sua versão:
+# uma migração já registrada não pode mudar junto com as funções do bot.
+def _migracao_tabelas_iniciais(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS postagens (
+            id SERIAL PRIMARY KEY,
+            texto_a TEXT NOT NULL,
+            texto_b TEXT,
+            last_sent TEXT DEFAULT 'B',
+            photo_file_ids TEXT,
+            data_adicao TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inscritos (
+            user_id BIGINT PRIMARY KEY,
+            data_inscricao TEXT NOT NULL
+        )
+    ''')
+
+def _migracao_rotacao(cursor):
+    # Estado persistente da rotação (ver job_send_post)
+    cursor.execute('ALTER TABLE postagens ADD COLUMN IF NOT EXISTS rodada INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE postagens ADD COLUMN IF NOT EXISTS sorteio DOUBLE PRECISION NOT NULL DEFAULT random()')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_postagens_rotacao ON postagens (rodada, sorteio)')
+
+def _migracao_catalogo_links(cursor):
+    cursor.execute("SELECT to_regclass('post_links') IS NULL")
+    preencher_links = cursor.fetchone()[0]
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS post_links (
+            post_id INTEGER NOT NULL REFERENCES postagens(id) ON DELETE CASCADE,
+            link TEXT NOT NULL,
+            PRIMARY KEY (post_id, link)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_post_links_link ON post_links (link)')
+    if not preencher_links: return
+    # Links dos posts já salvos, com o schema desta versão (texto_a e texto_b)
+    total = 0
+    with cursor.connection.cursor(name='backfill_post_links') as leitura:
+        leitura.itersize = 1000
+        leitura.execute('SELECT id, texto_a, texto_b FROM postagens')
+        for post_id, texto_a, texto_b in leitura:
+            links = extrair_links(texto_a, texto_b)
+            if links:
+                execute_values(cursor, 'INSERT INTO post_links (post_id, link) VALUES %s ON CONFLICT DO NOTHING',
+                               [(post_id, link) for link in links])
+            total += 1
+    logger.info(f"Catálogo de links preenchido a partir de {total} posts existentes.")
+
+def _migracao_broadcasts(cursor):
+    # Broadcasts persistidos: cada destinatário tem seu status de entrega
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id SERIAL PRIMARY KEY,
+            admin_chat_id BIGINT NOT NULL,
+            from_chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            progresso_message_id BIGINT,
+            status TEXT NOT NULL DEFAULT 'enviando',
+            total INTEGER NOT NULL DEFAULT 0,
+            data_criacao TEXT NOT NULL,
+            data_conclusao TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_entregas (
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            PRIMARY KEY (broadcast_id, user_id)
+        )
+    ''')
+    cursor.execute('ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS removidos INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_broadcast_entregas_pendentes
+        ON broadcast_entregas (broadcast_id, user_id) WHERE status = 'pendente'
+    ''')
+
+def _migracao_albuns(cursor):
+    # Fotos do post em ordem (álbuns); photo_file_ids guardava só uma e é copiada para cá
+    cursor.execute('ALTER TABLE postagens ADD COLUMN IF NOT EXISTS midia_ids TEXT[]')
+    cursor.execute('''
+        UPDATE postagens SET midia_ids = ARRAY[photo_file_ids]
+        WHERE midia_ids IS NULL AND photo_file_ids IS NOT NULL
+    ''')
+
+def _migracao_persistencia(cursor):
+    # Estado do PTB (bot_data, user_data e conversas), ver PersistenciaPostgres
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS persistencia (
+            tipo TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            dados JSONB NOT NULL,
+            PRIMARY KEY (tipo, chave)
+        )
+    ''')
+
+def _migracao_tipos(cursor):
+    # Datas gravadas como texto ISO (hora local do servidor) viram TIMESTAMPTZ com default now()
+    for tabela, coluna in [('postagens', 'data_adicao'), ('inscritos', 'data_inscricao'),
+                           ('broadcasts', 'data_criacao'), ('broadcasts', 'data_conclusao')]:
+        cursor.execute(f'ALTER TABLE {tabela} ALTER COLUMN {coluna} TYPE TIMESTAMPTZ USING NULLIF({coluna}, \'\')::timestamptz')
+        if coluna != 'data_conclusao':
+            cursor.execute(f'ALTER TABLE {tabela} ALTER COLUMN {coluna} SET DEFAULT now()')
+    # Versão A/B enviada por último: só 'A' ou 'B' (qualquer outro valor antigo conta como 'B')
+    cursor.execute("CREATE TYPE versao_ab AS ENUM ('A', 'B')")
+    cursor.execute('ALTER TABLE postagens ALTER COLUMN last_sent DROP DEFAULT')
+    cursor.execute('''
+        ALTER TABLE postagens ALTER COLUMN last_sent TYPE versao_ab
+        USING (CASE WHEN last_sent = 'A' THEN 'A' ELSE 'B' END)::versao_ab
+    ''')
+    cursor.execute("ALTER TABLE postagens ALTER COLUMN last_sent SET DEFAULT 'B', ALTER COLUMN last_sent SET NOT NULL")
+    # Mídia só em midia_ids (já copiada de photo_file_ids); lista vazia vira NULL
+    cursor.execute("UPDATE postagens SET midia_ids = NULL WHERE cardinality(midia_ids) = 0")
+    cursor.execute('ALTER TABLE postagens DROP COLUMN photo_file_ids')
+    cursor.execute('ALTER TABLE postagens ADD CONSTRAINT postagens_midia_ids_check CHECK (cardinality(midia_ids) > 0)')
+
+def _migracao_indices_broadcast(cursor):
+    # Retomada de broadcasts no boot: procura os 'enviando' sem varrer o histórico inteiro
+    cursor.execute("CREATE INDEX idx_broadcasts_enviando ON broadcasts (id) WHERE status = 'enviando'")
+    cursor.execute('''
+        CREATE INDEX idx_broadcast_entregas_enviando
+        ON broadcast_entregas (broadcast_id) WHERE status = 'enviando'
+    ''')
+
+def _migracao_grupos(cursor):
+    # Grupos de destino, cada um com intervalo, pausa e rotação próprios (substitui GRUPO_ID)
+    cursor.execute('''
+        CREATE TABLE grupos (
+            chat_id BIGINT PRIMARY KEY,
+            titulo TEXT,
+            intervalo INTEGER NOT NULL DEFAULT 3600 CHECK (intervalo > 0),
+            ativo BOOLEAN NOT NULL DEFAULT false,
+            proximo_envio TIMESTAMPTZ NOT NULL DEFAULT now(),
+            data_adicao TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_grupos_agenda ON grupos (proximo_envio) WHERE ativo')
+    cursor.execute('''
+        CREATE TABLE grupo_rotacao (
+            chat_id BIGINT NOT NULL REFERENCES grupos(chat_id) ON DELETE CASCADE,
+            post_id INTEGER NOT NULL REFERENCES postagens(id) ON DELETE CASCADE,
+            rodada INTEGER NOT NULL DEFAULT 0,
+            sorteio DOUBLE PRECISION NOT NULL DEFAULT random(),
+            last_sent versao_ab NOT NULL DEFAULT 'B',
+            PRIMARY KEY (chat_id, post_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_grupo_rotacao ON grupo_rotacao (chat_id, rodada, sorteio)')
+    cursor.execute('CREATE INDEX idx_grupo_rotacao_post ON grupo_rotacao (post_id)')
+    if GRUPO_ID is not None:
+        # O grupo da variável GRUPO_ID herda o intervalo, o estado do envio automático e a rotação
+        cursor.execute("SELECT dados FROM persistencia WHERE tipo = 'bot_data'")
+        linha = cursor.fetchone()
+        bot_data = linha[0] if linha else {}
+        cursor.execute('''
+            INSERT INTO grupos (chat_id, intervalo, ativo, proximo_envio)
+            VALUES (%s, %s, %s, COALESCE(to_timestamp(%s::float8), now()))
+        ''', (GRUPO_ID, bot_data.get('intervalo', 3600), bool(bot_data.get('postagem_ativa')), bot_data.get('proximo_envio')))
+        cursor.execute('''
+            INSERT INTO grupo_rotacao (chat_id, post_id, rodada, sorteio, last_sent)
+            SELECT %s, id, rodada, sorteio, last_sent FROM postagens
+        ''', (GRUPO_ID,))
+    cursor.execute("UPDATE persistencia SET dados = dados - 'intervalo' - 'postagem_ativa' - 'proximo_envio' WHERE tipo = 'bot_data'")
+    cursor.execute('ALTER TABLE postagens DROP COLUMN rodada, DROP COLUMN sorteio, DROP COLUMN last_sent')
+
+def _migracao_fila_broadcast(cursor):
+    # Réplica (PID da conexão de coordenação) que reservou cada entrega em 'enviando'
+    cursor.execute('ALTER TABLE broadcast_entregas ADD COLUMN replica INTEGER')
+
+def _migracao_envios_falhos(cursor):
+    # Envios que esgotaram as tentativas na fila de envios, para análise e reenvio manual
+    cursor.execute('''
+        CREATE TABLE envios_falhos (
+            id SERIAL PRIMARY KEY,
+            metodo TEXT NOT NULL,
+            chat_id BIGINT,
+            prioridade TEXT NOT NULL,
+            parametros JSONB NOT NULL,
+            erro TEXT NOT NULL,
+            tentativas INTEGER NOT NULL,
+            data TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_envios_falhos_data ON envios_falhos (data)')
+
+def _migracao_variantes(cursor):
+    # Textos do post viram variantes em número livre: A (ordem 0) e B (ordem 1) vêm das colunas antigas
+    cursor.execute('''
+        CREATE TABLE variantes (
+            post_id INTEGER NOT NULL REFERENCES postagens(id) ON DELETE CASCADE,
+            ordem SMALLINT NOT NULL CHECK (ordem BETWEEN 0 AND 25),
+            texto TEXT NOT NULL,
+            peso INTEGER NOT NULL DEFAULT 1 CHECK (peso > 0),
+            envios BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (post_id, ordem)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO variantes (post_id, ordem, texto)
+        SELECT id, 0, texto_a FROM postagens
+        UNION ALL
+        SELECT id, 1, texto_b FROM postagens WHERE texto_b IS NOT NULL
+    ''')
+    # 'alternada': rodízio ponderado pelos pesos; 'sorteio': escolha aleatória ponderada
+    cursor.execute('''
+        ALTER TABLE postagens ADD COLUMN selecao TEXT NOT NULL DEFAULT 'alternada'
+            CHECK (selecao IN ('alternada', 'sorteio'))
+    ''')
+    # vez: quantas vezes o post já saiu no grupo; o rodízio escolhe a variante a partir dela.
+    # last_sent = 'A' quer dizer que a próxima é a B (vez ímpar)
+    cursor.execute('ALTER TABLE grupo_rotacao ADD COLUMN vez INTEGER NOT NULL DEFAULT 0')
+    cursor.execute("UPDATE grupo_rotacao SET vez = 1 WHERE last_sent = 'A'")
+    cursor.execute('ALTER TABLE grupo_rotacao DROP COLUMN last_sent')
+    cursor.execute('ALTER TABLE postagens DROP COLUMN texto_a, DROP COLUMN texto_b')
+    cursor.execute('DROP TYPE versao_ab')
+
+def _migracao_impressoes(cursor):
+    # Impressões digitais das variantes para achar quase duplicados (ver _posts_parecidos)
+    cursor.execute('''
+        CREATE TABLE impressoes (
+            post_id INTEGER NOT NULL,
+            ordem SMALLINT NOT NULL,
+            hash_texto BIGINT NOT NULL,
+            minhash INTEGER[] NOT NULL,
+            bandas BIGINT[] NOT NULL,
+            PRIMARY KEY (post_id, ordem),
+            FOREIGN KEY (post_id, ordem) REFERENCES variantes (post_id, ordem) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_impressoes_hash ON impressoes (hash_texto)')
+    cursor.execute('CREATE INDEX idx_impressoes_bandas ON impressoes USING gin (bandas)')
+    # Impressões das variantes já salvas. Mudar o formato da impressão digital pede uma
+    # migração nova que recalcule a tabela, não uma alteração desta
+    total, lote = 0, []
+
+    def gravar(lote):
+        execute_values(cursor, 'INSERT INTO impressoes (post_id, ordem, hash_texto, minhash, bandas) VALUES %s',
+                       lote, page_size=1000)
+    with cursor.connection.cursor(name='backfill_impressoes') as leitura:
+        leitura.itersize = 2000
+        leitura.execute('SELECT post_id, ordem, texto FROM variantes')
+        for post_id, ordem, texto in leitura:
+            impressao = impressao_digital(texto)
+            if impressao: lote.append((post_id, ordem, *impressao))
+            if len(lote) >= 1000:
+                gravar(lote)
+                lote = []
+            total += 1
+    if lote: gravar(lote)
+    logger.info(f"Impressões digitais calculadas para {total} variantes existentes.")
+
+def _migracao_busca(cursor):
+    # Busca textual do /buscar: coluna gerada, o próprio Postgres a mantém em cada INSERT/UPDATE
+    cursor.execute('''
+        ALTER TABLE variantes
+        ADD COLUMN busca tsvector GENERATED ALWAYS AS (to_tsvector('portuguese', texto)) STORED
+    ''')
+    cursor.execute('CREATE INDEX idx_variantes_busca ON variantes USING gin (busca)')
+
+def _migracao_trigramas_links(cursor):
+    # O /verificar procura o link como trecho dos links salvos (LIKE '%...%'); com o pg_trgm
+    # um índice de trigramas atende a busca. A extensão é opcional: sem ela (ou sem permissão
+    # para criá-la), o LIKE varre post_links, que é bem menor que os textos dos posts
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if not cursor.fetchone():
+        logger.warning("Extensão pg_trgm indisponível: o /verificar vai buscar trechos de link sem índice.")
+        return
+    cursor.execute('SAVEPOINT trigramas')
+    try:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute('CREATE INDEX idx_post_links_trigramas ON post_links USING gin (link gin_trgm_ops)')
+    except psycopg2.Error as e:
+        cursor.execute('ROLLBACK TO SAVEPOINT trigramas')
+        logger.warning(f"Índice de trigramas não criado ({e}): o /verificar vai buscar trechos de link sem índice.")
+
+def _migracao_inicio_replica(cursor):
+    # Com o PID, identifica a conexão da réplica que reservou a entrega: um PID reaproveitado
+    # por outra conexão não faz uma entrega abandonada parecer viva
+    cursor.execute('ALTER TABLE broadcast_entregas ADD COLUMN replica_inicio TIMESTAMPTZ')
+
+MIGRACOES = [
+    (1, 'Tabelas postagens e inscritos', _migracao_tabelas_iniciais),
+    (2, 'Estado da rotação (rodada, sorteio)', _migracao_rotacao),
+    (3, 'Catálogo de links (post_links)', _migracao_catalogo_links),
+    (4, 'Broadcasts persistidos', _migracao_broadcasts),
+    (5, 'Álbuns (midia_ids)', _migracao_albuns),
+    (6, 'Persistência do PTB', _migracao_persistencia),
+    (7, 'Datas em TIMESTAMPTZ, last_sent como enum e mídia estruturada', _migracao_tipos),
+    (8, 'Índices da retomada de broadcasts', _migracao_indices_broadcast),
+    (9, 'Grupos de destino com agenda e rotação próprias', _migracao_grupos),
+    (10, 'Fila de broadcast compartilhada entre réplicas', _migracao_fila_broadcast),
+    (11, 'Envios que esgotaram as tentativas (dead letter)', _migracao_envios_falhos),
+    (12, 'Variantes dos posts (substituem texto_a, texto_b e last_sent)', _migracao_variantes),
+    (13, 'Impressões digitais das variantes (quase duplicados)', _migracao_impressoes),
+    (14, 'Busca textual nas variantes (tsvector + GIN)', _migracao_busca),
+    (15, 'Índice de trigramas dos links (pg_trgm, se disponível)', _migracao_trigramas_links),
+    (16, 'Início da conexão da réplica nas entregas (PIDs são reaproveitados)', _migracao_inicio_replica),
+]
+
+def migrar(cursor) -> list:
+    """ Aplica, numa transação, as migrações ainda não registradas. Retorna as versões aplicadas. """
+    # Várias instâncias subindo juntas: só uma migra, as outras esperam e não encontram nada pendente
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('bot_migracoes'))")
+    cursor.execute("SELECT to_regclass('schema_versao') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute('SELECT COALESCE(MAX(versao), 0) FROM schema_versao')
+        versao_atual = cursor.fetchone()[0]
+    else:
+        cursor.execute('''
+            CREATE TABLE schema_versao (
+                versao INTEGER PRIMARY KEY,
+                descricao TEXT NOT NULL,
+                aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        versao_atual = 0
+    aplicadas = []
+    for versao, descricao, migracao in MIGRACOES:
+        if versao <= versao_atual: continue
+        migracao(cursor)
+        cursor.execute('INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s)', (versao, descricao))
+        logger.info(f"Migração {versao} aplicada: {descricao}")
+        aplicadas.append(versao)
+    return aplicadas
+
+def init_db():
+    """ Leva o schema do banco até a última migração. """
+    try:
+        aplicadas = db_run_sync(migrar)
+        logger.info(f"Banco de dados PostgreSQL na versão {MIGRACOES[-1][0]}"
+                    f"{f' ({len(aplicadas)} migrações aplicadas)' if aplicadas else ''}.")
+    except Exception as e:
+        # Sem as migrações o bot rodaria contra um schema pela metade: a inicialização para aqui
+        logger.critical(f"Erro ao migrar o banco de dados: {e}")
+        raise
+
+# --- Persistência (bot_data, user_data e conversas) ---
+# O PTB chama os update_* a cada PERSISTENCIA_INTERVALO segundos (e no desligamento) com
+# o estado de todos os usuários e conversas tocados no período. Aqui só o que mudou
+# desde a última gravação fica marcado como sujo, e cada rodada vira um único upsert.
+# Os dados vão como JSON: chaves numéricas dentro dos dicts voltam como texto.
+def _ler_persistencia(cursor, tipo: str) -> list:
+    cursor.execute('SELECT chave, dados FROM persistencia WHERE tipo = %s', (tipo,))
+    return cursor.fetchall()
+
+def _gravar_persistencia(cursor, lote: dict):
+    gravar = [(tipo, chave, Json(json.loads(dados))) for (tipo, chave), dados in lote.items() if dados is not None]
+    apagar = [(tipo, chave) for (tipo, chave), dados in lote.items() if dados is None]
+    if gravar:
+        execute_values(cursor, '''
+            INSERT INTO persistencia (tipo, chave, dados) VALUES %s
+            ON CONFLICT (tipo, chave) DO UPDATE SET dados = EXCLUDED.dados
+        ''', gravar)
+    if apagar:
+        execute_values(cursor, '''
+            DELETE FROM persistencia p USING (VALUES %s) AS a (tipo, chave)
+            WHERE p.tipo = a.tipo AND p.chave = a.chave
+        ''', apagar)
+
+def _serializar(dados) -> str | None:
+    return None if dados is None else json.dumps(dados, sort_keys=True, ensure_ascii=False, default=str)
+
+class PersistenciaPostgres(BasePersistence):
+    """ BasePersistence sobre a tabela persistencia, com gravação em lote só do que mudou. """
+    def __init__(self, update_interval: float = 60):
+        super().__init__(store_data=PersistenceInput(chat_data=False, callback_data=False), update_interval=update_interval)
+        self._gravados = {}  # (tipo, chave) -> JSON da versão que está no banco
+        self._sujos = {}     # (tipo, chave) -> JSON a gravar (None apaga a linha)
+        self._gravacao = None
+
+    async def _ler(self, tipo: str) -> list:
+        linhas = await db_run(_ler_persistencia, tipo)
+        for chave, dados in linhas:
+            self._gravados[(tipo, chave)] = _serializar(dados)
+        return linhas
+
+    def _marcar(self, tipo: str, chave: str, dados):
+        serializado = _serializar(dados)
+        if (tipo, chave) not in self._sujos and self._gravados.get((tipo, chave)) == serializado:
+            return
+        self._sujos[(tipo, chave)] = serializado
+        if not self._gravacao or self._gravacao.done():
+            self._gravacao = asyncio.create_task(self._gravar())
+
+    async def _gravar(self):
+        # Deixa as demais chamadas update_* da mesma rodada entrarem no lote
+        await asyncio.sleep(0)
+        while self._sujos:
+            lote, self._sujos = self._sujos, {}
+            try:
+                await db_run(_gravar_persistencia, lote)
+            except Exception as e:
+                logger.error(f"Erro ao gravar a persistência ({len(lote)} itens): {e}")
+                for chave, dados in lote.items(): self._sujos.setdefault(chave, dados)
+                return
+            for chave, dados in lote.items():
+                if dados is None: self._gravados.pop(chave, None)
+                else: self._gravados[chave] = dados
+
+    async def get_bot_data(self) -> dict:
+        linhas = await self._ler('bot_data')
+        return linhas[0][1] if linhas else {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._marcar('bot_data', '', data)
+
+    async def get_user_data(self) -> dict:
+        return {int(chave): dados for chave, dados in await self._ler('user_data')}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # Quase todo usuário só tem user_data vazio: não vale uma linha no banco
+        self._marcar('user_data', str(user_id), data or None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._marcar('user_data', str(user_id), None)
+
+    async def get_conversations(self, name: str) -> dict:
+        return {tuple(json.loads(chave)): estado for chave, estado in await self._ler(f'conversa:{name}')}
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        self._marcar(f'conversa:{name}', json.dumps(list(key)), new_state)
+
+    async def flush(self) -> None:
+        if self._gravacao: await self._gravacao
+        if self._sujos: await self._gravar()
+
+    # chat_data e callback_data não são usados pelo bot
+    async def get_chat_data(self) -> dict: return {}
+    async def update_chat_data(self, chat_id: int, data: dict) -> None: pass
+    async def drop_chat_data(self, chat_id: int) -> None: pass
+    async def get_callback_data(self): return None
+    async def update_callback_data(self, data) -> None: pass
+    async def refresh_bot_data(self, bot_data: dict) -> None: pass
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None: pass
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None: pass
+
+# --- Coordenação entre Réplicas ---
+# Cada réplica mantém uma conexão própria com o PostgreSQL, fora do pool. O PID dessa
+# conexão, com o horário em que ela começou (PIDs são reaproveitados pelo servidor),
+# identifica a réplica nas reservas da fila de broadcast, e a réplica que segura
+# o advisory lock de sessão da liderança roda o agendador dos grupos e a recuperação de
+# entregas órfãs. Se a líder cair, a conexão morre, o lock é liberado e outra réplica
+# assume na tentativa seguinte (a cada LIDER_INTERVALO segundos).
+LIDER_LOCK = 7140  # primeira chave do lock; a segunda é o schema, para deploys no mesmo banco não disputarem
+coordenacao = {'conn': None, 'replica': None, 'replica_inicio': None, 'lider': False, 'replicas': 1}
+
+def _fechar_coordenacao():
+    conn = coordenacao['conn']
+    coordenacao.update(conn=None, replica=None, replica_inicio=None, lider=False, replicas=1)
+    if conn is not None and not conn.closed:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+def _coordenar() -> bool:
+    """ (Re)abre a conexão de coordenação, tenta a liderança ou confirma que a mantém. Bloqueante. """
+    try:
+        if coordenacao['conn'] is None or coordenacao['conn'].closed:
+            # Keepalives: uma conexão presa em rede morta é detectada em segundos, não em horas
+            conn = psycopg2.connect(DATABASE_URL, connect_timeout=10, keepalives=1, keepalives_idle=10,
+                                    keepalives_interval=5, keepalives_count=3, application_name='bot-coordenacao')
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                # O nome da conexão inclui o schema: é por ele que as réplicas do mesmo deploy se contam
+                cursor.execute("SELECT set_config('application_name', 'bot-coordenacao:' || current_schema(), false)")
+                cursor.execute('SELECT pid, backend_start FROM pg_stat_activity WHERE pid = pg_backend_pid()')
+                replica, replica_inicio = cursor.fetchone()
+                coordenacao.update(conn=conn, replica=replica, replica_inicio=replica_inicio, lider=False)
+        with coordenacao['conn'].cursor() as cursor:
+            if coordenacao['lider']:
+                # O lock é da sessão: se a conexão responde, a liderança continua nossa
+                cursor.execute('SELECT 1')
+            else:
+                cursor.execute('SELECT pg_try_advisory_lock(%s, hashtext(current_schema()))', (LIDER_LOCK,))
+                coordenacao['lider'] = cursor.fetchone()[0]
+            # Réplicas vivas, para dividir entre elas o limite global de envios do bot
+            cursor.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE application_name = current_setting('application_name')")
+            coordenacao['replicas'] = max(cursor.fetchone()[0], 1)
+    except psycopg2.Error as e:
+        logger.error(f"Conexão de coordenação perdida: {e}")
+        _fechar_coordenacao()
+    return coordenacao['lider']
+
+async def job_coordenacao(context: ContextTypes.DEFAULT_TYPE):
+    era_lider = coordenacao['lider']
+    lider = await asyncio.to_thread(_coordenar)
+    METRICA_LIDER.set(1 if lider else 0)
+    if lider != era_lider:
+        logger.info(f"Réplica {coordenacao['replica']}: {'assumiu' if lider else 'perdeu'} a liderança.")
+
+# --- Identidade do Bot ---
+# Username, deep link de inscrição e teclados de convite são montados uma vez no
+# post_init e reaproveitados; um job periódico refaz tudo se o username mudar.
+identidade_bot = {}
+
+def montar_convites(username: str):
+    deep_link = f"https://t.me/{username}?start=inscrever"
+    identidade_bot.update(
+        username=username,
+        deep_link=deep_link,
+        teclado_boas_vindas=InlineKeyboardMarkup([[InlineKeyboardButton("🚀 Inscrever-se Agora (Grátis)!", url=deep_link)]]),
+        teclado_convite=InlineKeyboardMarkup([[InlineKeyboardButton("Quero me Inscrever Gratuitamente! 🚀", url=deep_link)]]),
+    )
+
+async def atualizar_identidade_bot(bot):
+    """ Consulta o get_me e remonta os convites se o username tiver mudado. """
+    username = (await bot.get_me()).username
+    if username != identidade_bot.get('username'):
+        montar_convites(username)
+        logger.info(f"Identidade do bot atualizada: @{username}")
+
+async def job_atualizar_identidade(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await atualizar_identidade_bot(context.bot)
+    except Exception as e:
+        logger.warning(f"Não foi possível atualizar a identidade do bot: {e}")
 
 # --- Funções de Inicialização do Bot ---
 async def post_init(application: Application):
+    # application.initialize() já fez o get_me; o username fica em cache no Bot
+    montar_convites(application.bot.username)
+    application.job_queue.run_repeating(job_atualizar_identidade, interval=6 * 3600, first=6 * 3600, name="atualizar_identidade")
+    # Réplicas: a primeira tentativa de liderança acontece já no início
+    await job_coordenacao(None)
+    application.job_queue.run_repeating(job_coordenacao, interval=LIDER_INTERVALO, first=LIDER_INTERVALO, name="coordenacao")
+    application.job_queue.run_repeating(job_broadcasts, interval=BROADCAST_VERIFICAR, first=1, name="broadcasts")
+    # Agendador dos grupos: o estado (ativo, intervalo, próximo envio) fica na tabela grupos
+    application.job_queue.run_repeating(job_send_post, interval=AGENDADOR_TICK, first=1, name="postagem_automatica")
+    application.job_queue.run_repeating(job_gravar_envios_variantes, interval=VARIANTES_GRAVAR_INTERVALO,
+                                        first=VARIANTES_GRAVAR_INTERVALO, name="gravar_envios_variantes")
+    global servidor_metricas
+    if METRICAS_PORTA:
+        servidor_metricas = await iniciar_servidor_metricas()
     user_commands = [
         BotCommand("start", "▶️ Inicia o bot"),
         BotCommand("cancelar_inscricao", "❌ Cancela a inscrição para receber DMs")
@@ -99,16 +1198,24 @@ async def post_init(application: Application):
         BotCommand("start", "▶️ Exibe o menu de admin"),
         BotCommand("criar", "✨ Gera um novo post"),
         BotCommand("enviar_dm", "🚀 Envia um lançamento para os inscritos"),
-        BotCommand("convidar", "💌 Posta um convite de inscrição no grupo"),
+        BotCommand("convidar", "💌 Posta um convite de inscrição nos grupos"),
         BotCommand("status", "📊 Verifica o status atual do bot"),
         BotCommand("verificar", "🔍 Verifica se um link já existe"),
+        BotCommand("buscar", "🔎 Procura posts por palavras do texto"),
+        BotCommand("duplicados", "🧬 Lista os posts repetidos ou parecidos"),
         BotCommand("ativar", "✅ Ativa o envio automático"),
         BotCommand("pausar", "⏸️ Pausa o envio automático"),
         BotCommand("ver_lista", "📋 Mostra e permite editar posts"),
-        BotCommand("gerar_lista_links", "🔗 Gera uma lista com os links únicos"),
+        BotCommand("gerar_lista_links", "🔗 Gera uma lista com os links únicos (\"arquivo\" envia .txt)"),
         BotCommand("set_interval", "⏱️ Define o intervalo entre os posts"),
+        BotCommand("add_grupo", "➕ Cadastra um grupo de destino"),
+        BotCommand("remover_grupo", "➖ Remove um grupo de destino"),
         BotCommand("remover", "🗑️ Remove um post pelo ID"),
+        BotCommand("variantes", "🧪 Lista e ajusta as variantes de um post"),
+        BotCommand("importar", "📥 Importa posts de um arquivo .csv, .jsonl ou .json"),
+        BotCommand("exportar", "📤 Exporta todos os posts (csv ou jsonl)"),
         BotCommand("limpar_lista", "🔥 Apaga TODOS os posts da lista"),
+        BotCommand("metricas", "📈 Exporta as métricas de desempenho"),
     ]
     for admin_id in ADMIN_IDS:
         try:
@@ -120,20 +1227,14 @@ async def post_init(application: Application):
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if context.args and context.args[0] == 'inscrever':
-        conn = db_connect()
         try:
-            with conn.cursor() as cursor:
-                cursor.execute("INSERT INTO inscritos (user_id, data_inscricao) VALUES (%s, %s) ON CONFLICT (user_id) DO NOTHING", 
-                               (user.id, datetime.now().isoformat()))
-            conn.commit()
+            await db_execute("INSERT INTO inscritos (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING", (user.id,))
             await update.message.reply_text("✅ Inscrição realizada com sucesso!")
         except psycopg2.IntegrityError:
             await update.message.reply_text("👍 Você já está inscrito.")
         except Exception as e:
             logger.error(f"Erro no /start inscrever: {e}")
             await update.message.reply_text("Ocorreu um erro ao processar sua inscrição.")
-        finally:
-            if conn: conn.close()
         return
 
     if user.id in ADMIN_IDS:
@@ -155,6 +1256,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton("🔗 Gerar Lista Links", callback_data='gerar_lista_links')
                 
             ],
+            [
+                InlineKeyboardButton("📄 Exportar Links (arquivo)", callback_data='gerar_lista_links_arquivo'),
+                InlineKeyboardButton("🔎 Buscar Posts", callback_data='menu_buscar')
+            ],
             [
                 InlineKeyboardButton("🚀 Enviar DM", callback_data='menu_enviar_dm'),
                 InlineKeyboardButton("💌 Convidar p/ Grupo", callback_data='convidar')
@@ -172,26 +1277,57 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cancelar_inscricao(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    conn = db_connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM inscritos WHERE user_id = %s", (user_id,))
-        conn.commit()
+        await db_execute("DELETE FROM inscritos WHERE user_id = %s", (user_id,))
         await update.message.reply_text("Sua inscrição foi cancelada.")
     except Exception as e:
         logger.error(f"Erro ao cancelar inscrição: {e}")
-    finally:
-        if conn: conn.close()
+
+# Novos membros que chegam dentro da janela recebem uma única mensagem de boas-vindas.
+# Acima do limite de menções só contamos quem ficou de fora, para a memória não crescer.
+_boas_vindas_pendentes = {}
+
+def montar_boas_vindas(mencoes, excedentes=0) -> str:
+    if len(mencoes) == 1 and not excedentes:
+        return (f"Olá, {mencoes[0]}! Seja bem-vindo(a)! 👋\n\n✨ *Dica:* Inscreva-se para receber as novidades em primeira mão no seu privado!")
+    # Mensagens do Telegram têm no máximo 4096 caracteres
+    while len(mencoes) > 1 and len(", ".join(mencoes)) > 3500:
+        mencoes, excedentes = mencoes[:-1], excedentes + 1
+    if excedentes:
+        nomes = ", ".join(mencoes) + f" e mais {excedentes} pessoa(s)"
+    else:
+        nomes = ", ".join(mencoes[:-1]) + " e " + mencoes[-1]
+    return (f"Olá, {nomes}! Sejam bem-vindos(as)! 👋\n\n✨ *Dica:* Inscrevam-se para receber as novidades em primeira mão no privado!")
+
+async def enviar_boas_vindas(bot, chat_id, mencoes, excedentes=0):
+    await bot.send_message(chat_id=chat_id, text=montar_boas_vindas(mencoes, excedentes),
+                           reply_markup=identidade_bot['teclado_boas_vindas'], parse_mode='HTML',
+                           rate_limit_args={'prioridade': 'boas_vindas'})
+
+async def job_boas_vindas(context: ContextTypes.DEFAULT_TYPE):
+    pendente = _boas_vindas_pendentes.pop(context.job.chat_id, None)
+    if not pendente or not pendente['mencoes']: return
+    try:
+        await enviar_boas_vindas(context.bot, context.job.chat_id, pendente['mencoes'], pendente['excedentes'])
+    except Exception as e:
+        logger.error(f"Erro ao enviar boas-vindas no chat {context.job.chat_id}: {e}")
 
 async def boas_vindas_e_convite(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    bot_username = (await context.bot.get_me()).username
-    deep_link = f"https://t.me/{bot_username}?start=inscrever"
-    keyboard = [[InlineKeyboardButton("🚀 Inscrever-se Agora (Grátis)!", url=deep_link)]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    for new_member in update.message.new_chat_members:
-        if new_member.is_bot: continue
-        welcome_message = (f"Olá, {new_member.mention_html()}! Seja bem-vindo(a)! 👋\n\n✨ *Dica:* Inscreva-se para receber as novidades em primeira mão no seu privado!")
-        await update.effective_chat.send_message(text=welcome_message, reply_markup=reply_markup, parse_mode='HTML')
+    mencoes = [m.mention_html() for m in update.message.new_chat_members if not m.is_bot]
+    if not mencoes: return
+    chat_id = update.effective_chat.id
+
+    if BOAS_VINDAS_JANELA <= 0:
+        await enviar_boas_vindas(context.bot, chat_id, mencoes)
+        return
+
+    pendente = _boas_vindas_pendentes.get(chat_id)
+    if pendente is None:
+        pendente = _boas_vindas_pendentes[chat_id] = {'mencoes': [], 'excedentes': 0}
+        context.job_queue.run_once(job_boas_vindas, when=BOAS_VINDAS_JANELA, chat_id=chat_id, name=f"boas_vindas_{chat_id}")
+    vagas = BOAS_VINDAS_MAX_MENCOES - len(pendente['mencoes'])
+    pendente['mencoes'].extend(mencoes[:max(vagas, 0)])
+    pendente['excedentes'] += max(len(mencoes) - max(vagas, 0), 0)
 
 # --- Seção do Gerador de Posts Interativo (/criar) ---
 async def iniciar_criacao(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -273,20 +1409,13 @@ async def receber_lancamento_e_salvar(update: Update, context: ContextTypes.DEFA
     texto_a_final = user_data.get('texto_a', '') + '\n\n' + post_base + lancamento_tag
     texto_b_final = (user_data.get('texto_b', '') + '\n\n' + post_base + lancamento_tag) if user_data.get('texto_b') else None
 
-    conn = db_connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                'INSERT INTO postagens (texto_a, texto_b, data_adicao) VALUES (%s, %s, %s)',
-                (texto_a_final, texto_b_final, datetime.now().isoformat())
-            )
-        conn.commit()
-        await query.edit_message_text("✅ Post salvo com sucesso no banco de dados!")
+        post_id, parecidos = await db_run(_salvar_postagem, [texto_a_final, texto_b_final])
+        await query.edit_message_text(f"✅ Post {post_id} salvo com sucesso no banco de dados!\n\n"
+                                      f"Para testar mais textos, use /variantes {post_id} nova.{aviso_parecidos(parecidos)}")
     except Exception as e:
         logger.error(f"Erro ao salvar post: {e}")
         await query.edit_message_text("❌ Erro ao salvar o post.")
-    finally:
-        if conn: conn.close()
     
     user_data.clear()
     return ConversationHandler.END
@@ -296,6 +1425,465 @@ async def cancelar_criacao(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     context.user_data.clear()
     return ConversationHandler.END
 
+# --- Motor de Broadcast (limite de taxa próprio + envios concorrentes) ---
+class TokenBucket:
+    """ Limitador de taxa: um global (FilaEnvios), um por broadcast e um por chat (limite_do_chat). """
+    def __init__(self, taxa: float, capacidade: float = None):
+        self.taxa = taxa
+        self.capacidade = capacidade if capacidade is not None else max(1.0, taxa)
+        self._tokens = self.capacidade
+        self._ultimo = None
+        self._pausado_ate = 0.0
+        self._lock = asyncio.Lock()
+
+    def cheio(self, agora: float) -> bool:
+        """ Sem pausa e com todas as fichas de volta: igual a um limite recém-criado. """
+        if agora < self._pausado_ate: return False
+        return self._ultimo is None or self._tokens + (agora - self._ultimo) * self.taxa >= self.capacidade
+
+    def pausar(self, segundos: float):
+        """ Suspende todos os envios (usado quando o Telegram responde RetryAfter). """
+        loop = asyncio.get_running_loop()
+        self._pausado_ate = max(self._pausado_ate, loop.time() + segundos)
+        self._tokens = 0.0
+
+    async def adquirir(self, quantidade: float = 1):
+        # Um pedido maior que a capacidade esperaria para sempre: leva o balde cheio
+        quantidade = min(quantidade, self.capacidade)
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                agora = loop.time()
+                if agora < self._pausado_ate:
+                    await asyncio.sleep(self._pausado_ate - agora)
+                    continue
+                if self._ultimo is not None:
+                    self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= quantidade:
+                    self._tokens -= quantidade
+                    return
+                await asyncio.sleep((quantidade - self._tokens) / self.taxa)
+
+def segundos_retry_after(erro: RetryAfter) -> float:
+    retry_after = erro.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+def erro_antes_do_envio(erro: Exception) -> bool:
+    """ O pedido nem saiu (falha ao conectar ou pool de conexões cheio): repeti-lo não duplica a mensagem. """
+    return isinstance(erro.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+def classificar_erro_envio(erro: Exception) -> str:
+    """ Agrupa os erros de envio por classe para o resumo do broadcast. """
+    if isinstance(erro, Forbidden): return 'bloqueado'
+    if isinstance(erro, BadRequest): return 'invalido'
+    if isinstance(erro, RetryAfter): return 'flood'
+    # Timeout com o pedido já enviado: o Telegram pode ter entregado a mensagem
+    if isinstance(erro, TimedOut) and not erro_antes_do_envio(erro): return 'incerto'
+    if isinstance(erro, (TimedOut, NetworkError)): return 'rede'
+    return 'outro'
+
+async def executar_broadcast(destinatarios, enviar, bucket: TokenBucket = None, concorrencia: int = None,
+                             ao_concluir=None) -> Counter:
+    """
+    Chama enviar(user_id) para cada destinatário respeitando o token bucket do broadcast,
+    com no máximo `concorrencia` envios simultâneos. As retentativas ficam com a fila de
+    envios; aqui os resultados são contados por classe de erro e, se informado,
+    ao_concluir(user_id, classe) é chamado para cada destinatário.
+    """
+    bucket = bucket or TokenBucket(BROADCAST_TAXA)
+    resultado = Counter()
+    fila = iter(destinatarios)
+
+    async def enviar_um(user_id) -> str:
+        await bucket.adquirir()
+        try:
+            await enviar(user_id)
+            return 'sucesso'
+        except Exception as e:
+            classe = classificar_erro_envio(e)
+            if classe == 'outro':
+                logger.error(f"Erro ao enviar broadcast para {user_id}: {e}")
+            return classe
+
+    async def worker():
+        for user_id in fila:
+            classe = await enviar_um(user_id)
+            resultado[classe] += 1
+            METRICA_BROADCAST.inc(resultado=classe)
+            if ao_concluir: ao_concluir(user_id, classe)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concorrencia or BROADCAST_CONCORRENCIA)]
+    await asyncio.gather(*workers)
+    return resultado
+
+def resumo_broadcast(resultado: Counter) -> str:
+    rotulos = [('bloqueado', '🚫 Bloqueados'), ('invalido', '⚠️ Chats inválidos'), ('flood', '🐢 Limite de envio'),
+               ('rede', '📡 Erros de rede'), ('outro', '❓ Outros erros'),
+               ('incerto', '⏸️ Sem confirmação de entrega (não reenviados)')]
+    falhas = sum(v for k, v in resultado.items() if k != 'sucesso')
+    linhas = [f"✅ Sucessos: {resultado['sucesso']}", f"❌ Falhas: {falhas}"]
+    linhas += [f"    {rotulo}: {resultado[chave]}" for chave, rotulo in rotulos if resultado[chave]]
+    return "\n".join(linhas)
+
+# --- Fila de Envios ---
+# Todo envio ao Bot API passa pela FilaEnvios (o rate limiter da Application). Cada
+# chamada espera primeiro pelo limite do chat de destino (grupo ou privado) e depois pela
+# vez no limite global, que é concedida por prioridade: admin > post agendado > boas-vindas >
+# broadcast. A prioridade vem de rate_limit_args={'prioridade': ...}; sem ela, o envio
+# é tratado como resposta a um admin. RetryAfter pausa o limite que estourou (o do
+# grupo, ou o global) e o envio é repetido. Erros de rede só são repetidos quando o
+# pedido não chegou a sair (ou numa edição): um timeout depois do envio pode já ter
+# entregado a mensagem, e repeti-la duplicaria o post/DM. Quem esgota as tentativas
+# vai para envios_falhos antes de o erro chegar a quem chamou; com 'repetir': False,
+# quem chamou grava em envios_falhos quando desiste.
+PRIORIDADES = {'admin': 0, 'postagem': 1, 'boas_vindas': 2, 'broadcast': 3}
+# Limites dos chats privados guardados no máximo; ao passar disso, os que já encheram
+# (sem envio recente, iguais a um novo) são descartados. Um broadcast toca milhares de chats
+LIMITES_CHATS_MAX = 5000
+_limites_grupos = {}
+_limites_chats = {}
+
+def limite_do_grupo(chat_id: int) -> TokenBucket:
+    """ O Telegram aceita cerca de 20 mensagens por minuto em cada grupo; um álbum conta uma por foto. """
+    limite = _limites_grupos.get(chat_id)
+    if limite is None:
+        limite = _limites_grupos[chat_id] = TokenBucket(GRUPO_MSGS_POR_MINUTO / 60, capacidade=min(5.0, GRUPO_MSGS_POR_MINUTO))
+    return limite
+
+def limite_do_chat(chat_id: int) -> TokenBucket:
+    """ Limite do destino: o do grupo, ou cerca de CHAT_MSGS_POR_SEGUNDO num chat privado (com uma pequena rajada). """
+    if chat_id < 0: return limite_do_grupo(chat_id)
+    limite = _limites_chats.get(chat_id)
+    if limite is None:
+        if len(_limites_chats) >= LIMITES_CHATS_MAX:
+            agora = asyncio.get_running_loop().time()
+            for outro_id, outro in list(_limites_chats.items()):
+                if outro.cheio(agora) and not outro._lock.locked():
+                    del _limites_chats[outro_id]
+        limite = _limites_chats[chat_id] = TokenBucket(CHAT_MSGS_POR_SEGUNDO, capacidade=max(1.0, 3 * CHAT_MSGS_POR_SEGUNDO))
+    return limite
+
+def _registrar_envio_falho(cursor, metodo, chat_id, prioridade, parametros, erro, tentativas):
+    cursor.execute('''
+        INSERT INTO envios_falhos (metodo, chat_id, prioridade, parametros, erro, tentativas)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    ''', (metodo, chat_id, prioridade, Json(parametros, dumps=functools.partial(json.dumps, default=lambda o: o.to_dict() if hasattr(o, 'to_dict') else str(o))), erro, tentativas))
+
+async def registrar_envio_falho(metodo, parametros, prioridade, erro, tentativas):
+    """ Grava o envio abandonado em envios_falhos (dead letter); um erro do banco só vai para o log. """
+    METRICA_ENVIOS_FALHOS.inc(prioridade=prioridade)
+    chat_id = parametros.get('chat_id')
+    try:
+        await db_run(_registrar_envio_falho, metodo, chat_id if isinstance(chat_id, int) else None, prioridade,
+                     parametros, str(erro), tentativas)
+    except Exception as e:
+        logger.error(f"Erro ao registrar envio falho: {e}")
+
+class FilaEnvios(BaseRateLimiter):
+    def __init__(self, taxa: float = None, max_tentativas: int = None):
+        self.taxa = taxa or ENVIOS_POR_SEGUNDO
+        self.max_tentativas = max_tentativas or ENVIO_MAX_TENTATIVAS
+        self._global = None
+        self._fila = []
+        self._ordem = itertools.count()
+        self._aviso = None
+        self._despachante = None
+
+    async def initialize(self):
+        self._global = TokenBucket(self.taxa)
+        self._aviso = asyncio.Event()
+        self._despachante = asyncio.create_task(self._despachar())
+
+    async def shutdown(self):
+        if self._despachante:
+            self._despachante.cancel()
+            await asyncio.gather(self._despachante, return_exceptions=True)
+        for _, _, vez in self._fila:
+            vez.cancel()
+        self._fila.clear()
+
+    def _medir_fila(self):
+        por_prioridade = Counter(prioridade for prioridade, _, vez in self._fila if not vez.done())
+        for nome, prioridade in PRIORIDADES.items():
+            METRICA_ENVIOS_FILA.set(por_prioridade[prioridade], prioridade=nome)
+
+    async def _despachar(self):
+        """ Libera um envio por ficha do limite global, sempre o de maior prioridade na fila. """
+        while True:
+            while not self._fila:
+                self._aviso.clear()
+                await self._aviso.wait()
+            # O limite é do bot: cada réplica viva fica com uma parte
+            self._global.taxa = self.taxa / coordenacao['replicas']
+            self._global.capacidade = max(1.0, self._global.taxa)
+            await self._global.adquirir()
+            while self._fila:
+                _, _, vez = heapq.heappop(self._fila)
+                if not vez.done():
+                    vez.set_result(None)
+                    break
+            self._medir_fila()
+
+    async def _aguardar_vez(self, prioridade: int):
+        vez = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, (prioridade, next(self._ordem), vez))
+        self._aviso.set()
+        await vez
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        # Só envios e edições de mensagens contam para os limites; o resto (getChat, answerCallbackQuery...) passa direto
+        if not endpoint.startswith(('send', 'forward', 'copy', 'edit')):
+            return await callback(*args, **kwargs)
+        opcoes = rate_limit_args or {}
+        nome = opcoes.get('prioridade', 'admin')
+        chat_id = data.get('chat_id')
+        por_chat = isinstance(chat_id, int) and not endpoint.startswith('edit')
+        grupo = por_chat and chat_id < 0
+        # 'fichas' informa quantas o chamador ainda precisa pegar no limite do chat (o post agendado pega antes)
+        fichas = opcoes.get('fichas', len(data.get('media') or ()) or 1)
+        # 'repetir': False devolve o primeiro erro a quem chamou, que cuida de tentar de novo e de
+        # registrar o envio falho (o post agendado não pode esperar aqui dentro da transação que trava a rotação)
+        repetir = opcoes.get('repetir', True)
+        for tentativa in range(1, self.max_tentativas + 1):
+            if por_chat and fichas:
+                await limite_do_chat(chat_id).adquirir(fichas)
+            await self._aguardar_vez(PRIORIDADES[nome])
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                espera = segundos_retry_after(e)
+                logger.warning(f"RetryAfter de {espera:.0f}s em {endpoint} para {chat_id} (tentativa {tentativa}, {nome}).")
+                (limite_do_grupo(chat_id) if grupo else self._global).pausar(espera)
+                if not repetir: raise
+                erro = e
+            except BadRequest:
+                # BadRequest é uma NetworkError no PTB, mas repetir não adianta
+                raise
+            except NetworkError as e:
+                if not repetir or not (endpoint.startswith('edit') or erro_antes_do_envio(e)):
+                    raise
+                erro = e
+                if tentativa < self.max_tentativas:
+                    await asyncio.sleep(tentativa)
+            fichas = 1
+        logger.error(f"{endpoint} para {chat_id} ({nome}) descartado após {self.max_tentativas} tentativas: {erro}")
+        await registrar_envio_falho(endpoint, data, nome, erro, self.max_tentativas)
+        raise erro
+
+# --- Broadcasts persistidos e retomáveis ---
+# Cada broadcast guarda um status por destinatário e funciona como uma fila compartilhada
+# entre as réplicas: cada uma reserva lotes ('pendente' -> 'enviando') com SKIP LOCKED,
+# marcando o próprio identificador, e grava o resultado ao fim de cada lote. Entregas em
+# 'enviando' de uma réplica que caiu viram 'incerto' (pela líder) e nunca são reenviadas.
+_broadcasts_ativos = set()
+
+def _criar_broadcast(cursor, admin_chat_id, from_chat_id, message_id):
+    # Nasce 'preparando': as outras réplicas só entram depois da mensagem de progresso existir
+    cursor.execute(
+        "INSERT INTO broadcasts (admin_chat_id, from_chat_id, message_id, status) VALUES (%s, %s, %s, 'preparando') RETURNING id",
+        (admin_chat_id, from_chat_id, message_id)
+    )
+    broadcast_id = cursor.fetchone()[0]
+    cursor.execute('INSERT INTO broadcast_entregas (broadcast_id, user_id) SELECT %s, user_id FROM inscritos', (broadcast_id,))
+    total = cursor.rowcount
+    if not total:
+        cursor.execute('DELETE FROM broadcasts WHERE id = %s', (broadcast_id,))
+        return None, 0
+    cursor.execute('UPDATE broadcasts SET total = %s WHERE id = %s', (total, broadcast_id))
+    return broadcast_id, total
+
+def _reservar_lote(cursor, broadcast_id, limite, replica=None, replica_inicio=None):
+    """ Reserva até `limite` destinatários pendentes e diz quantas réplicas estão enviando este broadcast. """
+    # CTE materializada: como subquery do IN, o SKIP LOCKED poderia ser reexecutado e passar do LIMIT
+    cursor.execute('''
+        WITH lote AS MATERIALIZED (
+            SELECT user_id FROM broadcast_entregas
+            WHERE broadcast_id = %s AND status = 'pendente'
+            ORDER BY user_id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE broadcast_entregas e SET status = 'enviando', replica = %s, replica_inicio = %s
+        FROM lote WHERE e.broadcast_id = %s AND e.user_id = lote.user_id
+        RETURNING e.user_id
+    ''', (broadcast_id, limite, replica, replica_inicio, broadcast_id))
+    lote = [row[0] for row in cursor.fetchall()]
+    if not lote: return lote, 0
+    cursor.execute("SELECT COUNT(DISTINCT replica) FROM broadcast_entregas WHERE broadcast_id = %s AND status = 'enviando'",
+                   (broadcast_id,))
+    return lote, max(cursor.fetchone()[0], 1)
+
+def _registrar_entregas(cursor, broadcast_id, resultados, bloqueados):
+    """ Grava o checkpoint do lote e, se houver, remove os inscritos bloqueados de uma vez. """
+    cursor.execute('''
+        UPDATE broadcast_entregas e SET status = v.status
+        FROM unnest(%s::bigint[], %s::text[]) AS v(user_id, status)
+        WHERE e.broadcast_id = %s AND e.user_id = v.user_id
+    ''', (list(resultados.keys()), list(resultados.values()), broadcast_id))
+    if not bloqueados: return 0
+    cursor.execute('DELETE FROM inscritos WHERE user_id = ANY(%s)', (list(bloqueados),))
+    removidos = cursor.rowcount
+    cursor.execute('UPDATE broadcasts SET removidos = removidos + %s WHERE id = %s', (removidos, broadcast_id))
+    return removidos
+
+def _abandonar_lote(cursor, broadcast_id, lote):
+    """ Lote interrompido sem checkpoint: as entregas ainda em 'enviando' viram 'incerto' e nunca são reenviadas. """
+    cursor.execute('''
+        UPDATE broadcast_entregas SET status = 'incerto'
+        WHERE broadcast_id = %s AND user_id = ANY(%s) AND status = 'enviando'
+    ''', (broadcast_id, list(lote)))
+    return cursor.rowcount
+
+async def _gravar_checkpoint(broadcast_id, resultados, bloqueados):
+    """ Grava o checkpoint do lote, repetindo falhas passageiras do banco antes de desistir. """
+    for tentativa in range(1, BROADCAST_CHECKPOINT_TENTATIVAS + 1):
+        try:
+            return await db_run(_registrar_entregas, broadcast_id, resultados, bloqueados)
+        except Exception as e:
+            if tentativa == BROADCAST_CHECKPOINT_TENTATIVAS: raise
+            logger.warning(f"Checkpoint do broadcast {broadcast_id} falhou (tentativa {tentativa}): {e}")
+            await asyncio.sleep(tentativa)
+
+def _situacao_broadcast(cursor, broadcast_id):
+    """ Resultados já gravados por todas as réplicas e o total de inscritos removidos. """
+    cursor.execute('''
+        SELECT status, COUNT(*) FROM broadcast_entregas
+        WHERE broadcast_id = %s AND status NOT IN ('pendente', 'enviando') GROUP BY status
+    ''', (broadcast_id,))
+    contagem = Counter(dict(cursor.fetchall()))
+    cursor.execute('SELECT removidos FROM broadcasts WHERE id = %s', (broadcast_id,))
+    return contagem, cursor.fetchone()[0]
+
+def _concluir_broadcast(cursor, broadcast_id):
+    """ Fecha o broadcast se nada mais estiver pendente ou em envio. Só uma réplica consegue. """
+    cursor.execute('''
+        UPDATE broadcasts SET status = 'concluido', data_conclusao = now()
+        WHERE id = %s AND status = 'enviando' AND NOT EXISTS (
+            SELECT 1 FROM broadcast_entregas
+            WHERE broadcast_id = %s AND status IN ('pendente', 'enviando')
+        )
+        RETURNING id
+    ''', (broadcast_id, broadcast_id))
+    if cursor.fetchone() is None: return None
+    _podar_bloqueados(cursor, broadcast_id)
+    return _situacao_broadcast(cursor, broadcast_id)
+
+def _podar_bloqueados(cursor, broadcast_id):
+    """ Remoção final: todos os bloqueados do broadcast, inclusive os de antes de um reinício. """
+    cursor.execute('''
+        DELETE FROM inscritos i USING broadcast_entregas e
+        WHERE e.broadcast_id = %s AND e.status = 'bloqueado' AND i.user_id = e.user_id
+    ''', (broadcast_id,))
+    cursor.execute('UPDATE broadcasts SET removidos = removidos + %s WHERE id = %s RETURNING removidos',
+                   (cursor.rowcount, broadcast_id))
+    return cursor.fetchone()[0]
+
+async def atualizar_progresso_broadcast(bot, broadcast_id, admin_chat_id, progresso_message_id, total, contagem,
+                                        removidos=0, concluido=False):
+    enviados = sum(contagem.values())
+    cabecalho = "🚀 Envio concluído!" if concluido else f"📤 Enviando... {enviados}/{total} ({enviados * 100 // max(total, 1)}%)"
+    texto = f"{cabecalho}\n\n{resumo_broadcast(contagem)}"
+    if removidos:
+        texto += f"\n\n🧹 Removidos da lista (bloquearam o bot): {removidos}"
+    if not progresso_message_id:
+        # Broadcast que ficou sem mensagem de progresso (criação interrompida): só o resumo final
+        if concluido:
+            await bot.send_message(admin_chat_id, texto)
+        return
+    try:
+        await bot.edit_message_text(texto, chat_id=admin_chat_id, message_id=progresso_message_id)
+    except BadRequest as e:
+        # "message is not modified" ou mensagem apagada: o progresso não é crítico
+        logger.debug(f"Progresso do broadcast {broadcast_id} não atualizado: {e}")
+
+async def processar_broadcast(bot, broadcast_id):
+    """ Ajuda a enviar um broadcast persistido até não restar destinatário pendente. """
+    if broadcast_id in _broadcasts_ativos: return
+    _broadcasts_ativos.add(broadcast_id)
+    try:
+        admin_chat_id, from_chat_id, message_id, progresso_message_id, total = await db_fetchone(
+            'SELECT admin_chat_id, from_chat_id, message_id, progresso_message_id, total FROM broadcasts WHERE id = %s',
+            (broadcast_id,))
+
+        async def enviar(user_id):
+            await bot.forward_message(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id,
+                                      rate_limit_args={'prioridade': 'broadcast'})
+
+        bucket = TokenBucket(BROADCAST_TAXA)
+        bloqueados = []
+        lote = []
+        loop = asyncio.get_running_loop()
+        ultimo_progresso = loop.time()
+        while True:
+            lote, replicas = await db_run(_reservar_lote, broadcast_id, BROADCAST_LOTE,
+                                          coordenacao['replica'], coordenacao['replica_inicio'])
+            if not lote: break
+            # O limite do Bot API é do bot, não da réplica: a taxa é dividida entre as que estão enviando
+            bucket.taxa = BROADCAST_TAXA / replicas
+            bucket.capacidade = max(1.0, bucket.taxa)
+            resultados = {}
+            await executar_broadcast(lote, enviar, bucket=bucket, ao_concluir=resultados.__setitem__)
+            bloqueados.extend(user_id for user_id, classe in resultados.items() if classe == 'bloqueado')
+            poda = bloqueados if len(bloqueados) >= BROADCAST_PODA_LOTE else None
+            await _gravar_checkpoint(broadcast_id, resultados, poda)
+            lote = []
+            if poda: bloqueados = []
+            if loop.time() - ultimo_progresso >= BROADCAST_PROGRESSO_INTERVALO:
+                ultimo_progresso = loop.time()
+                contagem, removidos = await db_run(_situacao_broadcast, broadcast_id)
+                await atualizar_progresso_broadcast(bot, broadcast_id, admin_chat_id, progresso_message_id, total,
+                                                    contagem, removidos)
+
+        # Outras réplicas ainda com lotes em envio: a última a terminar fecha o broadcast
+        situacao = await db_run(_concluir_broadcast, broadcast_id)
+        if situacao is None: return
+        contagem, removidos = situacao
+        await atualizar_progresso_broadcast(bot, broadcast_id, admin_chat_id, progresso_message_id, total,
+                                            contagem, removidos, concluido=True)
+        logger.info(f"Broadcast {broadcast_id} concluído: {dict(contagem)}, {removidos} inscritos removidos.")
+    except Exception as e:
+        logger.error(f"Broadcast {broadcast_id} interrompido (será retomado na próxima verificação): {e}")
+    finally:
+        _broadcasts_ativos.discard(broadcast_id)
+        # Lote reservado por esta réplica, que continua viva: a líder não o recupera e, em
+        # 'enviando' para sempre, ele impediria a conclusão do broadcast
+        if lote:
+            try:
+                incertos = await db_run(_abandonar_lote, broadcast_id, lote)
+                logger.warning(f"Broadcast {broadcast_id}: {incertos} entregas sem checkpoint marcadas como incertas.")
+            except Exception as e:
+                logger.error(f"Erro ao marcar o lote do broadcast {broadcast_id} como incerto: {e}")
+
+def _recuperar_broadcasts(cursor):
+    """ Tarefa da líder: entregas de réplicas que caíram viram 'incerto'; broadcasts abandonados na criação seguem. """
+    cursor.execute('''
+        UPDATE broadcast_entregas e SET status = 'incerto'
+        WHERE status = 'enviando'
+          AND NOT EXISTS (SELECT 1 FROM pg_stat_activity a WHERE a.pid = e.replica AND a.backend_start = e.replica_inicio)
+    ''')
+    incertos = cursor.rowcount
+    cursor.execute('''
+        UPDATE broadcasts SET status = 'enviando'
+        WHERE status = 'preparando' AND data_criacao < now() - interval '1 minute'
+    ''')
+    return incertos
+
+async def job_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """ Em todas as réplicas: entra nos broadcasts abertos que esta ainda não está ajudando a enviar. """
+    try:
+        if coordenacao['lider']:
+            incertos = await db_run(_recuperar_broadcasts)
+            if incertos:
+                logger.warning(f"{incertos} entregas de réplicas encerradas marcadas como incertas.")
+        abertos = await db_fetchall("SELECT id FROM broadcasts WHERE status = 'enviando' ORDER BY id")
+    except Exception as e:
+        logger.error(f"Erro ao buscar broadcasts abertos: {e}")
+        return
+    for (broadcast_id,) in abertos:
+        if broadcast_id in _broadcasts_ativos: continue
+        logger.info(f"Entrando no envio do broadcast {broadcast_id}.")
+        context.application.create_task(processar_broadcast(context.bot, broadcast_id))
+
 # --- Seção de Inscrição e Broadcast Privado ---
 async def convidar_inscricao(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
@@ -304,17 +1892,34 @@ async def convidar_inscricao(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if update.callback_query:
         await update.callback_query.answer()
 
-    bot_username = (await context.bot.get_me()).username
-    deep_link = f"https://t.me/{bot_username}?start=inscrever"
-    keyboard = [[InlineKeyboardButton("Quero me Inscrever Gratuitamente! 🚀", url=deep_link)]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    reply_markup = identidade_bot['teclado_convite']
     try:
-        await context.bot.send_message(chat_id=GRUPO_ID, text="💎 *Quer receber nossos lançamentos em primeira mão?* 💎\n\nClique no botão abaixo para se inscrever!", reply_markup=reply_markup, parse_mode='MarkdownV2')
-        await message_callable.reply_text("✅ Convite enviado para o grupo!")
-    except Exception as e:
-        logger.error(f"Erro ao enviar convite para o grupo {GRUPO_ID}: {e}")
-        await message_callable.reply_text(f"❌ Erro ao enviar convite. Verifique se o bot está no grupo, se é admin, e se o ID `{GRUPO_ID}` está correto.")
+        chat_id = _grupo_dos_args(update, context.args or [])
+    except ValueError:
+        await message_callable.reply_text("Uso: /convidar [chat_id]")
+        return
+    if chat_id is None:
+        grupos = [linha[0] for linha in await db_fetchall('SELECT chat_id FROM grupos ORDER BY data_adicao')]
+    else:
+        grupos = [chat_id]
+    if not grupos:
+        await message_callable.reply_text("Nenhum grupo cadastrado. Use /add_grupo para cadastrar um.")
+        return
+
+    async def convidar(grupo_id):
+        try:
+            await context.bot.send_message(chat_id=grupo_id, text="💎 *Quer receber nossos lançamentos em primeira mão?* 💎\n\nClique no botão abaixo para se inscrever!", reply_markup=reply_markup, parse_mode='MarkdownV2')
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao enviar convite para o grupo {grupo_id}: {e}")
+            return grupo_id
+
+    falhas = [g for g in await asyncio.gather(*(convidar(g) for g in grupos)) if g is not None]
+    if not falhas:
+        await message_callable.reply_text(f"✅ Convite enviado para {len(grupos)} grupo(s)!")
+    else:
+        await message_callable.reply_text(f"❌ Erro ao enviar convite para {', '.join(f'`{g}`' for g in falhas)}. Verifique se o bot está no grupo, se é admin, e se o ID está correto.",
+                                          parse_mode='Markdown')
 
 async def iniciar_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.effective_user.id not in ADMIN_IDS: return ConversationHandler.END
@@ -328,43 +1933,25 @@ async def iniciar_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return MENSAGEM_BROADCAST
 
 async def receber_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    conn = db_connect()
-    inscritos_ids = []
+    message_to_send = update.message
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id FROM inscritos")
-            inscritos_ids = [row[0] for row in cursor.fetchall()]
+        broadcast_id, total = await db_run(_criar_broadcast, update.effective_chat.id,
+                                           message_to_send.chat_id, message_to_send.message_id)
     except Exception as e:
-        logger.error(f"Erro ao buscar inscritos: {e}")
-    finally:
-        if conn: conn.close()
-    
-    if not inscritos_ids:
+        logger.error(f"Erro ao criar broadcast: {e}")
+        await update.message.reply_text("❌ Erro ao preparar o envio.")
+        return ConversationHandler.END
+
+    if not total:
         await update.message.reply_text("Não há usuários inscritos.")
         return ConversationHandler.END
 
-    message_to_send = update.message
-    await update.message.reply_text(f"Iniciando o envio para {len(inscritos_ids)} inscritos...")
-    sucessos, falhas = 0, 0
-    for user_id in inscritos_ids:
-        try:
-            await message_to_send.forward(chat_id=user_id)
-            sucessos += 1
-            await asyncio.sleep(0.1)
-        except Forbidden:
-            falhas += 1
-            conn_remove = db_connect()
-            try:
-                with conn_remove.cursor() as cursor_remove:
-                    cursor_remove.execute("DELETE FROM inscritos WHERE user_id = %s", (user_id,))
-                conn_remove.commit()
-            finally:
-                if conn_remove: conn_remove.close()
-        except Exception as e:
-            falhas += 1
-            logger.error(f"Erro ao enviar broadcast para {user_id}: {e}")
-    
-    await update.message.reply_text(f"🚀 Envio concluído!\n\n✅ Sucessos: {sucessos}\n❌ Falhas: {falhas}.")
+    progresso = await update.message.reply_text(f"Iniciando o envio para {total} inscritos...")
+    # A partir daqui o broadcast fica visível para as outras réplicas (job_broadcasts)
+    await db_execute("UPDATE broadcasts SET progresso_message_id = %s, status = 'enviando' WHERE id = %s",
+                     (progresso.message_id, broadcast_id))
+    # O envio segue em segundo plano; a mensagem de progresso é editada no lugar
+    context.application.create_task(processar_broadcast(context.bot, broadcast_id), update=update)
     return ConversationHandler.END
 
 async def cancelar_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -372,58 +1959,239 @@ async def cancelar_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ConversationHandler.END
     
 # --- Funções de Admin e Gerenciamento ---
+# As partes de um álbum chegam como mensagens separadas com o mesmo media_group_id;
+# elas são juntadas aqui e salvas como um único post depois de ALBUM_ESPERA segundos.
+# Os posts guardam só fotos: vídeos, arquivos e áudios (soltos ou em álbum) são recusados
+# com um aviso, em vez de o álbum ser salvo sem eles.
+_albuns_pendentes = {}
+
 async def handle_new_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if user_id not in ADMIN_IDS or update.effective_chat.id != user_id: return
     message = update.message
     caption = message.caption if message.caption else message.text
-    photo_file_ids = message.photo[-1].file_id if message.photo else None
+    photo_file_id = message.photo[-1].file_id if message.photo else None
+    outra_midia = bool(message.video or message.document or message.audio)
+
+    if message.media_group_id and (photo_file_id or outra_midia):
+        album = _albuns_pendentes.get(message.media_group_id)
+        if album is None:
+            album = _albuns_pendentes[message.media_group_id] = {'partes': [], 'legenda': None, 'outras_midias': 0}
+            context.job_queue.run_once(job_salvar_album, when=ALBUM_ESPERA, chat_id=message.chat_id,
+                                       data=message.media_group_id, name=f"album_{message.media_group_id}")
+        if photo_file_id:
+            album['partes'].append((message.message_id, photo_file_id))
+        else:
+            album['outras_midias'] += 1
+        album['legenda'] = album['legenda'] or message.caption
+        return
+
+    if outra_midia:
+        await message.reply_text('❌ Erro: Os posts aceitam apenas texto e fotos (vídeos, arquivos e áudios não são salvos).')
+        return
     
     if not caption:
         await message.reply_text('❌ Erro: A postagem deve conter texto.')
         return
 
-    conn = db_connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('INSERT INTO postagens (texto_a, photo_file_ids, data_adicao) VALUES (%s, %s, %s)',
-                           (caption, photo_file_ids, datetime.now().isoformat()))
-        conn.commit()
-        await message.reply_text('✅ Postagem rápida adicionada com sucesso!')
+        _, parecidos = await db_run(_salvar_postagem, [caption], [photo_file_id] if photo_file_id else None)
+        await message.reply_text('✅ Postagem rápida adicionada com sucesso!' + aviso_parecidos(parecidos))
     except Exception as e:
         logger.error(f"Erro ao adicionar post rápido: {e}")
         await message.reply_text('❌ Erro ao adicionar postagem.')
-    finally:
-        if conn: conn.close()
+
+async def job_salvar_album(context: ContextTypes.DEFAULT_TYPE):
+    album = _albuns_pendentes.pop(context.job.data, None)
+    if not album: return
+    chat_id = context.job.chat_id
+    if album['outras_midias']:
+        await context.bot.send_message(chat_id, f"❌ Erro: O álbum tem {album['outras_midias']} vídeo(s) ou arquivo(s); "
+                                                 "só álbuns de fotos podem ser salvos. Nada foi adicionado.")
+        return
+    if not album['legenda']:
+        await context.bot.send_message(chat_id, '❌ Erro: A postagem deve conter texto (legenda em uma das fotos do álbum).')
+        return
+
+    midia_ids = [file_id for _, file_id in sorted(album['partes'])]
+    try:
+        _, parecidos = await db_run(_salvar_postagem, [album['legenda']], midia_ids)
+        await context.bot.send_message(chat_id, f'✅ Álbum com {len(midia_ids)} fotos adicionado com sucesso!' + aviso_parecidos(parecidos))
+    except Exception as e:
+        logger.error(f"Erro ao adicionar álbum: {e}")
+        await context.bot.send_message(chat_id, '❌ Erro ao adicionar postagem.')
+
+def _buscar_links(cursor, links) -> dict:
+    """ Posts de cada link, que também conta como encontrado quando é um trecho de um link salvo. """
+    encontrados = {}
+    for link in links:
+        padrao = '%' + link.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        cursor.execute('SELECT DISTINCT post_id FROM post_links WHERE link LIKE %s ORDER BY post_id', (padrao,))
+        encontrados[link] = [post_id for post_id, in cursor.fetchall()]
+    return encontrados
 
 async def verificar_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS: return
-    url_pattern = re.compile(r'https?://[^\s]+')
-    links_para_verificar = url_pattern.findall(update.message.text)
+    links_para_verificar = extrair_links(update.message.text)
     if not links_para_verificar:
         await update.message.reply_text("Uso: `/verificar https://exemplo.com`")
         return
     
-    conn = db_connect()
     resultados = []
     try:
-        with conn.cursor() as cursor:
-            for link in links_para_verificar:
-                cursor.execute("SELECT id FROM postagens WHERE texto_a LIKE %s OR texto_b LIKE %s", (f'%{link}%', f'%{link}%'))
-                posts_encontrados = cursor.fetchall()
-                if posts_encontrados:
-                    ids_str = ', '.join([str(post[0]) for post in posts_encontrados])
-                    resultados.append(f"*ENCONTRADO*\nO link `{escape_markdown(link, 2)}` está no\\(s\\) post\\(s\\) de ID: *_{ids_str}_*")
-                else:
-                    resultados.append(f"*NÃO ENCONTRADO*\nO link `{escape_markdown(link, 2)}` não está salvo\\.")
+        encontrados = await db_run(_buscar_links, links_para_verificar)
     except Exception as e:
         logger.error(f"Erro ao verificar links: {e}")
         await update.message.reply_text("Ocorreu um erro ao verificar os links.")
-    finally:
-        if conn: conn.close()
-        
+        return
+
+    for link in links_para_verificar:
+        posts_encontrados = encontrados.get(link)
+        if posts_encontrados:
+            ids_str = ', '.join([str(post_id) for post_id in posts_encontrados])
+            resultados.append(f"*ENCONTRADO*\nO link `{escape_markdown(link, 2)}` está no\\(s\\) post\\(s\\) de ID: *_{ids_str}_*")
+        else:
+            resultados.append(f"*NÃO ENCONTRADO*\nO link `{escape_markdown(link, 2)}` não está salvo\\.")
+
     await update.message.reply_text("\n\n---\n\n".join(resultados), parse_mode='MarkdownV2')
 
+def _relatorio_duplicados(cursor):
+    """ Grupos de quase duplicados e o início do texto do primeiro post de cada grupo listado. """
+    grupos = _grupos_duplicados(cursor)
+    cursor.execute('''
+        SELECT DISTINCT ON (post_id) post_id, texto FROM variantes WHERE post_id = ANY(%s) ORDER BY post_id, ordem
+    ''', ([grupo[0] for grupo in grupos[:DUPLICADOS_MAX_GRUPOS]],))
+    return grupos, dict(cursor.fetchall())
+
+async def duplicados(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /duplicados: grupos de posts com texto igual ou parecido em todo o catálogo. """
+    if update.effective_user.id not in ADMIN_IDS: return
+    await update.message.reply_text("🧬 Procurando posts parecidos...")
+    try:
+        grupos, previas = await db_run(_relatorio_duplicados)
+    except Exception as e:
+        logger.error(f"Erro ao procurar posts duplicados: {e}")
+        await update.message.reply_text("Ocorreu um erro ao procurar os posts duplicados.")
+        return
+    if not grupos:
+        await update.message.reply_text("✅ Nenhum post repetido ou parecido no catálogo.")
+        return
+
+    linhas = []
+    for grupo in grupos[:DUPLICADOS_MAX_GRUPOS]:
+        ids = ', '.join(map(str, grupo[:15])) + (f" e mais {len(grupo) - 15}" if len(grupo) > 15 else "")
+        previa = previas.get(grupo[0], '').replace('\n', ' ')
+        previa = previa[:50] + '...' if len(previa) > 50 else previa
+        linhas.append(f"• {ids} — {previa}")
+    texto = (f"🧬 {len(grupos)} grupo(s) de posts parecidos ({sum(len(grupo) for grupo in grupos)} posts, "
+             f"similaridade a partir de {DUPLICADOS_LIMIAR:.0%}):\n\n" + "\n".join(linhas))
+    if len(grupos) > DUPLICADOS_MAX_GRUPOS:
+        texto += f"\n\n... e mais {len(grupos) - DUPLICADOS_MAX_GRUPOS} grupo(s)."
+    texto += "\n\nUse /ver_lista para conferir e /remover <ID> para apagar as cópias."
+    await update.message.reply_text(texto)
+
+# Marcadores dos termos no trecho: caracteres de controle que não aparecem nos posts nem
+# passam pelo escape_markdown, trocados pelo negrito do MarkdownV2 depois do escape
+DESTAQUE_INICIO, DESTAQUE_FIM = '\x01', '\x02'
+
+def _buscar_postagens(cursor, termos: str, deslocamento: int = 0):
+    """ Uma página dos posts que casam com os termos, do mais relevante ao menos, com o trecho destacado. """
+    # A tsquery vai inline (não num CTE): sendo constante, o planejador estima os acertos pelo
+    # índice GIN e escolhe entre ele e a varredura paralela quando o termo está em quase tudo
+    cursor.execute('''
+        WITH acertos AS (
+            -- Cada post aparece uma vez, pela sua variante mais relevante
+            SELECT DISTINCT ON (post_id) post_id, ordem,
+                   ts_rank(busca, websearch_to_tsquery('portuguese', %(termos)s)) AS relevancia
+            FROM variantes
+            WHERE busca @@ websearch_to_tsquery('portuguese', %(termos)s)
+            ORDER BY post_id, relevancia DESC, ordem
+        ),
+        pagina AS (
+            SELECT *, count(*) OVER () AS total FROM acertos
+            ORDER BY relevancia DESC, post_id LIMIT %(limite)s OFFSET %(deslocamento)s
+        )
+        -- O texto e o ts_headline (que relê o texto inteiro) só entram nas linhas da página
+        SELECT p.total, p.post_id, p.ordem,
+               ts_headline('portuguese', v.texto, websearch_to_tsquery('portuguese', %(termos)s), %(opcoes)s)
+        FROM pagina p JOIN variantes v USING (post_id, ordem)
+        ORDER BY p.relevancia DESC, p.post_id
+    ''', {
+        'termos': termos, 'limite': BUSCA_PAGINA, 'deslocamento': deslocamento,
+        'opcoes': f'StartSel={DESTAQUE_INICIO}, StopSel={DESTAQUE_FIM}, MaxWords=15, MinWords=5, '
+                  'MaxFragments=2, FragmentDelimiter=" … "',
+    })
+    linhas = cursor.fetchall()
+    return (linhas[0][0] if linhas else 0), [linha[1:] for linha in linhas]
+
+def montar_pagina_busca(termos: str, deslocamento: int, total: int, resultados):
+    termos_md = escape_markdown(termos, version=2)
+    if not resultados:
+        if deslocamento == 0:
+            return f"🔎 Nenhum post encontrado para _{termos_md}_\\.", None
+        # Página esvaziada por remoções: volta ao começo dos resultados
+        botoes = [[InlineKeyboardButton("⏮️ Início", callback_data="busca_0")]]
+        return f"🔎 Não há mais resultados para _{termos_md}_\\.", InlineKeyboardMarkup(botoes)
+
+    pagina, paginas = deslocamento // BUSCA_PAGINA + 1, -(-total // BUSCA_PAGINA)
+    texto = f"🔎 *{total} post\\(s\\) para* _{termos_md}_ \\(página {pagina} de {paginas}\\):\n\n"
+    for post_id, ordem, trecho in resultados:
+        versao = f" \\(versão {letra_variante(ordem)}\\)" if ordem else ""
+        trecho = escape_markdown(trecho.replace('\n', ' '), version=2)
+        trecho = trecho.replace(DESTAQUE_INICIO, '*').replace(DESTAQUE_FIM, '*')
+        texto += f"*ID:* `{post_id}`{versao} — {trecho}\n\n"
+    texto += "Para ver um post inteiro, use /ver\\_lista e envie o ID\\."
+
+    botoes = []
+    if deslocamento > 0:
+        botoes.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"busca_{max(deslocamento - BUSCA_PAGINA, 0)}"))
+    if deslocamento + len(resultados) < total:
+        botoes.append(InlineKeyboardButton("Próxima ▶️", callback_data=f"busca_{deslocamento + BUSCA_PAGINA}"))
+    return texto, InlineKeyboardMarkup([botoes]) if botoes else None
+
+async def buscar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /buscar <termos>: posts que citam os termos, por relevância, com os trechos encontrados. """
+    if update.effective_user.id not in ADMIN_IDS: return
+    termos = ' '.join(context.args)
+    if not termos:
+        await update.message.reply_text(
+            'Uso: `/buscar <termos>`\n\nAceita frases entre aspas, `or` entre alternativas e `-palavra` para excluir.',
+            parse_mode='Markdown')
+        return
+    try:
+        total, resultados = await db_run(_buscar_postagens, termos)
+    except Exception as e:
+        logger.error(f"Erro ao buscar posts: {e}")
+        await update.message.reply_text("Ocorreu um erro ao buscar os posts.")
+        return
+    # Os botões de página só levam o deslocamento (o callback_data tem 64 bytes); os termos ficam aqui
+    context.user_data['busca'] = termos
+    texto, reply_markup = montar_pagina_busca(termos, 0, total, resultados)
+    await update.message.reply_text(texto, reply_markup=reply_markup, parse_mode='MarkdownV2')
+
+async def paginar_busca(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Navegação do /buscar: edita a mesma mensagem com outra página de resultados. """
+    query = update.callback_query
+    await query.answer()
+    if update.effective_user.id not in ADMIN_IDS: return
+    termos = context.user_data.get('busca')
+    if not termos:
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("Essa busca expirou. Use /buscar <termos> de novo.")
+        return
+    deslocamento = int(query.data.split('_')[1])
+    try:
+        total, resultados = await db_run(_buscar_postagens, termos, deslocamento)
+    except Exception as e:
+        logger.error(f"Erro ao paginar busca: {e}")
+        return
+
+    texto, reply_markup = montar_pagina_busca(termos, deslocamento, total, resultados)
+    try:
+        await query.edit_message_text(texto, reply_markup=reply_markup, parse_mode='MarkdownV2')
+    except BadRequest as e:
+        logger.debug(f"Página da busca não alterada: {e}")
+
 async def gerar_lista_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
     if update.effective_user.id not in ADMIN_IDS: return
@@ -431,34 +2199,33 @@ async def gerar_lista_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
         await update.callback_query.answer()
 
-    await message_callable.reply_text("🔎 Lendo todos os posts...")
-    conn = db_connect()
-    postagens = []
+    if context.args and context.args[0].lower() == 'arquivo':
+        await exportar_lista_links(update, context)
+        return
+
+    await message_callable.reply_text("🔎 Lendo o catálogo de links...")
+    def _carregar_links(cursor):
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM postagens), (SELECT COUNT(*) FROM post_links)')
+        tem_posts, total_links = cursor.fetchone()
+        # Ordem da primeira aparição, como na lista gerada a partir dos textos
+        cursor.execute('SELECT link FROM post_links GROUP BY link ORDER BY MIN(post_id), link')
+        return tem_posts, total_links, [row[0] for row in cursor.fetchall()]
+
+    tem_posts, total_links, unique_links = False, 0, []
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT texto_a, texto_b FROM postagens ORDER BY id ASC')
-            postagens = cursor.fetchall()
+        tem_posts, total_links, unique_links = await db_run(_carregar_links)
     except Exception as e:
         logger.error(f"Erro ao gerar lista de links: {e}")
-    finally:
-        if conn: conn.close()
 
-    if not postagens:
+    if not tem_posts:
         await message_callable.reply_text("A lista de postagens está vazia.")
         return
     
-    all_links = []
-    url_pattern = re.compile(r'https?://[^\s]+')
-    for texto_a, texto_b in postagens:
-        if texto_a: all_links.extend(url_pattern.findall(texto_a))
-        if texto_b: all_links.extend(url_pattern.findall(texto_b))
-    
-    if not all_links:
+    if not unique_links:
         await message_callable.reply_text("Nenhum link foi encontrado.")
         return
 
-    unique_links = list(dict.fromkeys(all_links))
-    await message_callable.reply_text(f"✅ Encontrados {len(all_links)} links, gerando lista com {len(unique_links)} links únicos...")
+    await message_callable.reply_text(f"✅ Encontrados {total_links} links, gerando lista com {len(unique_links)} links únicos...")
     header = "BÔNUS\nSAQUE CAI RAPIDINHO\n\n"
     message_chunk = header
     for link in unique_links:
@@ -469,96 +2236,629 @@ async def gerar_lista_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if message_chunk.strip() != header.strip() and message_chunk.strip() != "":
         await message_callable.reply_text(message_chunk)
 
-async def job_send_post(context: ContextTypes.DEFAULT_TYPE):
-    conn = db_connect()
-    all_post_ids = []
+def _exportar_links(cursor, arquivo):
+    """ Grava os links únicos no arquivo lendo o catálogo por um cursor no servidor. """
+    total = 0
+    with cursor.connection.cursor(name='exportar_links') as leitura:
+        leitura.itersize = 2000
+        leitura.execute('SELECT link FROM post_links GROUP BY link ORDER BY MIN(post_id), link')
+        for (link,) in leitura:
+            arquivo.write(f"{link}\n".encode())
+            total += 1
+    return total
+
+async def exportar_lista_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Envia a lista de links únicos como um único documento .txt, sem carregá-la na memória. """
+    message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
+    if update.effective_user.id not in ADMIN_IDS: return
+
+    if update.callback_query:
+        await update.callback_query.answer()
+
+    await message_callable.reply_text("🔎 Exportando o catálogo de links...")
+    # Até 1 MB fica em memória; acima disso o conteúdo vai para um arquivo temporário
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as arquivo:
+        arquivo.write("BÔNUS\nSAQUE CAI RAPIDINHO\n\n".encode())
+        try:
+            total = await db_run(_exportar_links, arquivo)
+        except Exception as e:
+            logger.error(f"Erro ao exportar lista de links: {e}")
+            await message_callable.reply_text("❌ Erro ao exportar os links.")
+            return
+        if not total:
+            await message_callable.reply_text("Nenhum link foi encontrado.")
+            return
+        arquivo.seek(0)
+        await message_callable.reply_document(document=arquivo, filename=f"links_{datetime.now():%Y%m%d_%H%M}.txt",
+                                              caption=f"✅ {total} links únicos.")
+
+# --- Importação e Exportação de Posts ---
+# /importar recebe um CSV (colunas texto_a, texto_b, ..., peso_a, peso_b, ..., selecao e
+# midia_ids; só texto_a é obrigatória), um JSONL (um objeto por linha com as mesmas
+# chaves, ou com a lista "variantes") ou um .json com a lista desses objetos e grava tudo numa única transação: o arquivo inteiro
+# é validado antes, e qualquer erro cancela a importação. Os IDs são reservados na sequência
+# e posts, variantes, links e rotação entram por COPY / INSERT ... SELECT, sem um round trip
+# por post. /exportar gera o mesmo formato, lendo o catálogo direto do banco para o arquivo.
+CAMPOS_IMPORTACAO = ('variantes', 'selecao', 'midia_ids')
+IMPORTAR_MAX_ERROS = 10
+
+def _variantes_do_registro(registro: dict) -> list:
+    """ Variantes (ordem, texto, peso) de um registro: lista "variantes" ou colunas texto_<letra>/peso_<letra>. """
+    if 'variantes' in registro:
+        lista = registro['variantes']
+        if not isinstance(lista, list):
+            raise ValueError("variantes deve ser uma lista")
+        brutas = []
+        for ordem, item in enumerate(lista):
+            if isinstance(item, str): item = {'texto': item}
+            if not isinstance(item, dict):
+                raise ValueError("cada variante deve ser um texto ou um objeto com texto e peso")
+            brutas.append((ordem, item.get('texto'), item.get('peso')))
+    else:
+        brutas = [(ordem, registro.get(f'texto_{letra_variante(ordem).lower()}'), registro.get(f'peso_{letra_variante(ordem).lower()}'))
+                  for ordem in range(26)]
+        # Nas colunas, célula vazia é variante ausente, mas só no fim: as letras começam
+        # em A e não pulam nenhuma, como nos posts salvos pelo bot
+        brutas = [(ordem, texto, peso) for ordem, texto, peso in brutas if texto]
+        if brutas and brutas[-1][0] != len(brutas) - 1:
+            falta = min(set(range(brutas[-1][0])) - {ordem for ordem, *_ in brutas})
+            raise ValueError(f"texto_{letra_variante(falta).lower()} vazio antes de "
+                             f"texto_{letra_variante(brutas[-1][0]).lower()}")
+
+    variantes = []
+    for ordem, texto, peso in brutas:
+        letra = letra_variante(ordem)
+        if not isinstance(texto, str) or not texto.strip():
+            raise ValueError(f"variante {letra} sem texto")
+        try:
+            peso = int(peso) if peso not in (None, '') else 1
+        except (TypeError, ValueError):
+            raise ValueError(f"peso inválido na variante {letra}")
+        if peso <= 0:
+            raise ValueError(f"peso inválido na variante {letra}")
+        variantes.append((ordem, texto.strip(), peso))
+    if not variantes:
+        raise ValueError("post sem texto (texto_a vazio)")
+    if len(variantes) > VARIANTES_MAX:
+        raise ValueError(f"mais de {VARIANTES_MAX} variantes")
+    return variantes
+
+def _ler_importacao(dados: bytes, formato: str):
+    """ Converte o arquivo em posts (variantes, selecao, midia_ids, links, impressoes) e lista os erros por linha. """
+    texto = dados.decode('utf-8-sig')
+    if formato == 'csv':
+        leitor = csv.DictReader(io.StringIO(texto, newline=''))
+        if 'texto_a' not in (leitor.fieldnames or []):
+            return [], ["o cabeçalho do CSV precisa da coluna texto_a"]
+        # Linha do arquivo onde cada registro começa (textos podem ter quebras de linha)
+        registros = ((leitor.line_num, registro) for registro in leitor)
+    elif formato == 'json' and texto.lstrip().startswith('['):
+        try:
+            registros = json.loads(texto)
+        except ValueError as e:
+            return [], [f"JSON inválido: {e}"]
+        # Num .json os erros apontam o item da lista, não a linha do arquivo
+        registros = enumerate(registros, 1)
+    else:
+        # Um .json que não é uma lista é lido como JSONL (um objeto por linha)
+        formato = 'jsonl'
+        registros = ((numero, linha) for numero, linha in enumerate(texto.splitlines(), 1) if linha.strip())
+    rotulo = 'item' if formato == 'json' else 'linha'
+
+    posts, erros = [], []
+    for numero, registro in registros:
+        try:
+            if formato == 'jsonl':
+                registro = json.loads(registro)
+            if not isinstance(registro, dict):
+                raise ValueError(f"cada {rotulo} deve ser um objeto JSON")
+            variantes = _variantes_do_registro(registro)
+            selecao = registro.get('selecao') or 'alternada'
+            if selecao not in ('alternada', 'sorteio'):
+                raise ValueError("selecao deve ser alternada ou sorteio")
+            midia_ids = registro.get('midia_ids') or []
+            if isinstance(midia_ids, str):
+                midia_ids = midia_ids.split()
+            if not isinstance(midia_ids, list) or not all(isinstance(m, str) and m for m in midia_ids):
+                raise ValueError("midia_ids deve ser uma lista de file_ids")
+            if len(midia_ids) > 10:
+                raise ValueError("um álbum tem no máximo 10 fotos")
+            # Legendas de foto vão até 1024 caracteres; mensagens de texto, até 4096
+            limite = 1024 if midia_ids else 4096
+            if any(len(texto) > limite for _, texto, _ in variantes):
+                raise ValueError(f"texto acima de {limite} caracteres")
+            links = extrair_links(*[texto for _, texto, _ in variantes])
+            invalidos = [link for link in links if not link_valido(link)]
+            if invalidos:
+                raise ValueError(f"link inválido: {invalidos[0]}")
+            impressoes = [(ordem, *impressao) for ordem, texto, _ in variantes if (impressao := impressao_digital(texto))]
+            posts.append((variantes, selecao, midia_ids, links, impressoes))
+        except ValueError as e:
+            erros.append(f"{rotulo} {numero}: {e}")
+    return posts, erros
+
+def _array_pg(valores) -> str:
+    """ Literal de array do PostgreSQL (para o COPY). """
+    return '{' + ','.join('"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for v in valores) + '}'
+
+def _importar_postagens(cursor, posts):
+    """
+    Grava os posts, suas variantes, links e impressões digitais e a entrada na rotação de
+    cada grupo. Retorna (posts, links, posts com texto repetido).
+    """
+    cursor.execute("SELECT nextval(pg_get_serial_sequence('postagens', 'id')) FROM generate_series(1, %s)", (len(posts),))
+    ids = [row[0] for row in cursor.fetchall()]
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for post_id, (_, selecao, midia_ids, *_) in zip(ids, posts):
+        escritor.writerow((post_id, selecao, _array_pg(midia_ids) if midia_ids else None))
+    buffer.seek(0)
+    cursor.copy_expert('COPY postagens (id, selecao, midia_ids) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for post_id, (variantes, *_) in zip(ids, posts):
+        for ordem, texto, peso in variantes:
+            escritor.writerow((post_id, ordem, texto, peso))
+    buffer.seek(0)
+    cursor.copy_expert('COPY variantes (post_id, ordem, texto, peso) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    total_links = 0
+    for post_id, (*_, links, _) in zip(ids, posts):
+        for link in links:
+            escritor.writerow((post_id, link))
+            total_links += 1
+    buffer.seek(0)
+    cursor.copy_expert('COPY post_links (post_id, link) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for post_id, (*_, impressoes) in zip(ids, posts):
+        for ordem, hash_texto, minhash, bandas in impressoes:
+            escritor.writerow((post_id, ordem, hash_texto, '{' + ','.join(map(str, minhash)) + '}', '{' + ','.join(map(str, bandas)) + '}'))
+    buffer.seek(0)
+    cursor.copy_expert('COPY impressoes (post_id, ordem, hash_texto, minhash, bandas) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    # Como em _salvar_postagem: em cada grupo, os posts novos entram na rodada atual. A rodada
+    # é calculada uma vez por grupo; por linha, o MIN varreria as entradas que o próprio INSERT cria.
+    cursor.execute('''
+        WITH atual AS MATERIALIZED (
+            SELECT g.chat_id, COALESCE((SELECT MIN(r.rodada) FROM grupo_rotacao r WHERE r.chat_id = g.chat_id), 0) AS rodada
+            FROM grupos g
+        )
+        INSERT INTO grupo_rotacao (chat_id, post_id, rodada)
+        SELECT atual.chat_id, p.id, atual.rodada FROM atual CROSS JOIN unnest(%s::int[]) AS p(id)
+    ''', (ids,))
+    # Só as cópias exatas (texto normalizado igual), que saem direto do índice; as parecidas ficam para o /duplicados
+    cursor.execute('''
+        SELECT COUNT(DISTINCT i.post_id) FROM impressoes i
+        JOIN impressoes o ON o.hash_texto = i.hash_texto AND o.post_id <> i.post_id
+        WHERE i.post_id = ANY(%s)
+    ''', (ids,))
+    return len(ids), total_links, cursor.fetchone()[0]
+
+async def importar_postagens(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Documento .csv, .jsonl ou .json enviado por um admin com a legenda /importar. """
+    message = update.message
+    if update.effective_user.id not in ADMIN_IDS: return
+    documento = message.document if message else None
+    if not documento:
+        await message.reply_text("Envie um arquivo .csv (colunas texto_a, texto_b, ..., peso_a, peso_b, ..., selecao, "
+                                 "midia_ids), .jsonl (um objeto por linha com as mesmas chaves, ou com a lista "
+                                 "\"variantes\") ou .json (uma lista desses objetos) com a legenda /importar.\n\n"
+                                 "Use /exportar para ver um exemplo do formato.")
+        return
+    nome = (documento.file_name or '').lower()
+    formato = ('csv' if nome.endswith('.csv') else 'jsonl' if nome.endswith(('.jsonl', '.ndjson'))
+               else 'json' if nome.endswith('.json') else None)
+    if not formato:
+        await message.reply_text("❌ Formato não reconhecido: envie um arquivo .csv, .jsonl ou .json.")
+        return
+    if documento.file_size and documento.file_size > IMPORTAR_MAX_BYTES:
+        await message.reply_text(f"❌ Arquivo grande demais (máximo de {IMPORTAR_MAX_BYTES // (1024 * 1024)} MB).")
+        return
+
+    await message.reply_text("📥 Lendo o arquivo...")
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT id FROM postagens')
-            all_post_ids = [row[0] for row in cursor.fetchall()]
+        arquivo = await documento.get_file()
+        dados = bytes(await arquivo.download_as_bytearray())
+        posts, erros = await asyncio.to_thread(_ler_importacao, dados, formato)
+    except (UnicodeDecodeError, csv.Error) as e:
+        await message.reply_text(f"❌ Não foi possível ler o arquivo (use UTF-8): {e}")
+        return
     except Exception as e:
-        logger.error(f"Erro no job ao buscar IDs: {e}")
-    finally:
-        if conn: conn.close()
-    
-    if not all_post_ids: return
-    
-    sent_ids = context.bot_data.get('sent_ids', set())
-    available_ids = [pid for pid in all_post_ids if pid not in sent_ids]
-    if not available_ids:
-        sent_ids = set()
-        available_ids = all_post_ids
-        for admin_id in ADMIN_IDS: await context.bot.send_message(chat_id=admin_id, text="🔄 Ciclo de postagens concluído.")
-    if not available_ids: return
-    post_id = random.choice(available_ids)
-    
-    conn = db_connect()
-    postagem = None
+        logger.error(f"Erro ao baixar o arquivo de importação: {e}")
+        await message.reply_text("❌ Erro ao baixar o arquivo.")
+        return
+
+    if erros:
+        linhas = "\n".join(erros[:IMPORTAR_MAX_ERROS])
+        extras = f"\n... e mais {len(erros) - IMPORTAR_MAX_ERROS} erro(s)" if len(erros) > IMPORTAR_MAX_ERROS else ""
+        await message.reply_text(f"❌ Nada foi importado: {len(erros)} erro(s) no arquivo.\n\n{linhas}{extras}")
+        return
+    if not posts:
+        await message.reply_text("O arquivo não tem nenhum post.")
+        return
+
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT id, texto_a, texto_b, last_sent, photo_file_ids FROM postagens WHERE id = %s', (post_id,))
-            postagem = cursor.fetchone()
+        inicio = time.perf_counter()
+        total, total_links, repetidos = await db_run(_importar_postagens, posts)
     except Exception as e:
-        logger.error(f"Erro no job ao buscar postagem {post_id}: {e}")
-    finally:
-        if conn: conn.close()
-        
-    if not postagem: return
+        logger.error(f"Erro ao importar posts: {e}")
+        await message.reply_text("❌ Erro ao gravar os posts. Nada foi importado.")
+        return
+    logger.info(f"{total} posts importados ({total_links} links) em {time.perf_counter() - inicio:.2f}s.")
+    aviso = f"\n\n⚠️ {repetidos} deles repetem o texto de outros posts. Confira com /duplicados." if repetidos else ""
+    await message.reply_text(f"✅ {total} posts importados, com {total_links} links.{aviso}")
+
+def _exportar_postagens(cursor, arquivo, formato):
+    """ Grava o catálogo no arquivo, em ordem de ID, sem carregá-lo na memória. """
+    if formato == 'csv':
+        # Uma coluna texto_<letra>/peso_<letra> por variante, até a maior letra em uso. O total
+        # vem de um COUNT: o rowcount do COPY ... TO STDOUT depende da versão do psycopg2
+        cursor.execute('SELECT COALESCE(MAX(ordem), 0), (SELECT COUNT(*) FROM postagens) FROM variantes')
+        maior_ordem, total = cursor.fetchone()
+        colunas = ', '.join(
+            f"max(v.texto) FILTER (WHERE v.ordem = {ordem}) AS texto_{letra_variante(ordem).lower()}, "
+            f"max(v.peso) FILTER (WHERE v.ordem = {ordem}) AS peso_{letra_variante(ordem).lower()}"
+            for ordem in range(maior_ordem + 1))
+        cursor.copy_expert(f'''
+            COPY (SELECT {colunas}, p.selecao, array_to_string(p.midia_ids, ' ') AS midia_ids
+                  FROM postagens p JOIN variantes v ON v.post_id = p.id
+                  GROUP BY p.id ORDER BY p.id)
+            TO STDOUT WITH (FORMAT csv, HEADER)
+        ''', arquivo)
+        return total
+    total = 0
+    with cursor.connection.cursor(name='exportar_postagens') as leitura:
+        leitura.itersize = 2000
+        leitura.execute('''
+            SELECT json_agg(json_build_object('texto', v.texto, 'peso', v.peso) ORDER BY v.ordem), p.selecao, p.midia_ids
+            FROM postagens p JOIN variantes v ON v.post_id = p.id
+            GROUP BY p.id ORDER BY p.id
+        ''')
+        for linha in leitura:
+            arquivo.write((json.dumps(dict(zip(CAMPOS_IMPORTACAO, linha)), ensure_ascii=False) + "\n").encode())
+            total += 1
+    return total
+
+async def exportar_postagens(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /exportar [csv|jsonl]: envia todos os posts no formato aceito pelo /importar. """
+    if update.effective_user.id not in ADMIN_IDS: return
+    formato = (context.args[0].lower() if context.args else 'jsonl')
+    if formato not in ('csv', 'jsonl'):
+        await update.message.reply_text("Uso: /exportar [csv|jsonl]")
+        return
 
+    await update.message.reply_text("📤 Exportando os posts...")
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as arquivo:
+        try:
+            total = await db_run(_exportar_postagens, arquivo, formato)
+        except Exception as e:
+            logger.error(f"Erro ao exportar posts: {e}")
+            await update.message.reply_text("❌ Erro ao exportar os posts.")
+            return
+        if not total:
+            await update.message.reply_text("A lista de postagens está vazia.")
+            return
+        arquivo.seek(0)
+        await update.message.reply_document(document=arquivo, filename=f"posts_{datetime.now():%Y%m%d_%H%M}.{formato}",
+                                            caption=f"✅ {total} posts.")
+
+# --- Grupos de Destino ---
+# Cada grupo cadastrado tem intervalo, pausa e rotação próprios. O limite de mensagens
+# por grupo é aplicado pela fila de envios (limite_do_grupo).
+def _adicionar_grupo(cursor, chat_id: int, titulo: str, intervalo: int = None) -> bool:
+    """ Cadastra (ou atualiza) um grupo; um grupo novo entra com todos os posts na rotação. Retorna se é novo. """
+    cursor.execute('''
+        INSERT INTO grupos (chat_id, titulo, intervalo) VALUES (%(chat_id)s, %(titulo)s, COALESCE(%(intervalo)s, 3600))
+        ON CONFLICT (chat_id) DO UPDATE SET titulo = EXCLUDED.titulo, intervalo = COALESCE(%(intervalo)s, grupos.intervalo)
+        RETURNING xmax = 0
+    ''', {'chat_id': chat_id, 'titulo': titulo, 'intervalo': intervalo})
+    novo = cursor.fetchone()[0]
+    if novo:
+        cursor.execute('INSERT INTO grupo_rotacao (chat_id, post_id) SELECT %s, id FROM postagens', (chat_id,))
+    return novo
+
+def _grupo_dos_args(update: Update, args: list, posicao: int = 0):
+    """ chat_id do grupo nos argumentos (ou o próprio grupo, se o comando veio dele); None = todos. """
+    if len(args) > posicao:
+        return int(args[posicao])
+    if update.effective_chat and update.effective_chat.type in ('group', 'supergroup'):
+        return update.effective_chat.id
+    return None
+
+async def add_grupo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS: return
     try:
-        post_id, texto_a, texto_b, last_sent, photo_file_ids = postagem
-        texto_para_enviar, proximo_last_sent = texto_a, 'A'
-        if texto_b:
-            if last_sent == 'A':
-                texto_para_enviar, proximo_last_sent = texto_b, 'B'
-        
-        if photo_file_ids:
-            await context.bot.send_photo(chat_id=GRUPO_ID, photo=photo_file_ids, caption=texto_para_enviar)
-        else:
-            await context.bot.send_message(chat_id=GRUPO_ID, text=texto_para_enviar)
-        
-        logger.info(f"Postagem {post_id} (Versão {proximo_last_sent}) enviada.")
-        if texto_b:
-            conn_update = db_connect()
-            try:
-                with conn_update.cursor() as cursor_update:
-                    cursor_update.execute("UPDATE postagens SET last_sent = %s WHERE id = %s", (proximo_last_sent, post_id))
-                conn_update.commit()
-            finally:
-                if conn_update: conn_update.close()
-        
-        sent_ids.add(post_id)
-        context.bot_data['sent_ids'] = sent_ids
+        chat_id = _grupo_dos_args(update, context.args)
+        if chat_id is None: raise ValueError
+        intervalo = int(context.args[1]) * 60 if len(context.args) > 1 else None
+        if intervalo is not None and intervalo <= 0: raise ValueError
+    except ValueError:
+        await update.message.reply_text("Uso: /add_grupo <chat_id> [minutos] (ou /add_grupo dentro do grupo)")
+        return
+    try:
+        chat = await context.bot.get_chat(chat_id)
+    except Exception as e:
+        logger.error(f"Erro ao consultar o grupo {chat_id}: {e}")
+        await update.message.reply_text(f"❌ Não encontrei o grupo `{chat_id}`. Verifique se o bot está nele e se o ID está correto.", parse_mode='Markdown')
+        return
+    try:
+        novo = await db_run(_adicionar_grupo, chat_id, chat.title, intervalo)
     except Exception as e:
-        logger.error(f"Erro ao enviar postagem {post_id}: {e}")
+        logger.error(f"Erro ao cadastrar o grupo {chat_id}: {e}")
+        await update.message.reply_text("❌ Erro ao cadastrar o grupo.")
+        return
+    acao = "cadastrado (pausado; use /ativar para começar)" if novo else "atualizado"
+    await update.message.reply_text(f"✅ Grupo {chat.title or chat_id} {acao}.")
 
-async def ativar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
+async def remover_grupo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS: return
+    try:
+        chat_id = _grupo_dos_args(update, context.args)
+        if chat_id is None: raise ValueError
+    except ValueError:
+        await update.message.reply_text("Uso: /remover_grupo <chat_id>")
+        return
+    rows_affected = await db_execute('DELETE FROM grupos WHERE chat_id = %s', (chat_id,))
+    if rows_affected > 0: await update.message.reply_text(f"✅ Grupo {chat_id} removido.")
+    else: await update.message.reply_text(f"❌ Nenhum grupo cadastrado com o ID {chat_id}.")
+
+# --- Variantes dos Posts ---
+# Cada post tem uma ou mais variantes de texto (A, B, C...). Em 'alternada' o grupo faz
+# um rodízio ponderado pelos pesos a partir da vez do post (quantas vezes já saiu ali);
+# em 'sorteio' cada envio sorteia a variante pelos pesos. Os envios por variante são
+# contados em memória e gravados em lote pelo job_gravar_envios_variantes.
+_envios_variantes = Counter()
+
+def letra_variante(ordem: int) -> str:
+    return chr(ord('A') + ordem)
+
+def escolher_variante(variantes, vez: int, selecao: str):
+    """ Escolhe uma das variantes (ordem, texto, peso) do post. """
+    if selecao == 'sorteio':
+        return random.choices(variantes, weights=[peso for _, _, peso in variantes])[0]
+    posicao = vez % sum(peso for _, _, peso in variantes)
+    for variante in variantes:
+        posicao -= variante[2]
+        if posicao < 0: return variante
+
+def _gravar_envios_variantes(cursor, contagens: dict):
+    execute_values(cursor, '''
+        UPDATE variantes v SET envios = v.envios + c.envios
+        FROM (VALUES %s) AS c (post_id, ordem, envios)
+        WHERE v.post_id = c.post_id AND v.ordem = c.ordem
+    ''', [(post_id, ordem, envios) for (post_id, ordem), envios in contagens.items()], page_size=1000)
+
+async def gravar_envios_variantes():
+    """ Grava numa transação os envios contados desde a última gravação. """
+    if not _envios_variantes: return
+    contagens = dict(_envios_variantes)
+    _envios_variantes.clear()
+    try:
+        await db_run(_gravar_envios_variantes, contagens)
+    except Exception as e:
+        # Volta para o contador e entra na próxima gravação
+        _envios_variantes.update(contagens)
+        logger.error(f"Erro ao gravar os envios das variantes: {e}")
+
+async def job_gravar_envios_variantes(context: ContextTypes.DEFAULT_TYPE):
+    await gravar_envios_variantes()
+
+def _variantes_do_post(cursor, post_id: int):
+    """ Trava o post e retorna (selecao, midia_ids, [(ordem, texto, peso, envios)]); selecao None se não existe. """
+    cursor.execute('SELECT selecao, midia_ids FROM postagens WHERE id = %s FOR UPDATE', (post_id,))
+    linha = cursor.fetchone()
+    if not linha: return None, None, []
+    cursor.execute('SELECT ordem, texto, peso, envios FROM variantes WHERE post_id = %s ORDER BY ordem', (post_id,))
+    return linha[0], linha[1], cursor.fetchall()
+
+def _editar_variantes(cursor, post_id: int, acao: str = None, argumento=None):
+    """
+    Aplica uma ação do /variantes ('modo', 'peso', 'nova' ou 'remover') e retorna as
+    variantes já atualizadas mais os posts parecidos com a variante nova (ver _posts_parecidos),
+    ou None se o post não existe. Ação inválida: ValueError.
+    """
+    selecao, midia_ids, variantes = _variantes_do_post(cursor, post_id)
+    if selecao is None: return None
+    parecidos = []
+    ordens = {letra_variante(ordem): ordem for ordem, *_ in variantes}
+    if acao in ('peso', 'remover') and argumento[0] not in ordens:
+        raise ValueError(f"o post {post_id} não tem a variante {argumento[0]}")
+    if acao == 'modo':
+        cursor.execute('UPDATE postagens SET selecao = %s WHERE id = %s', (argumento, post_id))
+    elif acao == 'peso':
+        cursor.execute('UPDATE variantes SET peso = %s WHERE post_id = %s AND ordem = %s',
+                       (argumento[1], post_id, ordens[argumento[0]]))
+    elif acao == 'nova':
+        limite = 1024 if midia_ids else 4096
+        if len(variantes) >= VARIANTES_MAX:
+            raise ValueError(f"o post {post_id} já tem o máximo de {VARIANTES_MAX} variantes")
+        if len(argumento) > limite:
+            raise ValueError(f"o texto passa de {limite} caracteres")
+        ordem = min(set(range(26)) - set(ordens.values()))
+        cursor.execute('INSERT INTO variantes (post_id, ordem, texto) VALUES (%s, %s, %s)', (post_id, ordem, argumento))
+        _indexar_links(cursor, post_id, argumento)
+        impressoes = _indexar_impressoes(cursor, post_id, [(ordem, argumento)])
+        parecidos = _posts_parecidos(cursor, post_id, impressoes, extrair_links(argumento))
+    elif acao == 'remover':
+        if len(variantes) == 1:
+            raise ValueError("o post precisa de pelo menos uma variante")
+        cursor.execute('DELETE FROM variantes WHERE post_id = %s AND ordem = %s', (post_id, ordens[argumento[0]]))
+        # Os links que só estavam na variante removida saem do catálogo
+        cursor.execute('DELETE FROM post_links WHERE post_id = %s', (post_id,))
+        _indexar_links(cursor, post_id, *[texto for ordem, texto, *_ in variantes if ordem != ordens[argumento[0]]])
+    return (*_variantes_do_post(cursor, post_id), parecidos)
+
+# --- Rotação das Postagens ---
+# Cada grupo guarda, para cada post, a rodada (ciclo) em que ele está e um sorteio
+# aleatório. O próximo post do grupo é o de menor sorteio na menor rodada, via índice
+# (chat_id, rodada, sorteio); ao ser enviado ele passa para a rodada seguinte com novo
+# sorteio. O ciclo do grupo termina quando a rodada esvazia.
+def _reservar_proxima_postagem(cursor, chat_id: int):
+    """
+    Escolhe, trava e avança o próximo post do grupo (rodada, sorteio e vez) numa única
+    instrução. Retorna o post com suas variantes, a vez anterior e se o ciclo atual terminou.
+    """
+    cursor.execute('''
+        WITH proxima AS (
+            SELECT post_id FROM grupo_rotacao
+            WHERE chat_id = %(chat_id)s
+              AND rodada = (SELECT MIN(rodada) FROM grupo_rotacao WHERE chat_id = %(chat_id)s)
+            ORDER BY sorteio LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ), enviada AS (
+            UPDATE grupo_rotacao r
+            SET rodada = r.rodada + 1, sorteio = random(), vez = r.vez + 1
+            FROM proxima, postagens p
+            WHERE r.chat_id = %(chat_id)s AND r.post_id = proxima.post_id AND p.id = r.post_id
+            RETURNING r.post_id, r.vez - 1 AS vez, p.selecao, p.midia_ids, r.rodada - 1 AS rodada_anterior
+        )
+        SELECT post_id,
+               (SELECT json_agg(json_build_array(ordem, texto, peso) ORDER BY ordem)
+                FROM variantes WHERE post_id = enviada.post_id),
+               vez, selecao, midia_ids,
+               NOT EXISTS (SELECT 1 FROM grupo_rotacao
+                           WHERE chat_id = %(chat_id)s AND rodada = enviada.rodada_anterior AND post_id <> enviada.post_id)
+        FROM enviada
+    ''', {'chat_id': chat_id})
+    return cursor.fetchone()
+
+def _reservar_grupos_vencidos(cursor, ocupados: list) -> list:
+    """ Marca o próximo horário dos grupos ativos com envio vencido e os retorna com o horário previsto. """
+    # Atraso menor que um intervalo mantém a cadência; depois de uma parada longa, recomeça de agora
+    cursor.execute('''
+        UPDATE grupos g
+        SET proximo_envio = CASE WHEN v.proximo_envio + make_interval(secs => g.intervalo) > now()
+                                 THEN v.proximo_envio + make_interval(secs => g.intervalo)
+                                 ELSE now() + make_interval(secs => g.intervalo) END
+        FROM (SELECT chat_id, proximo_envio FROM grupos
+              WHERE ativo AND proximo_envio <= now() AND chat_id <> ALL(%s::bigint[])
+              FOR UPDATE SKIP LOCKED) v
+        WHERE g.chat_id = v.chat_id
+        RETURNING g.chat_id, g.titulo, v.proximo_envio
+    ''', (ocupados,))
+    return cursor.fetchall()
+
+# Grupos com um post em andamento ficam de fora dos ticks seguintes (sem fila de posts
+# atrasados), e no máximo GRUPOS_CONCORRENCIA posts seguram conexão ao mesmo tempo
+_grupos_postando = set()
+_envios_grupos = asyncio.Semaphore(GRUPOS_CONCORRENCIA)
 
-    if update.callback_query:
-        await update.callback_query.answer()
-        
-    if context.job_queue.get_jobs_by_name("postagem_automatica"):
-        await message_callable.reply_text("O envio automático já está ativo.")
+async def job_send_post(context: ContextTypes.DEFAULT_TYPE):
+    """ Tick do agendador: dispara, em paralelo, o post de cada grupo com envio vencido. """
+    if not coordenacao['lider']: return
+    try:
+        vencidos = await db_run(_reservar_grupos_vencidos, list(_grupos_postando))
+    except Exception as e:
+        logger.error(f"Erro ao consultar os grupos com envio vencido: {e}")
         return
-    intervalo_segundos = context.bot_data.get('intervalo', 3600)
-    context.job_queue.run_repeating(job_send_post, interval=intervalo_segundos, first=1, name="postagem_automatica")
-    await message_callable.reply_text(f'✅ Envio automático ativado!')
 
-async def pausar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def postar(chat_id, titulo, previsto):
+        try:
+            METRICA_JOB_ATRASO.observe(max(0.0, time.time() - previsto.timestamp()))
+            METRICA_JOB_ENVIOS.inc(resultado=await enviar_proxima_postagem(context, chat_id, titulo))
+        finally:
+            _grupos_postando.discard(chat_id)
+
+    for chat_id, titulo, previsto in vencidos:
+        _grupos_postando.add(chat_id)
+        context.application.create_task(postar(chat_id, titulo, previsto))
+
+async def enviar_proxima_postagem(context: ContextTypes.DEFAULT_TYPE, chat_id: int, titulo: str = None) -> str:
+    # A transação segura o post até o envio terminar: se o Telegram falhar, o
+    # rollback desfaz o avanço na rotação e a vez do post no grupo. A ficha do
+    # limite do chat é pega antes, para a espera não segurar conexão nem vaga de envio,
+    # e a fila de envios não repete o post: um RetryAfter desfaz a transação e
+    # remarca o grupo para quando o Telegram voltar a aceitar.
+    await limite_do_grupo(chat_id).adquirir()
+    post_id = envio = None
+    try:
+        async with _envios_grupos, db_transacao() as transacao:
+            postagem = await transacao.run(_reservar_proxima_postagem, chat_id)
+            if not postagem: return 'vazio'
+
+            post_id, variantes, vez, selecao, midia_ids, ciclo_concluido = postagem
+            ordem, texto_para_enviar, _ = escolher_variante(variantes, vez, selecao)
+
+            # (método, parâmetros) do envio em andamento, para envios_falhos se ele falhar
+            envio = ('sendMediaGroup' if midia_ids and len(midia_ids) > 1 else 'sendPhoto' if midia_ids else 'sendMessage',
+                     {'chat_id': chat_id, 'post_id': post_id, 'variante': letra_variante(ordem),
+                      'text': texto_para_enviar, 'midia_ids': midia_ids})
+            if midia_ids and len(midia_ids) > 1:
+                # Álbum: uma única chamada, com a legenda na primeira foto
+                media = [InputMediaPhoto(file_id, caption=texto_para_enviar if i == 0 else None)
+                         for i, file_id in enumerate(midia_ids[:10])]
+                await context.bot.send_media_group(chat_id=chat_id, media=media,
+                                                   rate_limit_args={'prioridade': 'postagem', 'fichas': len(media) - 1, 'repetir': False})
+            elif midia_ids:
+                await context.bot.send_photo(chat_id=chat_id, photo=midia_ids[0], caption=texto_para_enviar,
+                                             rate_limit_args={'prioridade': 'postagem', 'fichas': 0, 'repetir': False})
+            else:
+                await context.bot.send_message(chat_id=chat_id, text=texto_para_enviar,
+                                               rate_limit_args={'prioridade': 'postagem', 'fichas': 0, 'repetir': False})
+            envio = None
+        _envios_variantes[(post_id, ordem)] += 1
+        logger.info(f"Postagem {post_id} (Variante {letra_variante(ordem)}) enviada ao grupo {chat_id}.")
+    except RetryAfter as e:
+        espera = segundos_retry_after(e)
+        logger.warning(f"Postagem {post_id} ao grupo {chat_id} adiada em {espera:.0f}s (RetryAfter).")
+        try:
+            await db_execute('UPDATE grupos SET proximo_envio = now() + make_interval(secs => %s) WHERE chat_id = %s',
+                             (espera, chat_id))
+        except Exception as erro:
+            logger.error(f"Erro ao remarcar o grupo {chat_id}: {erro}")
+        return 'adiado'
+    except Exception as e:
+        logger.error(f"Erro ao enviar postagem {post_id} ao grupo {chat_id}: {e}")
+        if envio:
+            # O grupo só recebe um post de novo no próximo horário: o envio deste fica registrado
+            await registrar_envio_falho(*envio, 'postagem', e, 1)
+        return 'erro'
+
+    if ciclo_concluido:
+        for admin_id in ADMIN_IDS:
+            await context.bot.send_message(chat_id=admin_id, text=f"🔄 Ciclo de postagens concluído no grupo {titulo or chat_id}.")
+    return 'enviado'
+
+async def _alternar_envio(update: Update, context: ContextTypes.DEFAULT_TYPE, ativo: bool):
     message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
     if update.effective_user.id not in ADMIN_IDS: return
-    
+
     if update.callback_query:
         await update.callback_query.answer()
 
-    job = context.job_queue.get_jobs_by_name("postagem_automatica")
-    if not job:
-        await message_callable.reply_text("O envio automático já está pausado.")
+    try:
+        chat_id = _grupo_dos_args(update, context.args or [])
+    except ValueError:
+        await message_callable.reply_text(f"Uso: /{'ativar' if ativo else 'pausar'} [chat_id]")
         return
-    for j in job: j.schedule_removal()
-    await message_callable.reply_text('✅ Envio automático pausado.')
+    # Ao ativar, o primeiro post sai no próximo tick do agendador
+    alterados, total = await db_fetchone('''
+        WITH alvo AS (SELECT chat_id, ativo FROM grupos WHERE %(chat_id)s::bigint IS NULL OR chat_id = %(chat_id)s),
+             alterados AS (
+                UPDATE grupos g SET ativo = %(ativo)s, proximo_envio = CASE WHEN %(ativo)s THEN now() ELSE g.proximo_envio END
+                FROM alvo WHERE g.chat_id = alvo.chat_id AND alvo.ativo <> %(ativo)s
+                RETURNING 1)
+        SELECT (SELECT COUNT(*) FROM alterados), (SELECT COUNT(*) FROM alvo)
+    ''', {'chat_id': chat_id, 'ativo': ativo})
+    if not total:
+        await message_callable.reply_text("Nenhum grupo cadastrado. Use /add_grupo para cadastrar um." if chat_id is None
+                                          else f"❌ Nenhum grupo cadastrado com o ID {chat_id}.")
+    elif not alterados:
+        await message_callable.reply_text(f"O envio automático já está {'ativo' if ativo else 'pausado'}.")
+    else:
+        await message_callable.reply_text(f"✅ Envio automático {'ativado' if ativo else 'pausado'} em {alterados} grupo(s).")
+
+async def ativar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _alternar_envio(update, context, True)
+
+async def pausar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _alternar_envio(update, context, False)
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
@@ -567,39 +2867,48 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
         await update.callback_query.answer()
 
-    conn = db_connect()
     count = 0
     inscritos_count = 0
+    falhos = 0
+    grupos = []
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT COUNT(*) FROM postagens')
-            count = cursor.fetchone()[0]
-            cursor.execute('SELECT COUNT(*) FROM inscritos')
-            inscritos_count = cursor.fetchone()[0]
+        count, inscritos_count, falhos = await db_fetchone('''
+            SELECT (SELECT COUNT(*) FROM postagens), (SELECT COUNT(*) FROM inscritos),
+                   (SELECT COUNT(*) FROM envios_falhos WHERE data > now() - interval '24 hours')
+        ''')
+        grupos = await db_fetchall('''
+            SELECT g.chat_id, g.titulo, g.ativo, g.intervalo, g.proximo_envio,
+                   (SELECT COUNT(*) FROM grupo_rotacao r
+                    WHERE r.chat_id = g.chat_id
+                      AND r.rodada > (SELECT MIN(rodada) FROM grupo_rotacao WHERE chat_id = g.chat_id))
+            FROM grupos g ORDER BY g.data_adicao
+        ''')
     except Exception as e:
         logger.error(f"Erro ao obter status: {e}")
-    finally:
-        if conn: conn.close()
     
-    sent_count = len(context.bot_data.get('sent_ids', set()))
     status_str = (rf"📊 *Status do Bot*"
                   rf"\n\n📦 Posts na lista: `{count}`"
-                  rf"\n📨 Enviados no ciclo: `{sent_count}`"
                   rf"\n👥 Inscritos para DMs: `{inscritos_count}`"
+                  rf"\n📭 Envios descartados \(24h\): `{falhos}`"
+                  rf"\n🖥️ Réplica: `{coordenacao['replica']}` \({'líder' if coordenacao['lider'] else 'seguidora'}\)"
                   "\n\n")
-                  
-    job = context.job_queue.get_jobs_by_name("postagem_automatica")
-    if job:
-        intervalo, proximo_envio = job[0].interval, job[0].next_t.strftime("%H:%M:%S de %d/%m/%Y")
-        status_str += f"🚀 Envio automático: *ATIVO* \\(a cada {intervalo/60:.0f} min\\)\n⏰ Próximo envio: {proximo_envio}"
-    else: status_str += "🛑 Envio automático: *PAUSADO*"
+
+    if not grupos:
+        status_str += "🛑 Nenhum grupo cadastrado \\(use /add\\_grupo\\)"
+    for chat_id, titulo, ativo, intervalo, proximo_envio, enviados in grupos:
+        nome = escape_markdown(titulo or str(chat_id), version=2)
+        status_str += f"👥 *{nome}* `{chat_id}`\n📨 Enviados no ciclo: `{enviados}`\n"
+        if ativo:
+            proximo = escape_markdown(proximo_envio.astimezone().strftime("%H:%M:%S de %d/%m/%Y"), version=2)
+            status_str += f"🚀 *ATIVO* \\(a cada {intervalo/60:.0f} min\\) ⏰ Próximo envio: {proximo}\n\n"
+        else: status_str += "🛑 *PAUSADO*\n\n"
     
     try:
         await message_callable.reply_text(status_str, parse_mode='MarkdownV2')
     except BadRequest as e:
         logger.error(f"Erro de Markdown no /status: {e}")
         # Se o MarkdownV2 falhar, envie como texto simples
-        status_str_plain = status_str.replace('*', '').replace('`', '').replace('\\(', '(').replace('\\)', ')')
+        status_str_plain = status_str.replace('*', '').replace('`', '').replace('\\', '')
         await message_callable.reply_text(status_str_plain)
 
 async def set_interval(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -607,28 +2916,81 @@ async def set_interval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         new_interval_minutes = int(context.args[0])
         if new_interval_minutes <= 0: raise ValueError
-        context.bot_data['intervalo'] = new_interval_minutes * 60
-        await update.message.reply_text(f"✅ Intervalo definido para {new_interval_minutes} minutos. Use /ativar para (re)iniciar com o novo intervalo.")
+        chat_id = _grupo_dos_args(update, context.args, 1)
     except (IndexError, ValueError):
-        await update.message.reply_text("Uso: /set_interval <minutos>")
+        await update.message.reply_text("Uso: /set_interval <minutos> [chat_id]")
+        return
+    # Vale já para o próximo envio: quem estava agendado mais longe é puxado para o novo intervalo
+    rows_affected = await db_execute('''
+        UPDATE grupos SET intervalo = %(intervalo)s,
+                          proximo_envio = LEAST(proximo_envio, now() + make_interval(secs => %(intervalo)s))
+        WHERE %(chat_id)s::bigint IS NULL OR chat_id = %(chat_id)s
+    ''', {'intervalo': new_interval_minutes * 60, 'chat_id': chat_id})
+    if rows_affected: await update.message.reply_text(f"✅ Intervalo definido para {new_interval_minutes} minutos em {rows_affected} grupo(s).")
+    else: await update.message.reply_text("❌ Nenhum grupo encontrado. Use /add_grupo para cadastrar um.")
 
 async def remover(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS: return
     try:
         post_id = int(context.args[0])
-        conn = db_connect()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute('DELETE FROM postagens WHERE id = %s', (post_id,))
-                rows_affected = cursor.rowcount
-            conn.commit()
-            if rows_affected > 0: await update.message.reply_text(f"✅ Postagem com ID {post_id} removida.")
-            else: await update.message.reply_text(f"❌ Nenhuma postagem encontrada com o ID {post_id}.")
-        finally:
-            if conn: conn.close()
+        rows_affected = await db_execute('DELETE FROM postagens WHERE id = %s', (post_id,))
+        if rows_affected > 0: await update.message.reply_text(f"✅ Postagem com ID {post_id} removida.")
+        else: await update.message.reply_text(f"❌ Nenhuma postagem encontrada com o ID {post_id}.")
     except (IndexError, ValueError):
         await update.message.reply_text("Uso: /remover <ID>")
 
+async def gerenciar_variantes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Lista e altera as variantes de um post (modo de seleção, pesos, novas e removidas). """
+    if update.effective_user.id not in ADMIN_IDS: return
+    primeira_linha, _, resto = update.message.text.partition('\n')
+    args = primeira_linha.split()[1:]
+    try:
+        post_id = int(args[0])
+        acao = args[1].lower() if len(args) > 1 else None
+        if acao is None:
+            argumento = None
+        elif acao == 'modo' and args[2] in ('alternada', 'sorteio'):
+            argumento = args[2]
+        elif acao == 'peso':
+            argumento = (args[2].upper(), int(args[3]))
+            if argumento[1] <= 0: raise ValueError
+        elif acao == 'remover':
+            argumento = (args[2].upper(),)
+        elif acao == 'nova' and resto.strip():
+            argumento = resto.strip()
+        else:
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "Uso:\n/variantes <ID> — lista as variantes do post\n"
+            "/variantes <ID> modo alternada|sorteio\n"
+            "/variantes <ID> peso <letra> <peso>\n"
+            "/variantes <ID> remover <letra>\n"
+            "/variantes <ID> nova — com o texto da variante nas linhas seguintes")
+        return
+
+    try:
+        selecao, _, lista, parecidos = await db_run(_editar_variantes, post_id, acao, argumento) or (None, None, [], [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Nada foi alterado: {e}.")
+        return
+    except Exception as e:
+        logger.error(f"Erro ao alterar as variantes do post {post_id}: {e}")
+        await update.message.reply_text("❌ Erro ao alterar as variantes.")
+        return
+    if selecao is None:
+        await update.message.reply_text(f"❌ Nenhuma postagem encontrada com o ID {post_id}.")
+        return
+
+    # Os envios ainda não gravados entram na contagem
+    texto = f"🧪 Post {post_id}: {len(lista)} variante(s), seleção {selecao}\n"
+    for ordem, texto_variante, peso, envios in lista:
+        envios += _envios_variantes.get((post_id, ordem), 0)
+        preview = texto_variante.replace('\n', ' ')
+        preview = preview[:60] + '...' if len(preview) > 60 else preview
+        texto += f"\n{letra_variante(ordem)} — peso {peso}, {envios} envio(s): {preview}"
+    await update.message.reply_text(texto + aviso_parecidos(parecidos))
+
 async def limpar_lista(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_callable = update.callback_query.message if hasattr(update, 'callback_query') and update.callback_query else update.message
     if update.effective_user.id not in ADMIN_IDS: return
@@ -636,17 +2998,18 @@ async def limpar_lista(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
         await update.callback_query.answer()
 
-    conn = db_connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('DELETE FROM postagens')
-        conn.commit()
-        context.bot_data['sent_ids'] = set()
+        await db_execute('DELETE FROM postagens')
         await message_callable.reply_text("✅ Todas as postagens foram removidas.")
     except Exception as e:
         logger.error(f"Erro ao limpar lista: {e}")
-    finally:
-        if conn: conn.close()
+
+async def metricas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Envia ao admin a exposição completa das métricas como arquivo. """
+    if update.effective_user.id not in ADMIN_IDS: return
+    await update.message.reply_document(document=exportar_metricas().encode(),
+                                        filename=f"metricas_{datetime.now():%Y%m%d_%H%M}.txt",
+                                        caption="📈 Métricas no formato Prometheus.")
 
 # --- Handlers para botões que dão instruções ---
 async def menu_remover_instrucoes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -657,14 +3020,63 @@ async def menu_remover_instrucoes(update: Update, context: ContextTypes.DEFAULT_
 async def menu_set_interval_instrucoes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    await query.message.reply_text("ℹ️ Para definir o intervalo, use o comando no formato:\n`/set_interval <minutos>`")
+    await query.message.reply_text("ℹ️ Para definir o intervalo, use o comando no formato:\n`/set_interval <minutos> [chat_id]`\n\nSem o chat_id, vale para todos os grupos.")
 
 async def menu_verificar_instrucoes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
     await query.message.reply_text("ℹ️ Para verificar um link, use o comando no formato:\n`/verificar <link>`")
 
+async def menu_buscar_instrucoes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    await query.message.reply_text("ℹ️ Para buscar posts pelo texto, use o comando no formato:\n`/buscar <termos>`")
+
 # --- Conversa de Edição (/ver_lista) ---
+def _pagina_postagens(cursor, apos_id=0, antes_id=None):
+    """ Uma página da lista por keyset (id > apos_id ou id < antes_id), só com as colunas da prévia. """
+    # Da primeira variante só vêm os 51 primeiros caracteres (o 51º diz se a prévia foi cortada):
+    # substr lê só o começo de um texto guardado fora da linha (TOAST)
+    consulta = '''
+        SELECT p.id, left(p.previa, 50), length(p.previa) > 50, p.variantes
+        FROM (
+            SELECT p.id,
+                   (SELECT substr(texto, 1, 51) FROM variantes WHERE post_id = p.id ORDER BY ordem LIMIT 1) AS previa,
+                   (SELECT count(*) FROM variantes WHERE post_id = p.id) AS variantes
+            FROM postagens p
+            WHERE {filtro} ORDER BY p.id {direcao} LIMIT %s
+        ) p
+    '''
+    if antes_id is not None:
+        cursor.execute(consulta.format(filtro='p.id < %s', direcao='DESC') + ' ORDER BY p.id DESC', (antes_id, LISTA_PAGINA + 1))
+        linhas = cursor.fetchall()
+        return linhas[:LISTA_PAGINA][::-1], len(linhas) > LISTA_PAGINA, True
+    cursor.execute(consulta.format(filtro='p.id > %s', direcao='ASC') + ' ORDER BY p.id ASC', (apos_id, LISTA_PAGINA + 1))
+    linhas = cursor.fetchall()
+    return linhas[:LISTA_PAGINA], apos_id > 0, len(linhas) > LISTA_PAGINA
+
+def montar_pagina_lista(postagens, tem_anterior, tem_proxima):
+    texto = "📋 *Lista de Postagens Salvas:*\n\n"
+    for post_id, preview_raw, cortado, n_variantes in postagens:
+        tipo = f" \\({n_variantes} variantes\\)" if n_variantes > 1 else ""
+        preview = escape_markdown((preview_raw or '').replace('\n', ' '), version=2)
+        reticencias = '\\.\\.\\.' if cortado else ''
+        texto += f"*ID:* `{post_id}`{tipo} \\| *Texto:* _{preview}{reticencias}_\n"
+    if not postagens:
+        texto += "_Não há mais postagens nesta direção\\._\n"
+    texto += "\nPara visualizar ou editar um post, envie o número do ID\\.\nPara sair, digite /cancelar\\."
+
+    botoes = []
+    if not postagens:
+        # Página esvaziada por remoções: volta ao começo da lista
+        botoes.append(InlineKeyboardButton("⏮️ Início", callback_data="lista_prox_0"))
+    else:
+        if tem_anterior:
+            botoes.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"lista_ant_{postagens[0][0]}"))
+        if tem_proxima:
+            botoes.append(InlineKeyboardButton("Próxima ▶️", callback_data=f"lista_prox_{postagens[-1][0]}"))
+    return texto, InlineKeyboardMarkup([botoes]) if botoes else None
+
 async def ver_lista(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.effective_user.id not in ADMIN_IDS: return ConversationHandler.END
     
@@ -673,40 +3085,39 @@ async def ver_lista(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.callback_query.answer()
         await update.callback_query.message.edit_reply_markup(reply_markup=None)
 
-    conn = db_connect()
     postagens = []
     try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT id, texto_a, texto_b FROM postagens ORDER BY id ASC')
-            postagens = cursor.fetchall()
+        postagens, tem_anterior, tem_proxima = await db_run(_pagina_postagens)
     except Exception as e:
         logger.error(f"Erro ao ver lista: {e}")
-    finally:
-        if conn: conn.close()
         
     if not postagens:
         await chat.send_message("A lista de postagens está vazia.")
         return ConversationHandler.END
 
-    header = "📋 *Lista de Postagens Salvas:*\n\n"
-    message_chunk = header
-    for post_id, texto_a, texto_b in postagens:
-        tipo = " \\(Teste A/B\\)" if texto_b else ""
-        preview_raw = texto_a.replace('\n', ' ')[:50]
-        preview = escape_markdown(preview_raw, version=2)
-        reticencias = '\\.\\.\\.' if len(texto_a) > 50 else ''
-        line = f"*ID:* `{post_id}`{tipo} \\| *Texto:* _{preview}{reticencias}_\n"
-        
-        if len(message_chunk) + len(line) > 4000:
-            await chat.send_message(message_chunk, parse_mode='MarkdownV2')
-            message_chunk = ""
-        message_chunk += line
-    
-    if message_chunk != header:
-        await chat.send_message(message_chunk, parse_mode='MarkdownV2')
-    
-    await chat.send_message("Para visualizar ou editar um post, envie o número do ID.\nPara sair, digite /cancelar.")
-    
+    texto, reply_markup = montar_pagina_lista(postagens, tem_anterior, tem_proxima)
+    await chat.send_message(texto, reply_markup=reply_markup, parse_mode='MarkdownV2')
+    return SELECTING_POST
+
+async def paginar_lista(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """ Navegação da lista: edita a mesma mensagem com a página anterior/seguinte. """
+    query = update.callback_query
+    await query.answer()
+    _, direcao, referencia = query.data.split('_')
+    try:
+        if direcao == 'prox':
+            pagina = await db_run(_pagina_postagens, int(referencia))
+        else:
+            pagina = await db_run(_pagina_postagens, 0, int(referencia))
+    except Exception as e:
+        logger.error(f"Erro ao paginar lista: {e}")
+        return SELECTING_POST
+
+    texto, reply_markup = montar_pagina_lista(*pagina)
+    try:
+        await query.edit_message_text(texto, reply_markup=reply_markup, parse_mode='MarkdownV2')
+    except BadRequest as e:
+        logger.debug(f"Página da lista não alterada: {e}")
     return SELECTING_POST
 
 async def selecionar_post_para_ver(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -716,29 +3127,26 @@ async def selecionar_post_para_ver(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("Por favor, envie um número de ID válido.")
         return SELECTING_POST
 
-    conn = db_connect()
-    postagem = None
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute('SELECT texto_a, texto_b FROM postagens WHERE id = %s', (post_id,))
-            postagem = cursor.fetchone()
-    finally:
-        if conn: conn.close()
+    postagem = await db_fetchone('''
+        SELECT p.selecao, (SELECT json_agg(json_build_array(ordem, texto, peso) ORDER BY ordem)
+                           FROM variantes WHERE post_id = p.id)
+        FROM postagens p WHERE p.id = %s
+    ''', (post_id,))
 
     if not postagem:
         await update.message.reply_text(f"❌ Post com ID {post_id} não encontrado. Tente outro ID ou digite /cancelar.")
         return SELECTING_POST
 
     context.user_data['post_id_para_editar'] = post_id
-    texto_a, texto_b = postagem
-
-    mensagem_preview = f"👓 *Visualizando Post ID: {post_id}*\n\n"
-    mensagem_preview += "--- VERSÃO A ---\n"
-    mensagem_preview += texto_a
+    selecao, variantes = postagem
+    variantes = variantes or []
 
-    if texto_b:
-        mensagem_preview += "\n\n--- VERSÃO B ---\n"
-        mensagem_preview += texto_b
+    mensagem_preview = f"👓 *Visualizando Post ID: {post_id}*\n"
+    if len(variantes) > 1:
+        mensagem_preview += f"Seleção: {selecao} (/variantes {post_id})\n"
+    for ordem, texto, peso in variantes:
+        mensagem_preview += f"\n--- VERSÃO {letra_variante(ordem)}{f' (peso {peso})' if peso != 1 else ''} ---\n"
+        mensagem_preview += texto + "\n"
 
     keyboard = [
         [
@@ -776,11 +3184,26 @@ async def cancelar_edicao(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     context.user_data.clear()
     return ConversationHandler.END
 
-# --- Função Principal (main) ---
-def main():
-    init_db()
-    
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).concurrent_updates(True).build()
+async def post_shutdown(application: Application):
+    # Libera a liderança na hora, sem esperar a conexão cair
+    await asyncio.to_thread(_fechar_coordenacao)
+    # Envios das variantes ainda não gravados
+    await gravar_envios_variantes()
+    if servidor_metricas:
+        servidor_metricas.close()
+        await servidor_metricas.wait_closed()
+    close_db_pool()
+
+# --- Montagem da Aplicação ---
+def criar_aplicacao() -> Application:
+    """ Monta a Application com todos os handlers, sem iniciar o polling. """
+    builder = (Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init)
+               .post_shutdown(post_shutdown).concurrent_updates(True)
+               .persistence(PersistenciaPostgres(update_interval=PERSISTENCIA_INTERVALO))
+               .request(RequestMedido(connection_pool_size=256)).rate_limiter(FilaEnvios()))
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = builder.build()
 
     # --- Handlers de Conversa ---
     conv_handler_criar = ConversationHandler(
@@ -799,7 +3222,9 @@ def main():
             LANCAMENTO: [CallbackQueryHandler(receber_lancamento_e_salvar)],
         },
         fallbacks=[CommandHandler('cancelar', cancelar_criacao)],
-        conversation_timeout=600
+        conversation_timeout=600,
+        name="criar",
+        persistent=True
     )
 
     conv_handler_broadcast = ConversationHandler(
@@ -817,11 +3242,16 @@ def main():
             CallbackQueryHandler(ver_lista, pattern='^menu_ver_lista$')
         ],
         states={
-            SELECTING_POST: [MessageHandler(filters.Regex(r'^\d+$'), selecionar_post_para_ver)],
+            SELECTING_POST: [
+                MessageHandler(filters.Regex(r'^\d+$'), selecionar_post_para_ver),
+                CallbackQueryHandler(paginar_lista, pattern=r'^lista_(prox|ant)_\d+$'),
+            ],
             ACTION_POST: [CallbackQueryHandler(pattern=r'^(edit|ignore)_\d+$', callback=acao_post)],
         },
         fallbacks=[CommandHandler('cancelar', cancelar_edicao)],
-        conversation_timeout=300 
+        conversation_timeout=300,
+        name="ver_lista",
+        persistent=True
     )
     
     application.add_handler(conv_handler_criar)
@@ -836,31 +3266,72 @@ def main():
     application.add_handler(CommandHandler("pausar", pausar))
     application.add_handler(CommandHandler("status", status))
     application.add_handler(CommandHandler("set_interval", set_interval))
+    application.add_handler(CommandHandler("add_grupo", add_grupo))
+    application.add_handler(CommandHandler("remover_grupo", remover_grupo))
     application.add_handler(CommandHandler("remover", remover))
+    application.add_handler(CommandHandler("variantes", gerenciar_variantes))
     application.add_handler(CommandHandler("limpar_lista", limpar_lista))
     application.add_handler(CommandHandler("gerar_lista_links", gerar_lista_links))
     application.add_handler(CommandHandler("verificar", verificar_links))
+    application.add_handler(CommandHandler("duplicados", duplicados))
+    application.add_handler(CommandHandler("buscar", buscar))
+    application.add_handler(CommandHandler("metricas", metricas))
+    application.add_handler(CommandHandler("importar", importar_postagens))
+    application.add_handler(CommandHandler("exportar", exportar_postagens))
 
     # --- ESTRUTURA ROBUSTA: Handlers de Botões do Menu Dedicados ---
     application.add_handler(CallbackQueryHandler(ativar, pattern='^ativar$'))
     application.add_handler(CallbackQueryHandler(pausar, pattern='^pausar$'))
     application.add_handler(CallbackQueryHandler(status, pattern='^status$'))
     application.add_handler(CallbackQueryHandler(gerar_lista_links, pattern='^gerar_lista_links$'))
+    application.add_handler(CallbackQueryHandler(exportar_lista_links, pattern='^gerar_lista_links_arquivo$'))
     application.add_handler(CallbackQueryHandler(limpar_lista, pattern='^limpar_lista$'))
     application.add_handler(CallbackQueryHandler(convidar_inscricao, pattern='^convidar$'))
     application.add_handler(CallbackQueryHandler(menu_remover_instrucoes, pattern='^menu_remover$'))
     application.add_handler(CallbackQueryHandler(menu_set_interval_instrucoes, pattern='^menu_set_interval$'))
     application.add_handler(CallbackQueryHandler(menu_verificar_instrucoes, pattern='^menu_verificar$'))
+    application.add_handler(CallbackQueryHandler(menu_buscar_instrucoes, pattern='^menu_buscar$'))
+    application.add_handler(CallbackQueryHandler(paginar_busca, pattern=r'^busca_\d+$'))
     
     # --- Handlers de Mensagem ---
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, boas_vindas_e_convite))
     application.add_handler(MessageHandler(
-        filters.User(user_id=ADMIN_IDS) & (filters.PHOTO | filters.TEXT) & filters.ChatType.PRIVATE & ~filters.COMMAND, 
+        filters.User(user_id=ADMIN_IDS) & filters.Document.ALL & filters.CaptionRegex(r'^/importar\b') & filters.ChatType.PRIVATE,
+        importar_postagens
+    ))
+    application.add_handler(MessageHandler(
+        filters.User(user_id=ADMIN_IDS) & (filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.AUDIO | filters.TEXT)
+        & filters.ChatType.PRIVATE & ~filters.COMMAND,
         handle_new_post
     ))
     
-    logger.info("Bot está online e pronto para operar!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    for handlers in application.handlers.values():
+        instrumentar_handlers(handlers)
+    return application
+
+def parametros_webhook() -> dict:
+    """ Argumentos do servidor de webhook (aceitos por run_webhook e por Updater.start_webhook). """
+    return {
+        'listen': WEBHOOK_HOST,
+        'port': WEBHOOK_PORTA,
+        'url_path': WEBHOOK_CAMINHO,
+        'webhook_url': f"{WEBHOOK_URL}/{WEBHOOK_CAMINHO}",
+        'secret_token': WEBHOOK_SECRET,
+        'allowed_updates': ALLOWED_UPDATES,
+    }
+
+# --- Função Principal (main) ---
+def main():
+    init_db_pool()
+    init_db()
+    
+    application = criar_aplicacao()
+    if BOT_MODO == 'webhook':
+        logger.info(f"Bot está online (webhook em {WEBHOOK_HOST}:{WEBHOOK_PORTA}/{WEBHOOK_CAMINHO}; updates: {', '.join(ALLOWED_UPDATES)})")
+        application.run_webhook(**parametros_webhook())
+    else:
+        logger.info(f"Bot está online (polling; updates: {', '.join(ALLOWED_UPDATES)})")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
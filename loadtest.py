@@ -0,0 +1,417 @@
+# --- Teste de carga: Bot API falso + reprodução de updates sintéticos ---
+#
+# Sobe um servidor HTTP local que imita o Bot API (latência configurável e respostas
+# 429/403 aleatórias), aponta o bot.py para ele via TELEGRAM_API_URL e injeta fluxos de
+# updates sintéticos na Application (com concurrent_updates, como em produção):
+# enxurrada de entradas no grupo, tempestade de "/start inscrever", comandos de admin e
+# um broadcast para todos os inscritos; com --grupos, também o agendador postando em
+# vários grupos ao mesmo tempo, e com --importar, um /importar de um JSONL. Ao final, mostra os percentis de latência de ponta a
+# ponta de cada cenário e a vazão do broadcast e dos posts.
+#
+# Com --modo fila os updates entram pela update_queue, o mesmo caminho do polling; com
+# --modo webhook o bot sobe o servidor de webhook (BOT_MODO=webhook) e um cliente local
+# faz POST do JSON de cada update com o secret token.
+#
+# Exemplo:
+#   LOADTEST_DATABASE_URL=postgresql://localhost/bot_bench \
+#   python loadtest.py --modo webhook --entradas 2000 --inscricoes 5000 --taxa 200 --latencia-ms 40 --taxa-429 0.01
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import socket
+import secrets
+import itertools
+import statistics
+from collections import Counter
+from urllib.parse import parse_qsl
+
+import httpx
+import psycopg2
+
+import benchmark
+
+LOADTEST_SCHEMA = 'bot_loadtest'
+ADMIN_ID = benchmark.ADMIN_ID
+GRUPO_ID = -1001234567890
+
+# Métodos que enviam algo a um chat: só estes sofrem 429/403 simulados
+METODOS_DE_ENVIO = {'sendMessage', 'forwardMessage', 'copyMessage', 'sendPhoto', 'sendMediaGroup',
+                    'sendDocument', 'editMessageText'}
+
+
+# --- Bot API falso ---
+class BotApiFalsa:
+    """ Servidor HTTP/1.1 mínimo que responde aos métodos do Bot API usados pelo bot. """
+    def __init__(self, latencia_ms=30.0, jitter_ms=10.0, taxa_429=0.0, taxa_403=0.0, retry_after=1):
+        self.latencia_ms, self.jitter_ms = latencia_ms, jitter_ms
+        self.taxa_429, self.taxa_403, self.retry_after = taxa_429, taxa_403, retry_after
+        self.chamadas = Counter()
+        self.envios_por_grupo = Counter()
+        # Arquivos "enviados" ao bot (file_id -> conteúdo), servidos por getFile e /file/bot...
+        self.arquivos = {}
+        self._ids = itertools.count(1000)
+        self.servidor = None
+
+    async def iniciar(self, host='127.0.0.1', porta=0):
+        self.servidor = await asyncio.start_server(self._atender, host, porta)
+        return self.servidor.sockets[0].getsockname()[1]
+
+    async def parar(self):
+        self.servidor.close()
+        await self.servidor.wait_closed()
+
+    async def _atender(self, reader, writer):
+        # Conexões keep-alive do httpx: várias requisições por conexão
+        try:
+            while True:
+                cabecalho = await reader.readuntil(b"\r\n\r\n")
+                linhas = cabecalho.decode('latin-1').split("\r\n")
+                _, caminho, _ = linhas[0].split(' ', 2)
+                headers = {k.strip().lower(): v.strip() for k, v in (l.split(':', 1) for l in linhas[1:] if ':' in l)}
+                corpo = await reader.readexactly(int(headers.get('content-length', 0)))
+                if caminho.startswith('/file/'):
+                    conteudo = self.arquivos.get(caminho.rsplit('/', 1)[-1])
+                    status, dados = (200, conteudo) if conteudo is not None else (404, b'')
+                else:
+                    status, resposta = await self._responder(caminho.rsplit('/', 1)[-1], headers.get('content-type', ''), corpo)
+                    dados = json.dumps(resposta).encode()
+                writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(dados)}\r\n\r\n".encode() + dados)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parametros(content_type, corpo) -> dict:
+        if 'json' in content_type:
+            return json.loads(corpo or b'{}')
+        if 'multipart' in content_type:
+            # Só precisamos do chat_id; os arquivos são ignorados
+            texto = corpo.decode('utf-8', 'ignore')
+            marcador = 'name="chat_id"'
+            if marcador in texto:
+                return {'chat_id': texto.split(marcador, 1)[1].split('\r\n\r\n', 1)[1].split('\r\n', 1)[0]}
+            return {}
+        return dict(parse_qsl(corpo.decode()))
+
+    def _mensagem(self, chat_id):
+        chat_id = int(chat_id or 0)
+        return {'message_id': next(self._ids), 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}}
+
+    async def _responder(self, metodo, content_type, corpo):
+        await asyncio.sleep(max(0.0, random.gauss(self.latencia_ms, self.jitter_ms)) / 1000)
+        params = self._parametros(content_type, corpo)
+        chat_id = params.get('chat_id')
+        if metodo in METODOS_DE_ENVIO:
+            if random.random() < self.taxa_429:
+                self.chamadas[(metodo, 429)] += 1
+                return 429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+            if chat_id and int(chat_id) > 0 and int(chat_id) != ADMIN_ID and random.random() < self.taxa_403:
+                self.chamadas[(metodo, 403)] += 1
+                return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+        self.chamadas[(metodo, 200)] += 1
+        if metodo in METODOS_DE_ENVIO and chat_id and int(chat_id) < 0:
+            self.envios_por_grupo[int(chat_id)] += 1
+
+        if metodo == 'getMe':
+            resultado = {'id': 1, 'is_bot': True, 'first_name': 'Bot de Carga', 'username': 'bot_de_carga'}
+        elif metodo == 'getChat':
+            resultado = {'id': int(chat_id), 'type': 'supergroup', 'title': f'Grupo {chat_id}', 'accent_color_id': 0, 'max_reaction_count': 11}
+        elif metodo == 'getFile':
+            file_id = params.get('file_id')
+            resultado = {'file_id': file_id, 'file_unique_id': file_id, 'file_path': f"documents/{file_id}",
+                         'file_size': len(self.arquivos.get(file_id, b''))}
+        elif metodo == 'sendMediaGroup':
+            resultado = [self._mensagem(chat_id)]
+        elif metodo in METODOS_DE_ENVIO:
+            resultado = self._mensagem(chat_id)
+        elif metodo == 'getUpdates':
+            resultado = []
+        else:
+            resultado = True
+        return 200, {'ok': True, 'result': resultado}
+
+
+# --- Gerador de updates sintéticos ---
+class GeradorUpdates:
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _usuario(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'Usuário {user_id}'}
+
+    def mensagem(self, user_id, chat_id, texto=None, **extras):
+        from telegram import Update
+        chat = {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}
+        mensagem = {'message_id': next(self._message_ids), 'date': int(time.time()), 'chat': chat,
+                    'from': self._usuario(user_id), **extras}
+        if texto is not None:
+            mensagem['text'] = texto
+            if texto.startswith('/'):
+                mensagem['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(texto.split()[0])}]
+        return Update.de_json({'update_id': next(self._update_ids), 'message': mensagem}, self.bot)
+
+    def entrada_no_grupo(self, primeiro_id, quantidade=1):
+        membros = [self._usuario(primeiro_id + i) for i in range(quantidade)]
+        return self.mensagem(primeiro_id, GRUPO_ID, new_chat_members=membros)
+
+    def comando(self, user_id, texto):
+        return self.mensagem(user_id, user_id, texto)
+
+    def documento(self, user_id, file_id, nome, tamanho, legenda=None):
+        documento = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': nome, 'file_size': tamanho}
+        return self.mensagem(user_id, user_id, document=documento, caption=legenda)
+
+
+def percentis(latencias) -> dict:
+    if not latencias: return {}
+    ordenadas = sorted(latencias)
+    def p(q): return round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * q))] * 1000, 2)
+    return {'p50_ms': p(0.50), 'p95_ms': p(0.95), 'p99_ms': p(0.99), 'max_ms': round(ordenadas[-1] * 1000, 2),
+            'media_ms': round(statistics.fmean(ordenadas) * 1000, 2)}
+
+
+# --- Entrega dos updates ---
+class Entrega:
+    """ Entrega updates ao bot (fila ou webhook) e avisa quando cada um termina de ser processado. """
+    def __init__(self, app, modo, bot_mod=None):
+        from telegram import Update
+        from telegram.ext import TypeHandler
+        self.app, self.modo = app, modo
+        self.falhas = Counter()
+        self._pendentes = {}
+        # Grupo alto: roda depois de todos os handlers do update, mesmo se algum falhar
+        app.add_handler(TypeHandler(Update, self._concluido), group=99)
+        if modo == 'webhook':
+            parametros = bot_mod.parametros_webhook()
+            self.url = f"http://127.0.0.1:{parametros['port']}/{parametros['url_path']}"
+            self.headers = {'X-Telegram-Bot-Api-Secret-Token': parametros['secret_token']}
+            self.cliente = httpx.AsyncClient(limits=httpx.Limits(max_connections=100), timeout=30)
+
+    async def _concluido(self, update, context):
+        futuro = self._pendentes.pop(update.update_id, None)
+        if futuro and not futuro.done(): futuro.set_result(time.perf_counter())
+
+    async def entregar(self, update) -> float:
+        """ Entrega o update e devolve o instante em que o processamento terminou. """
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendentes[update.update_id] = futuro
+        if self.modo == 'webhook':
+            resposta = await self.cliente.post(self.url, json=update.to_dict(), headers=self.headers)
+            if resposta.status_code != 200:
+                self.falhas[resposta.status_code] += 1
+                self._pendentes.pop(update.update_id, None)
+                return time.perf_counter()
+        else:
+            await self.app.update_queue.put(update)
+        return await futuro
+
+    async def secret_invalido_rejeitado(self) -> bool:
+        resposta = await self.cliente.post(self.url, json={'update_id': 0}, headers={'X-Telegram-Bot-Api-Secret-Token': 'errado'})
+        return resposta.status_code == 403
+
+    async def fechar(self):
+        if self.modo == 'webhook': await self.cliente.aclose()
+
+
+async def reproduzir(entrega, updates, taxa: float) -> dict:
+    """ Entrega os updates no ritmo `taxa` (updates/s) e mede chegada -> fim do processamento. """
+    latencias = []
+    inicio = time.perf_counter()
+
+    async def despachar(update, chegada):
+        atraso = chegada - time.perf_counter()
+        if atraso > 0: await asyncio.sleep(atraso)
+        latencias.append(await entrega.entregar(update) - chegada)
+
+    await asyncio.gather(*(despachar(u, inicio + i / taxa) for i, u in enumerate(updates)))
+    duracao = time.perf_counter() - inicio
+    return {'quantidade': len(updates), 'duracao_s': round(duracao, 2),
+            'updates_por_s': round(len(updates) / duracao, 1), **percentis(latencias)}
+
+
+async def medir_broadcast(entrega, bot_mod, gerador, timeout: float) -> dict:
+    """ Dispara /enviar_dm como admin e espera o broadcast persistido terminar. """
+    inicio = time.perf_counter()
+    await entrega.entregar(gerador.comando(ADMIN_ID, '/enviar_dm'))
+    await entrega.entregar(gerador.comando(ADMIN_ID, '🚀 Lançamento do teste de carga'))
+    linha = None
+    while time.perf_counter() - inicio < timeout:
+        linha = await bot_mod.db_fetchone('SELECT id, status, total FROM broadcasts ORDER BY id DESC LIMIT 1')
+        if linha and linha[1] == 'concluido': break
+        await asyncio.sleep(0.2)
+    duracao = time.perf_counter() - inicio
+    if not linha:
+        return {'erro': 'nenhum broadcast criado (não há inscritos?)'}
+    contagem = dict(await bot_mod.db_fetchall(
+        'SELECT status, COUNT(*) FROM broadcast_entregas WHERE broadcast_id = %s GROUP BY status', (linha[0],)))
+    return {'destinatarios': linha[2], 'concluido': linha[1] == 'concluido', 'duracao_s': round(duracao, 2),
+            'msgs_por_s': round(linha[2] / duracao, 1), 'resultados': contagem}
+
+
+async def medir_importacao(entrega, bot_mod, api, gerador, quantidade: int) -> dict:
+    """ Envia um JSONL com `quantidade` posts e mede o /importar até a resposta final. """
+    linhas = [json.dumps({'variantes': [f"Post importado {i} com bônus\n🏠https://importado{i}.com/promo"]
+                                        + ([{'texto': f"Variante B do post importado {i}", 'peso': 2}] if i % 3 == 0 else []),
+                          'selecao': 'sorteio' if i % 2 else 'alternada'}, ensure_ascii=False)
+              for i in range(quantidade)]
+    api.arquivos['importacao'] = "\n".join(linhas).encode()
+    antes = (await bot_mod.db_fetchone('SELECT COUNT(*) FROM postagens'))[0]
+    inicio = time.perf_counter()
+    await entrega.entregar(gerador.documento(ADMIN_ID, 'importacao', 'posts.jsonl', len(api.arquivos['importacao']), '/importar'))
+    duracao = time.perf_counter() - inicio
+    depois = (await bot_mod.db_fetchone('SELECT COUNT(*) FROM postagens'))[0]
+    return {'posts': quantidade, 'importados': depois - antes, 'bytes': len(api.arquivos['importacao']),
+            'duracao_s': round(duracao, 2), 'posts_por_s': round(quantidade / duracao, 1)}
+
+
+async def medir_grupos(bot_mod, api, quantidade: int, duracao: float) -> dict:
+    """ Cadastra grupos com intervalo de 1 s, ativa todos e conta os posts de cada um no período. """
+    grupos = [GRUPO_ID - 1 - i for i in range(quantidade)]
+    def _cadastrar(cursor):
+        for i, chat_id in enumerate(grupos):
+            bot_mod._adicionar_grupo(cursor, chat_id, f'Grupo de carga {i}', 1)
+        cursor.execute('UPDATE grupos SET ativo = true, proximo_envio = now() WHERE chat_id = ANY(%s)', (grupos,))
+    await bot_mod.db_run(_cadastrar)
+    antes = Counter(api.envios_por_grupo)
+    await asyncio.sleep(duracao)
+    await bot_mod.db_execute('UPDATE grupos SET ativo = false')
+    posts = [api.envios_por_grupo[g] - antes[g] for g in grupos]
+    # Contadores das variantes: o que ainda está em memória é gravado antes da leitura
+    await bot_mod.gravar_envios_variantes()
+    por_variante = await bot_mod.db_fetchall('SELECT ordem, SUM(envios) FROM variantes GROUP BY ordem ORDER BY ordem')
+    return {'grupos': quantidade, 'duracao_s': duracao, 'posts': sum(posts), 'posts_por_s': round(sum(posts) / duracao, 1),
+            'grupos_com_posts': sum(1 for p in posts if p), 'min_por_grupo': min(posts), 'max_por_grupo': max(posts),
+            'envios_por_variante': {bot_mod.letra_variante(ordem): int(envios) for ordem, envios in por_variante},
+            'limite_por_grupo_no_periodo': round(min(5.0, bot_mod.GRUPO_MSGS_POR_MINUTO) + bot_mod.GRUPO_MSGS_POR_MINUTO / 60 * duracao, 1)}
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def executar(args):
+    api = BotApiFalsa(args.latencia_ms, args.jitter_ms, args.taxa_429, args.taxa_403, args.retry_after)
+    porta = await api.iniciar()
+
+    extras = {'TELEGRAM_API_URL': f"http://127.0.0.1:{porta}",
+              'BOAS_VINDAS_JANELA': str(args.janela_boas_vindas), 'BOT_MODO': 'polling',
+              'AGENDADOR_TICK': '0.5', 'ENVIOS_POR_SEGUNDO': str(args.envios_por_segundo),
+              'CHAT_MSGS_POR_SEGUNDO': str(args.chat_msgs_por_segundo)}
+    if args.modo == 'webhook':
+        extras.update(BOT_MODO='webhook', WEBHOOK_URL='http://127.0.0.1', WEBHOOK_HOST='127.0.0.1',
+                      WEBHOOK_PORTA=str(porta_livre()), WEBHOOK_SECRET=secrets.token_urlsafe(24))
+    benchmark.preparar_ambiente(args.database_url, LOADTEST_SCHEMA, **extras)
+    import bot as bot_mod
+    import logging
+    logging.getLogger('bot').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    bot_mod.init_db_pool()
+    bot_mod.init_db()
+    benchmark.popular(bot_mod, args.posts, 0)
+
+    app = bot_mod.criar_aplicacao()
+    entrega = Entrega(app, args.modo, bot_mod)
+    await app.initialize()
+    if args.modo == 'webhook':
+        await app.updater.start_webhook(**bot_mod.parametros_webhook())
+    await app.start()
+    await app.post_init(app)
+    gerador = GeradorUpdates(app.bot)
+    relatorio = {'config': vars(args).copy(), 'cenarios': {}}
+    relatorio['config'].pop('database_url')
+    try:
+        if args.modo == 'webhook':
+            relatorio['webhook_secret_invalido_rejeitado'] = await entrega.secret_invalido_rejeitado()
+        if args.entradas:
+            updates = [gerador.entrada_no_grupo(100_000 + i * 3, random.randint(1, 3)) for i in range(args.entradas)]
+            relatorio['cenarios']['entradas_no_grupo'] = await reproduzir(entrega, updates, args.taxa)
+        if args.inscricoes:
+            updates = [gerador.comando(200_000 + i, '/start inscrever') for i in range(args.inscricoes)]
+            relatorio['cenarios']['start_inscrever'] = await reproduzir(entrega, updates, args.taxa)
+        if args.admin:
+            comandos = ['/status', '/verificar https://site1.com/promo', '/ver_lista', '/gerar_lista_links', '/buscar bônus']
+            updates = [gerador.comando(ADMIN_ID, comandos[i % len(comandos)]) for i in range(args.admin)]
+            relatorio['cenarios']['comandos_admin'] = await reproduzir(entrega, updates, args.taxa)
+        if args.importar:
+            relatorio['importacao'] = await medir_importacao(entrega, bot_mod, api, gerador, args.importar)
+        if args.grupos:
+            relatorio['postagens_em_grupos'] = await medir_grupos(bot_mod, api, args.grupos, args.duracao_grupos)
+        if args.broadcast:
+            relatorio['broadcast'] = await medir_broadcast(entrega, bot_mod, gerador, args.timeout_broadcast)
+        # Espera as boas-vindas agrupadas saírem antes de contar as chamadas
+        await asyncio.sleep(args.janela_boas_vindas + 0.5)
+    finally:
+        await entrega.fechar()
+        if app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await api.parar()
+        if not args.manter_schema:
+            with psycopg2.connect(args.database_url) as conn, conn.cursor() as cursor:
+                cursor.execute(f'DROP SCHEMA IF EXISTS {LOADTEST_SCHEMA} CASCADE')
+
+    relatorio['bot_api'] = {f"{metodo} {status}": total for (metodo, status), total in sorted(api.chamadas.items())}
+    relatorio['updates_recusados'] = {str(k): v for k, v in entrega.falhas.items()}
+    relatorio['erros_em_handlers'] = sum(bot_mod.METRICA_HANDLER_ERROS.valores.values())
+    relatorio['envios_falhos'] = {k[0]: v for k, v in bot_mod.METRICA_ENVIOS_FALHOS.valores.items()}
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do bot.py contra um Bot API falso')
+    parser.add_argument('--modo', choices=['fila', 'webhook'], default='fila',
+                        help='Entrega pela update_queue (como o polling) ou por POST no webhook do bot')
+    parser.add_argument('--entradas', type=int, default=1000, help='Updates de entrada no grupo (1 a 3 membros cada)')
+    parser.add_argument('--inscricoes', type=int, default=2000, help='Quantidade de "/start inscrever"')
+    parser.add_argument('--admin', type=int, default=100, help='Comandos de admin (/status, /verificar, /ver_lista, ...)')
+    parser.add_argument('--broadcast', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--grupos', type=int, default=0, help='Grupos postando a cada 1 s durante --duracao-grupos')
+    parser.add_argument('--duracao-grupos', type=float, default=20.0)
+    parser.add_argument('--importar', type=int, default=0, help='Posts num JSONL enviado ao /importar')
+    parser.add_argument('--posts', type=int, default=1000, help='Posts no catálogo')
+    parser.add_argument('--taxa', type=float, default=200.0, help='Updates por segundo em cada cenário')
+    parser.add_argument('--latencia-ms', type=float, default=30.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--envios-por-segundo', type=float, default=30.0,
+                        help='Limite global da fila de envios do bot (o do Telegram é ~30)')
+    parser.add_argument('--chat-msgs-por-segundo', type=float, default=1.0,
+                        help='Limite de cada chat privado no bot; os comandos de admin vão todos para o mesmo chat')
+    parser.add_argument('--taxa-429', type=float, default=0.0, help='Probabilidade de 429 em cada envio')
+    parser.add_argument('--taxa-403', type=float, default=0.0, help='Probabilidade de 403 em envios para usuários')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--janela-boas-vindas', type=float, default=1.0)
+    parser.add_argument('--timeout-broadcast', type=float, default=600.0)
+    parser.add_argument('--saida', help='Grava o relatório em JSON')
+    parser.add_argument('--manter-schema', action='store_true', help=f'Não apaga o schema {LOADTEST_SCHEMA} ao final')
+    args = parser.parse_args()
+
+    args.database_url = os.environ.get('LOADTEST_DATABASE_URL') or os.environ.get('BENCH_DATABASE_URL')
+    if not args.database_url:
+        sys.exit("Defina LOADTEST_DATABASE_URL com um PostgreSQL local (o schema bot_loadtest será criado e apagado).")
+
+    relatorio = asyncio.run(executar(args))
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
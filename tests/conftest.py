@@ -0,0 +1,14 @@
+import os
+import sys
+
+# O bot.py lê a configuração na importação: valores fixos para os testes não dependerem do ambiente
+os.environ.update({
+    'TELEGRAM_BOT_TOKEN': '0:testes',
+    'ADMIN_IDS': '1',
+    'BOT_MODO': 'polling',
+    'VARIANTES_MAX': '10',
+    'BUSCA_PAGINA': '10',
+    'DUPLICADOS_LIMIAR': '0.8',
+})
+os.environ.pop('GRUPO_ID', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
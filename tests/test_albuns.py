@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+class Contexto:
+    """ O suficiente de um CallbackContext para handle_new_post e job_salvar_album. """
+    def __init__(self):
+        self.jobs, self.enviadas = [], []
+        self.job_queue = SimpleNamespace(run_once=lambda callback, **kwargs: self.jobs.append(kwargs))
+        self.bot = SimpleNamespace(send_message=self._send_message)
+
+    async def _send_message(self, chat_id, texto):
+        self.enviadas.append(texto)
+
+    def rodar_job(self):
+        kwargs = self.jobs.pop()
+        self.job = SimpleNamespace(data=kwargs['data'], chat_id=kwargs['chat_id'])
+        asyncio.run(bot.job_salvar_album(self))
+
+
+def mensagem(message_id, foto=None, video=None, legenda=None, album='g1'):
+    respostas = []
+
+    async def reply_text(texto):
+        respostas.append(texto)
+    message = SimpleNamespace(message_id=message_id, chat_id=1, media_group_id=album, caption=legenda, text=None,
+                              photo=[SimpleNamespace(file_id=foto)] if foto else [], video=video, document=None,
+                              audio=None, reply_text=reply_text, respostas=respostas)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=1), message=message)
+
+
+def test_album_com_video_e_recusado_sem_salvar(monkeypatch):
+    async def db_run(func, *args):
+        raise AssertionError('não deveria salvar')
+    monkeypatch.setattr(bot, 'db_run', db_run)
+    contexto = Contexto()
+    for update in (mensagem(1, foto='f1'), mensagem(2, video=object(), legenda='legenda no vídeo')):
+        asyncio.run(bot.handle_new_post(update, contexto))
+    assert len(contexto.jobs) == 1
+    contexto.rodar_job()
+    assert contexto.enviadas == ["❌ Erro: O álbum tem 1 vídeo(s) ou arquivo(s); só álbuns de fotos podem ser salvos. "
+                                 "Nada foi adicionado."]
+
+
+def test_album_de_fotos_e_salvo_em_ordem(monkeypatch):
+    salvos = []
+
+    async def db_run(func, *args):
+        salvos.append(args)
+        return 1, []
+    monkeypatch.setattr(bot, 'db_run', db_run)
+    contexto = Contexto()
+    for update in (mensagem(2, foto='f2'), mensagem(1, foto='f1', legenda='oi')):
+        asyncio.run(bot.handle_new_post(update, contexto))
+    contexto.rodar_job()
+    assert salvos == [(['oi'], ['f1', 'f2'])]
+
+
+def test_video_solto_e_recusado():
+    update = mensagem(1, video=object(), legenda='oi', album=None)
+    asyncio.run(bot.handle_new_post(update, Contexto()))
+    assert update.message.respostas and 'apenas texto e fotos' in update.message.respostas[0]
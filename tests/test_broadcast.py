@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import bot
+
+_sleep = asyncio.sleep
+
+
+class BotFalso:
+    def __init__(self):
+        self.encaminhados = []
+
+    async def forward_message(self, chat_id, **kwargs):
+        self.encaminhados.append(chat_id)
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    """ Banco em memória para processar_broadcast: um lote de três destinatários e checkpoints que podem falhar. """
+    estado = {'lotes': [[1, 2, 3]], 'falhas_checkpoint': 0, 'chamadas': []}
+
+    async def db_fetchone(sql, params=None):
+        return 1, 1, 1, None, 3
+
+    async def db_run(func, *args):
+        estado['chamadas'].append(func.__name__)
+        if func is bot._reservar_lote:
+            return (estado['lotes'].pop(0), 1) if estado['lotes'] else ([], 0)
+        if func is bot._registrar_entregas and estado['falhas_checkpoint']:
+            estado['falhas_checkpoint'] -= 1
+            raise RuntimeError('conexão perdida')
+        if func is bot._abandonar_lote:
+            estado['abandonado'] = args[1]
+            return len(args[1])
+        return None
+
+    async def sleep(segundos, *args, **kwargs):
+        await _sleep(0, *args, **kwargs)
+    monkeypatch.setattr(bot, 'db_fetchone', db_fetchone)
+    monkeypatch.setattr(bot, 'db_run', db_run)
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    return estado
+
+
+def test_checkpoint_repete_falha_passageira(banco):
+    banco['falhas_checkpoint'] = bot.BROADCAST_CHECKPOINT_TENTATIVAS - 1
+    asyncio.run(bot.processar_broadcast(BotFalso(), 1))
+    assert banco['chamadas'].count('_registrar_entregas') == bot.BROADCAST_CHECKPOINT_TENTATIVAS
+    assert '_abandonar_lote' not in banco['chamadas'] and '_concluir_broadcast' in banco['chamadas']
+
+
+def test_checkpoint_que_nao_grava_deixa_o_lote_incerto(banco):
+    banco['falhas_checkpoint'] = bot.BROADCAST_CHECKPOINT_TENTATIVAS
+    bot_falso = BotFalso()
+    asyncio.run(bot.processar_broadcast(bot_falso, 1))
+    assert sorted(bot_falso.encaminhados) == [1, 2, 3]
+    assert banco['abandonado'] == [1, 2, 3]
+    assert 1 not in bot._broadcasts_ativos
@@ -0,0 +1,44 @@
+import bot
+
+I, F = bot.DESTAQUE_INICIO, bot.DESTAQUE_FIM
+
+
+def botoes(teclado):
+    return [(botao.text, botao.callback_data) for linha in teclado.inline_keyboard for botao in linha] if teclado else []
+
+
+def test_destaque_e_escape_do_markdown_v2():
+    texto, _ = bot.montar_pagina_busca('bônus_(vip)', 0, 1, [
+        (7, 0, f"Ganhe {I}bônus{F} de 100%! Acesse https://a.bet/x_y\n(só hoje)"),
+    ])
+    assert "_bônus\\_\\(vip\\)_" in texto
+    assert "*ID:* `7` — Ganhe *bônus* de 100%\\! Acesse https://a\\.bet/x\\_y \\(só hoje\\)" in texto
+    assert I not in texto and F not in texto
+
+
+def test_variante_que_nao_e_a_primeira_aparece_no_resultado():
+    texto, _ = bot.montar_pagina_busca('oi', 0, 1, [(3, 1, f"{I}oi{F}")])
+    assert "*ID:* `3` \\(versão B\\) — *oi*" in texto
+
+
+def test_paginacao():
+    resultados = [(i, 0, 'x') for i in range(bot.BUSCA_PAGINA)]
+    texto, teclado = bot.montar_pagina_busca('x', 0, 25, resultados)
+    assert "\\(página 1 de 3\\)" in texto
+    assert botoes(teclado) == [("Próxima ▶️", f"busca_{bot.BUSCA_PAGINA}")]
+
+    texto, teclado = bot.montar_pagina_busca('x', bot.BUSCA_PAGINA, 25, resultados)
+    assert "\\(página 2 de 3\\)" in texto
+    assert botoes(teclado) == [("◀️ Anterior", "busca_0"), ("Próxima ▶️", f"busca_{2 * bot.BUSCA_PAGINA}")]
+
+    texto, teclado = bot.montar_pagina_busca('x', 2 * bot.BUSCA_PAGINA, 25, resultados[:5])
+    assert "\\(página 3 de 3\\)" in texto
+    assert botoes(teclado) == [("◀️ Anterior", f"busca_{bot.BUSCA_PAGINA}")]
+
+
+def test_sem_resultados():
+    texto, teclado = bot.montar_pagina_busca('nada', 0, 0, [])
+    assert texto == "🔎 Nenhum post encontrado para _nada_\\." and teclado is None
+    # Página que esvaziou depois de remoções: botão de volta ao início
+    texto, teclado = bot.montar_pagina_busca('nada', 20, 0, [])
+    assert "Não há mais resultados" in texto and botoes(teclado) == [("⏮️ Início", "busca_0")]
@@ -0,0 +1,175 @@
+import asyncio
+
+import httpx
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import bot
+
+_sleep = asyncio.sleep
+
+
+def erro_com_causa(classe, causa, *args):
+    """ Erro do PTB como o HTTPXRequest levanta: com a exceção do httpx em __cause__. """
+    erro = classe(*args)
+    erro.__cause__ = causa
+    return erro
+
+
+def test_token_bucket_respeita_capacidade_e_taxa():
+    async def cenario():
+        loop = asyncio.get_running_loop()
+        bucket = bot.TokenBucket(taxa=50, capacidade=2)
+        inicio = loop.time()
+        for _ in range(2):
+            await bucket.adquirir()
+        rajada = loop.time() - inicio
+        for _ in range(3):
+            await bucket.adquirir()
+        return rajada, loop.time() - inicio
+    rajada, total = asyncio.run(cenario())
+    assert rajada < 0.01
+    # 3 fichas além da capacidade, a 50 por segundo
+    assert 0.05 <= total < 0.2
+
+
+def test_token_bucket_pausado_espera_e_volta_sem_fichas():
+    async def cenario():
+        loop = asyncio.get_running_loop()
+        bucket = bot.TokenBucket(taxa=1000, capacidade=5)
+        bucket.pausar(0.1)
+        inicio = loop.time()
+        await bucket.adquirir()
+        return loop.time() - inicio
+    assert 0.1 <= asyncio.run(cenario()) < 0.3
+
+
+def test_token_bucket_pedido_maior_que_a_capacidade_leva_o_balde_cheio():
+    async def cenario():
+        bucket = bot.TokenBucket(taxa=1, capacidade=3)
+        await asyncio.wait_for(bucket.adquirir(10), timeout=0.5)
+    asyncio.run(cenario())
+
+
+@pytest.mark.parametrize('erro, classe', [
+    (Forbidden('bot was blocked by the user'), 'bloqueado'),
+    (BadRequest('chat not found'), 'invalido'),
+    (RetryAfter(5), 'flood'),
+    (erro_com_causa(TimedOut, httpx.ReadTimeout('lento')), 'incerto'),
+    (erro_com_causa(TimedOut, httpx.PoolTimeout('pool')), 'rede'),
+    (erro_com_causa(NetworkError, httpx.ConnectError('recusada'), 'httpx.ConnectError'), 'rede'),
+    (ValueError('x'), 'outro'),
+])
+def test_classificar_erro_envio(erro, classe):
+    assert bot.classificar_erro_envio(erro) == classe
+
+
+def test_limite_do_chat_privado_e_dos_grupos():
+    async def cenario():
+        assert bot.limite_do_chat(-100) is bot.limite_do_grupo(-100)
+        limite = bot.limite_do_chat(5)
+        assert limite is bot.limite_do_chat(5) and limite.taxa == bot.CHAT_MSGS_POR_SEGUNDO
+        agora = asyncio.get_running_loop().time()
+        assert limite.cheio(agora)
+        await limite.adquirir()
+        assert not limite.cheio(asyncio.get_running_loop().time())
+    asyncio.run(cenario())
+
+
+def test_limites_de_chats_cheios_sao_descartados(monkeypatch):
+    monkeypatch.setattr(bot, '_limites_chats', {})
+    monkeypatch.setattr(bot, 'LIMITES_CHATS_MAX', 3)
+
+    async def cenario():
+        for chat_id in (1, 2, 3):
+            bot.limite_do_chat(chat_id)
+        await bot.limite_do_chat(1).adquirir(3)
+        bot.limite_do_chat(4)
+        return sorted(bot._limites_chats)
+    # Só o chat 1, ainda sem fichas, continua guardado
+    assert asyncio.run(cenario()) == [1, 4]
+
+
+def test_segundos_retry_after():
+    assert bot.segundos_retry_after(RetryAfter(7)) == 7.0
+
+
+@pytest.fixture
+def fila(monkeypatch):
+    """ FilaEnvios sem banco (envios_falhos vai para uma lista) e com esperas de rede encurtadas. """
+    registrados = []
+
+    async def db_run(func, *args):
+        registrados.append(args)
+
+    async def sleep(segundos, *args, **kwargs):
+        await _sleep(min(segundos, 0.01), *args, **kwargs)
+    monkeypatch.setattr(bot, 'db_run', db_run)
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    monkeypatch.setattr(bot, '_limites_grupos', {})
+    monkeypatch.setattr(bot, '_limites_chats', {})
+
+    def executar(erros, endpoint='sendMessage', chat_id=10, rate_limit_args=None):
+        """ Roda um envio cujo callback levanta os erros em sequência; retorna (resultado ou erro, chamadas). """
+        chamadas = []
+
+        async def callback():
+            chamadas.append(1)
+            if len(chamadas) <= len(erros):
+                raise erros[len(chamadas) - 1]
+            return 'ok'
+
+        async def cenario():
+            fila = bot.FilaEnvios(taxa=1000, max_tentativas=3)
+            await fila.initialize()
+            try:
+                return await fila.process_request(callback, (), {}, endpoint, {'chat_id': chat_id}, rate_limit_args)
+            except Exception as e:
+                return e
+            finally:
+                await fila.shutdown()
+        return asyncio.run(cenario()), len(chamadas)
+    executar.registrados = registrados
+    return executar
+
+
+def test_timeout_depois_do_envio_nao_repete(fila):
+    erro = erro_com_causa(TimedOut, httpx.ReadTimeout('lento'))
+    assert fila([erro]) == (erro, 1)
+
+
+def test_erro_antes_do_envio_repete(fila):
+    erros = [erro_com_causa(NetworkError, httpx.ConnectError('recusada'), 'x'),
+             erro_com_causa(TimedOut, httpx.PoolTimeout('pool'))]
+    assert fila(erros) == ('ok', 3)
+
+
+def test_edicao_repete_qualquer_erro_de_rede(fila):
+    erros = [erro_com_causa(NetworkError, httpx.ReadError('caiu'), 'x')] * 3
+    resultado, chamadas = fila(erros, endpoint='editMessageText')
+    assert resultado is erros[0] and chamadas == 3
+    # Esgotou as tentativas: vai para envios_falhos
+    assert fila.registrados and fila.registrados[0][0] == 'editMessageText'
+
+
+def test_bad_request_nao_repete(fila):
+    erro = BadRequest('message is too long')
+    assert fila([erro]) == (erro, 1)
+
+
+def test_retry_after_repete_depois_da_pausa(fila):
+    assert fila([RetryAfter(0)]) == ('ok', 2)
+
+
+def test_post_agendado_nao_repete_e_pausa_o_grupo(fila):
+    erro = RetryAfter(30)
+    resultado, chamadas = fila([erro], chat_id=-100, rate_limit_args={'prioridade': 'postagem', 'fichas': 0, 'repetir': False})
+    assert (resultado, chamadas) == (erro, 1)
+    assert bot._limites_grupos[-100]._tokens == 0.0 and bot._limites_grupos[-100]._pausado_ate > 0
+    # Quem chamou cuida do dead letter quando desiste
+    assert fila.registrados == []
+
+
+def test_metodos_que_nao_sao_envio_passam_direto(fila):
+    erro = erro_com_causa(TimedOut, httpx.ConnectTimeout('x'))
+    assert fila([erro], endpoint='getChat') == (erro, 1)
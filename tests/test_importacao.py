@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import bot
+
+
+def ler_csv(texto):
+    return bot._ler_importacao(texto.encode(), 'csv')
+
+
+def ler_jsonl(*registros):
+    return bot._ler_importacao("\n".join(json.dumps(r, ensure_ascii=False) for r in registros).encode(), 'jsonl')
+
+
+def test_csv_valido_com_variantes_pesos_e_album():
+    posts, erros = ler_csv("texto_a,peso_a,texto_b,peso_b,selecao,midia_ids\n"
+                           "Olá https://Site.com/promo/,3,Oi,,sorteio,foto1 foto2\n"
+                           "Só A,,,,,\n")
+    assert erros == []
+    variantes, selecao, midia_ids, links, impressoes = posts[0]
+    assert variantes == [(0, 'Olá https://Site.com/promo/', 3), (1, 'Oi', 1)]
+    assert (selecao, midia_ids, links) == ('sorteio', ['foto1', 'foto2'], ['https://site.com/promo'])
+    assert [ordem for ordem, *_ in impressoes] == [0, 1]
+    assert posts[1][0] == [(0, 'Só A', 1)] and posts[1][1] == 'alternada'
+
+
+def test_csv_texto_com_quebra_de_linha_conta_a_linha_onde_o_registro_comeca():
+    _, erros = ler_csv('texto_a,selecao\n"linha 1\nlinha 2",alternada\nok,outra\n')
+    assert erros == ["linha 4: selecao deve ser alternada ou sorteio"]
+
+
+def test_csv_sem_coluna_texto_a():
+    assert ler_csv("texto_b\nx\n") == ([], ["o cabeçalho do CSV precisa da coluna texto_a"])
+
+
+@pytest.mark.parametrize('linha, erro', [
+    (",B,", "texto_a vazio antes de texto_b"),
+    ("A,,C", "texto_b vazio antes de texto_c"),
+    (",,", "post sem texto (texto_a vazio)"),
+    ("  ,,", "variante A sem texto"),
+])
+def test_csv_rejeita_lacunas_nas_variantes(linha, erro):
+    posts, erros = ler_csv(f"texto_a,texto_b,texto_c\n{linha}\n")
+    assert posts == [] and erros == [f"linha 2: {erro}"]
+
+
+def test_csv_celulas_vazias_no_fim_sao_variantes_ausentes():
+    posts, erros = ler_csv("texto_a,texto_b,texto_c\nA,B,\n")
+    assert erros == [] and [ordem for ordem, *_ in posts[0][0]] == [0, 1]
+
+
+@pytest.mark.parametrize('registro, erro', [
+    ({'variantes': 'texto'}, "variantes deve ser uma lista"),
+    ({'variantes': [1]}, "cada variante deve ser um texto ou um objeto com texto e peso"),
+    ({'variantes': ['ok', {'texto': ' '}]}, "variante B sem texto"),
+    ({'variantes': [{'texto': 'ok', 'peso': 0}]}, "peso inválido na variante A"),
+    ({'variantes': [{'texto': 'ok', 'peso': 'x'}]}, "peso inválido na variante A"),
+    ({'variantes': []}, "post sem texto (texto_a vazio)"),
+    ({'variantes': ['v'] * 11}, "mais de 10 variantes"),
+    ({'texto_a': 'ok', 'selecao': 'aleatoria'}, "selecao deve ser alternada ou sorteio"),
+    ({'texto_a': 'ok', 'midia_ids': [1]}, "midia_ids deve ser uma lista de file_ids"),
+    ({'texto_a': 'ok', 'midia_ids': ['f'] * 11}, "um álbum tem no máximo 10 fotos"),
+    ({'texto_a': 'x' * 1025, 'midia_ids': ['f']}, "texto acima de 1024 caracteres"),
+    ({'texto_a': 'x' * 4097}, "texto acima de 4096 caracteres"),
+    ({'texto_a': 'veja https://localhost/promo'}, "link inválido: https://localhost/promo"),
+])
+def test_jsonl_erros_de_validacao(registro, erro):
+    posts, erros = ler_jsonl({'texto_a': 'primeira linha válida'}, registro)
+    assert len(posts) == 1 and erros == [f"linha 2: {erro}"]
+
+
+def test_jsonl_linha_que_nao_e_objeto():
+    _, erros = bot._ler_importacao(b'{"texto_a": "ok"}\n\n[1, 2]\n', 'jsonl')
+    assert erros == ["linha 3: cada linha deve ser um objeto JSON"]
+
+
+def test_jsonl_lista_de_variantes_com_pesos():
+    posts, erros = ler_jsonl({'variantes': ['A', {'texto': 'B', 'peso': 2}], 'midia_ids': 'f1 f2'})
+    assert erros == []
+    assert posts[0][0] == [(0, 'A', 1), (1, 'B', 2)] and posts[0][2] == ['f1', 'f2']
+
+
+def test_json_com_lista_de_objetos():
+    dados = json.dumps([{'texto_a': 'A'}, {'variantes': ['B', 'C'], 'selecao': 'sorteio'}], indent=2).encode()
+    posts, erros = bot._ler_importacao(dados, 'json')
+    assert erros == [] and [post[0] for post in posts] == [[(0, 'A', 1)], [(0, 'B', 1), (1, 'C', 1)]]
+
+
+def test_json_erros_apontam_o_item():
+    posts, erros = bot._ler_importacao(b'[{"texto_a": "ok"}, 3, {"texto_a": "x", "selecao": "nao"}]', 'json')
+    assert len(posts) == 1
+    assert erros == ["item 2: cada item deve ser um objeto JSON", "item 3: selecao deve ser alternada ou sorteio"]
+
+
+def test_json_invalido():
+    posts, erros = bot._ler_importacao(b'[{"texto_a": "ok"},', 'json')
+    assert posts == [] and len(erros) == 1 and erros[0].startswith("JSON inválido")
+
+
+def test_json_com_um_objeto_por_linha_e_lido_como_jsonl():
+    posts, erros = bot._ler_importacao(b'{"texto_a": "A"}\n{"texto_a": "B"}\n', 'json')
+    assert erros == [] and len(posts) == 2
@@ -0,0 +1,84 @@
+import bot
+
+BASE = ("🔥 Nova casa sortebet pagando BÔNUS de {b}% no primeiro depósito! "
+        "Cadastre-se já 🏠https://sortebet.bet/promo Rollover 10x, saque mínimo de R$ 20.")
+
+
+def bandas_em_comum(a, b):
+    return len(set(a[2]) & set(b[2]))
+
+
+def test_normalizar_texto():
+    assert bot.normalizar_texto("  Bônus_de 100%!!\n🔥 AÇÃO  ") == "bonus de 100 acao"
+    assert bot.normalizar_texto("🔥🔥 !!") == ""
+
+
+def test_impressao_digital_formato():
+    hash_texto, assinatura, bandas = bot.impressao_digital(BASE.format(b=100))
+    assert -2 ** 63 <= hash_texto < 2 ** 63
+    assert len(assinatura) == bot.MINHASH_TAMANHO and all(0 <= valor < 2 ** 31 for valor in assinatura)
+    assert len(bandas) == bot.MINHASH_BANDAS
+    # O número da banda vai nos bits altos: valores iguais em bandas diferentes não colidem
+    assert [banda >> 32 for banda in bandas] == list(range(bot.MINHASH_BANDAS))
+    assert bot.impressao_digital("🔥 !!") is None
+
+
+def test_textos_iguais_depois_de_normalizados():
+    a = bot.impressao_digital(BASE.format(b=100))
+    b = bot.impressao_digital(BASE.format(b=100).upper().replace('Ô', 'O'))
+    assert a == b
+
+
+def test_texto_parecido_vira_candidato_e_passa_do_limiar():
+    a = bot.impressao_digital(BASE.format(b=100))
+    b = bot.impressao_digital(BASE.format(b=150))
+    assert a[0] != b[0]
+    assert bandas_em_comum(a, b) > 0
+    assert bot.similaridade(a[1], b[1]) >= bot.DUPLICADOS_LIMIAR
+
+
+def test_texto_diferente_fica_abaixo_do_limiar():
+    a = bot.impressao_digital(BASE.format(b=100))
+    b = bot.impressao_digital("Hoje tem jogo do Brasil às 16h, acompanhe as odds ao vivo no nosso canal.")
+    assert bot.similaridade(a[1], b[1]) < 0.3
+    assert bandas_em_comum(a, b) == 0
+
+
+def test_texto_curto_preenche_todas_as_posicoes():
+    _, assinatura, _ = bot.impressao_digital("oi")
+    _, outra, _ = bot.impressao_digital("ola")
+    assert len(assinatura) == bot.MINHASH_TAMANHO
+    assert bot.similaridade(assinatura, assinatura) == 1.0
+    assert bot.similaridade(assinatura, outra) < 1.0
+
+
+def test_links_compativeis():
+    assert bot.links_compativeis([], ['https://a.bet'])
+    assert bot.links_compativeis(['https://a.bet', 'https://b.bet'], ['https://b.bet'])
+    assert not bot.links_compativeis(['https://a.bet'], ['https://b.bet'])
+
+
+def test_aviso_parecidos():
+    assert bot.aviso_parecidos([]) == ""
+    aviso = bot.aviso_parecidos([(i, 0.9) for i in range(1, 8)])
+    assert "1 (90%), 2 (90%), 3 (90%), 4 (90%), 5 (90%) e mais 2" in aviso
+
+
+class CursorFalso:
+    """ Devolve, em ordem, o resultado de cada consulta de _grupos_duplicados. """
+    def __init__(self, *resultados):
+        self.resultados = list(resultados)
+
+    def execute(self, sql, params=None):
+        self.atual = self.resultados.pop(0)
+
+    def fetchall(self):
+        return self.atual
+
+
+def test_grupos_duplicados_compara_todos_os_pares_do_balde():
+    proprio = list(range(bot.MINHASH_TAMANHO))
+    outro = [valor + 1000 for valor in proprio]
+    # O post 1 divide uma banda com 2 e 3 mas não se parece com eles; 2 e 3 são iguais
+    cursor = CursorFalso([([1, 2, 3],)], [(1, 10, outro), (2, 20, proprio), (3, 30, proprio)], [])
+    assert bot._grupos_duplicados(cursor) == [[2, 3]]
@@ -0,0 +1,18 @@
+import asyncio
+
+import bot
+
+
+def test_downloads_tem_um_unico_rotulo_nas_metricas(monkeypatch):
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        return 200, b'{}'
+    monkeypatch.setattr(bot.HTTPXRequest, 'do_request', do_request)
+    monkeypatch.setattr(bot.METRICA_API_TOTAL, 'valores', {})
+    request = bot.RequestMedido()
+
+    async def cenario():
+        await request.do_request('https://api.telegram.org/bot0:x/sendMessage', 'POST')
+        for arquivo in ('file_1.csv', 'file_2.jsonl'):
+            await request.do_request(f'https://api.telegram.org/file/bot0:x/documents/{arquivo}', 'GET')
+    asyncio.run(cenario())
+    assert bot.METRICA_API_TOTAL.valores == {('sendMessage', '200'): 1, ('download', '200'): 2}
@@ -0,0 +1,31 @@
+import random
+from collections import Counter
+
+import bot
+
+VARIANTES = [(0, 'A', 3), (1, 'B', 1)]
+
+
+def test_letra_variante():
+    assert [bot.letra_variante(ordem) for ordem in (0, 1, 25)] == ['A', 'B', 'Z']
+
+
+def test_alternada_segue_os_pesos_em_rodizio():
+    escolhidas = [bot.escolher_variante(VARIANTES, vez, 'alternada')[1] for vez in range(8)]
+    assert escolhidas == ['A', 'A', 'A', 'B'] * 2
+
+
+def test_alternada_com_lacuna_nas_ordens():
+    variantes = [(0, 'A', 1), (2, 'C', 2)]
+    assert [bot.escolher_variante(variantes, vez, 'alternada')[0] for vez in range(3)] == [0, 2, 2]
+
+
+def test_variante_unica():
+    assert {bot.escolher_variante([(0, 'A', 5)], vez, selecao) for vez in range(3)
+            for selecao in ('alternada', 'sorteio')} == {(0, 'A', 5)}
+
+
+def test_sorteio_respeita_os_pesos():
+    random.seed(1)
+    contagem = Counter(bot.escolher_variante(VARIANTES, 0, 'sorteio')[1] for _ in range(4000))
+    assert 2.6 < contagem['A'] / contagem['B'] < 3.4
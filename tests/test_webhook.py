@@ -0,0 +1,19 @@
+import bot
+
+
+def test_parametros_webhook(monkeypatch):
+    monkeypatch.setattr(bot, 'WEBHOOK_URL', 'https://bot.exemplo.com')
+    monkeypatch.setattr(bot, 'WEBHOOK_CAMINHO', 'tg/hook')
+    monkeypatch.setattr(bot, 'WEBHOOK_SECRET', 'segredo')
+    monkeypatch.setattr(bot, 'WEBHOOK_HOST', '127.0.0.1')
+    monkeypatch.setattr(bot, 'WEBHOOK_PORTA', 8080)
+    monkeypatch.setattr(bot, 'ALLOWED_UPDATES', ['message'])
+    assert bot.parametros_webhook() == {
+        'listen': '127.0.0.1',
+        'port': 8080,
+        'url_path': 'tg/hook',
+        'webhook_url': 'https://bot.exemplo.com/tg/hook',
+        'secret_token': 'segredo',
+        'allowed_updates': ['message'],
+    }
+